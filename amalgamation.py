@@ -77,7 +77,29 @@ def check_file_list(file_list):
     return file_list
 
 
-def amalgamate_file(file_list, output_file, license_txt=LICENSE_TXT, additional_txt=None):
+EXTERN_C_BEGIN = '#ifdef __cplusplus\nextern "C" {\n#endif\n'
+EXTERN_C_END = '#ifdef __cplusplus\n}\n#endif\n'
+
+
+ALLOCATION_REGEX = re.compile(r'\b(malloc|calloc|realloc|free|posix_memalign)(\s*\()')
+ALIGNED_ALLOCATION_REGEX = re.compile(r'\b(?:_|__mingw_)aligned_(malloc|free)(\s*\()')  # Windows, see roaring.h
+ALLOCATOR_INCLUDE = '#include "allocator.h"'
+
+
+def with_allocator(line):
+    """Route the allocations of CRoaring through the functions of allocator.h (see pyroaring/allocator.c)."""
+    line = ALIGNED_ALLOCATION_REGEX.sub(r'pyroaring_aligned_\1\2', line)
+    return ALLOCATION_REGEX.sub(r'pyroaring_\1\2', line)
+
+
+def with_c_linkage(line):
+    """Put system includes outside of the extern "C" block opened by EXTERN_C_BEGIN."""
+    if re.match('\s*#\s*include\s*<', line):
+        return EXTERN_C_END + line + EXTERN_C_BEGIN
+    return line
+
+
+def amalgamate_file(file_list, output_file, license_txt=LICENSE_TXT, additional_txt=None, c_linkage=False):
     regex_1 = '#include\s*"[a-zA-Z_/]+.h"\s*\n'
     regex_2 = '#include\s*<roaring/[a-zA-Z_/]+.h>\s*\n'
     regex = re.compile('(%s)|(%s)' % (regex_1, regex_2))
@@ -88,6 +110,10 @@ def amalgamate_file(file_list, output_file, license_txt=LICENSE_TXT, additional_
             output_f.write('/*\n%s\n*/\n\n' % license_txt)
         if additional_txt:
             output_f.write('%s\n\n' % additional_txt)
+        # The container headers have no extern "C" guards of their own, they are needed for the C++ extension
+        # to link against the container functions compiled in the C file.
+        if c_linkage:
+            output_f.write(EXTERN_C_BEGIN)
         for input_file in file_list:
             output_f.write('/* Begin file %s */\n' % input_file)
             with open(input_file, 'r') as input_f:
@@ -95,8 +121,14 @@ def amalgamate_file(file_list, output_file, license_txt=LICENSE_TXT, additional_
                     match = regex.match(line)
                     if match:
                         line = ''
+                    else:
+                        line = with_allocator(line)
+                        if c_linkage:
+                            line = with_c_linkage(line)
                     output_f.write(line)
             output_f.write('/* End file %s */\n' % input_file)
+        if c_linkage:
+            output_f.write(EXTERN_C_END)
 
 
 def amalgamate(target_dir):
@@ -106,4 +138,4 @@ def amalgamate(target_dir):
     target_include = os.path.join(target_dir, INCLUDE_FILE)
     amalgamate_file(src_files, target_src,
                     additional_txt='#include "%s"' % INCLUDE_FILE)
-    amalgamate_file(include_files, target_include)
+    amalgamate_file(include_files, target_include, additional_txt=ALLOCATOR_INCLUDE, c_linkage=True)
@@ -1,11 +1,22 @@
 cimport croaring
-from libc.stdint cimport uint32_t, uint64_t, int64_t
+from libc.stdint cimport uint8_t, uint16_t, int32_t, uint32_t, uint64_t, int64_t
 from libcpp cimport bool
 from libcpp.vector cimport vector
-from libc.stdlib cimport free, malloc
+from libc.string cimport memcpy, memset
+from cpython.bytes cimport PyBytes_FromStringAndSize, PyBytes_AS_STRING
+from cpython.buffer cimport PyObject_GetBuffer, PyBuffer_Release, PyBUF_SIMPLE, PyObject_CheckBuffer
 
 from cpython cimport array
 import array
+import random
+import sys
+from libc.math cimport log1p, floor
+
+try:
+    array.array('Q')
+    uint64_typecode = 'Q'
+except ValueError: # Python 2
+    uint64_typecode = 'L'
 
 try:
     range = xrange
@@ -17,12 +28,155 @@ cdef croaring.roaring_bitmap_t *deserialize_ptr(char *buff):
     ptr = croaring.roaring_bitmap_portable_deserialize(buff)
     return ptr
 
+cdef AbstractBitMap with_copy_on_write(AbstractBitMap bitmap, bool copy_on_write):
+    """
+    Return the bitmap if it has the given copy on write setting, else a copy of it with this setting. The containers of
+    the copy are cloned, since a container shared with a copy on write bitmap must not be modified in place.
+    """
+    if bitmap._c_bitmap.copy_on_write == copy_on_write:
+        return bitmap
+    cdef const croaring.roaring_array_t *ra = &bitmap._c_bitmap.high_low_container
+    cdef croaring.roaring_bitmap_t *result = croaring.roaring_bitmap_create_with_capacity(ra.size)
+    cdef const void *container
+    cdef void *clone
+    cdef uint8_t typecode
+    cdef int32_t i
+    if result is NULL:
+        raise MemoryError()
+    result.copy_on_write = copy_on_write
+    for i in range(ra.size):
+        typecode = ra.typecodes[i]
+        container = croaring.container_unwrap_shared(ra.containers[i], &typecode)
+        clone = croaring.container_clone(container, typecode)
+        if clone is NULL:
+            croaring.roaring_bitmap_free(result)
+            raise MemoryError()
+        croaring.ra_append(&result.high_low_container, ra.keys[i], clone, typecode)
+    return bitmap.from_ptr(result)
+
+def import_pyarrow():
+    """Return the pyarrow module, which is an optional dependency."""
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('The Arrow conversions require pyarrow, it can be installed with "pip install pyarrow".')
+    return pyarrow
+
+cdef class _ReadBuffer:
+    """Read-only access to the raw bytes of an object supporting the buffer protocol."""
+    cdef Py_buffer view
+    cdef const uint8_t *data
+    cdef Py_ssize_t size
+    cdef Py_ssize_t itemsize
+    cdef bool acquired
+
+    def __cinit__(self, obj):
+        PyObject_GetBuffer(obj, &self.view, PyBUF_SIMPLE)
+        self.acquired = True
+        self.data = <const uint8_t*>self.view.buf
+        self.size = self.view.len
+        self.itemsize = self.view.itemsize
+
+    def __dealloc__(self):
+        if self.acquired:
+            PyBuffer_Release(&self.view)
+
+cdef const uint32_t[::1] uint32_view(values):
+    """
+    Return the values as a contiguous view of 32 bits integers, without copying them if they are already stored as such.
+    """
+    cdef const uint32_t[::1] view
+    if PyObject_CheckBuffer(values):
+        try:
+            view = values
+            return view
+        except (ValueError, BufferError): # not a contiguous buffer of 32 bits unsigned integers, copied below
+            pass
+    if not is_values(values):
+        raise TypeError('Expected a bitmap or an iterable of integers, got %s.' % type(values).__name__)
+    return array.array('I', iter(values))
+
+cdef bool is_values(values):
+    """Return True if and only if the object can be an operand of the set operations: a bitmap or an iterable."""
+    if isinstance(values, AbstractBitMap) or isinstance(values, range) or PyObject_CheckBuffer(values):
+        return True
+    try:
+        iter(values)
+    except TypeError:
+        return False
+    return True
+
+cdef croaring.roaring_bitmap_t *and_values(const croaring.roaring_bitmap_t *bitmap, const uint32_t[::1] values):
+    """Return a new bitmap with the values that are in the bitmap, found by probing it."""
+    cdef vector[uint32_t] found
+    cdef Py_ssize_t i
+    cdef croaring.roaring_bitmap_t *result = croaring.roaring_bitmap_create()
+    for i in range(values.shape[0]):
+        if croaring.roaring_bitmap_contains(bitmap, values[i]):
+            found.push_back(values[i])
+    if found.size() > 0:
+        croaring.roaring_bitmap_add_many(result, found.size(), &found[0])
+    result.copy_on_write = bitmap.copy_on_write
+    return result
+
+cdef void or_values(croaring.roaring_bitmap_t *bitmap, const uint32_t[::1] values):
+    """Add the values to the bitmap."""
+    if values.shape[0] > 0:
+        croaring.roaring_bitmap_add_many(bitmap, values.shape[0], &values[0])
+
+cdef void andnot_values(croaring.roaring_bitmap_t *bitmap, const uint32_t[::1] values):
+    """Remove the values from the bitmap."""
+    cdef Py_ssize_t i
+    for i in range(values.shape[0]):
+        croaring.roaring_bitmap_remove(bitmap, values[i])
+
+cdef bool intersect_values(const croaring.roaring_bitmap_t *bitmap, const uint32_t[::1] values):
+    """Return True if and only if one of the values is in the bitmap."""
+    cdef Py_ssize_t i
+    for i in range(values.shape[0]):
+        if croaring.roaring_bitmap_contains(bitmap, values[i]):
+            return True
+    return False
+
+cdef void write_bool_mask_word(uint64_t position, uint64_t word, uint64_t length, char *out):
+    """Set to 1 the bytes position+i of out (below length) for all the bits i set in the word."""
+    cdef uint64_t index
+    while word != 0:
+        index = position + croaring.__builtin_ctzll(word)
+        if index >= length:
+            break
+        out[index] = 1
+        word &= word - 1
+
+cdef void write_packed_bits_word(uint64_t position, uint64_t word, uint64_t length, char *out):
+    """Copy the word in the bits position to position+63 of out (below length), position being a multiple of 64."""
+    cdef uint64_t index = position >> 3
+    cdef uint64_t k
+    cdef uint8_t byte
+    for k in range(8):
+        if (index + k) * 8 >= length:
+            break
+        byte = (word >> (8 * k)) & 0xFF
+        if (index + k + 1) * 8 > length:
+            byte &= (1 << (length - (index + k) * 8)) - 1
+        out[index + k] = byte
+
 cdef class AbstractBitMap:
     """
     An efficient and light-weight ordered set of 32 bits integers.
+
+    The operators |, &, -, ^ (and their in-place versions) and the order comparisons also accept iterables of
+    integers, for instance buffers of 32 bits unsigned integers such as array.array('I'). No temporary bitmap is
+    built for the intersection and the difference with such values: they are probed and removed one by one.
+
+    >>> BitMap([3, 12, 18]) & array.array('I', [12, 15, 18])
+    BitMap([12, 18])
+    >>> [5, 18] | BitMap([3, 12])
+    BitMap([3, 5, 12, 18])
+    >>> BitMap([3, 12]) <= range(20)
+    True
     """
-    cdef croaring.roaring_bitmap_t* _c_bitmap
-    cdef int64_t _h_val
+    # The attributes and the C methods are declared in pyroaring.pxd.
 
     def __cinit__(self, values=None, copy_on_write=False, optimize=True, no_init=False):
         if no_init:
@@ -33,8 +187,11 @@ cdef class AbstractBitMap:
         if values is None:
             self._c_bitmap = croaring.roaring_bitmap_create()
         elif isinstance(values, AbstractBitMap):
+            if memory_limit != 0:
+                check_memory(bitmap_memory_size((<AbstractBitMap?>values)._c_bitmap))
             self._c_bitmap = croaring.roaring_bitmap_copy((<AbstractBitMap?>values)._c_bitmap)
-            self._h_val = (<AbstractBitMap?>values)._h_val
+            if isinstance(self, FrozenBitMap) and isinstance(values, FrozenBitMap): # a BitMap may have changed since
+                self._h_val = (<AbstractBitMap?>values)._h_val
         elif isinstance(values, range):
             _, (start, stop, step) = values.__reduce__()
             if step < 0:
@@ -120,15 +277,24 @@ cdef class AbstractBitMap:
         return not croaring.roaring_bitmap_is_empty(self._c_bitmap)
 
     def __len__(self):
-        return croaring.roaring_bitmap_get_cardinality(self._c_bitmap)
+        return self._cardinality()
 
     def __richcmp__(self, other, int op):
+        if not isinstance(other, AbstractBitMap):
+            if op == 2 or op == 3 or not is_values(other): # only bitmaps are equal to bitmaps
+                return NotImplemented
+            other = (<AbstractBitMap?>self).values_bitmap(other)
         self.__check_compatibility(other)
         if op == 0: # <
             return croaring.roaring_bitmap_is_strict_subset((<AbstractBitMap?>self)._c_bitmap, (<AbstractBitMap?>other)._c_bitmap)
         elif op == 1: # <=
             return croaring.roaring_bitmap_is_subset((<AbstractBitMap?>self)._c_bitmap, (<AbstractBitMap?>other)._c_bitmap)
         elif op == 2: # ==
+            if (<AbstractBitMap?>self)._h_val != 0 and (<AbstractBitMap?>other)._h_val != 0 and \
+                    (<AbstractBitMap?>self)._h_val != (<AbstractBitMap?>other)._h_val: # hashes are only cached on frozen bitmaps
+                return False
+            if (<AbstractBitMap?>self)._cardinality() != (<AbstractBitMap?>other)._cardinality():
+                return False
             return croaring.roaring_bitmap_equals((<AbstractBitMap?>self)._c_bitmap, (<AbstractBitMap?>other)._c_bitmap)
         elif op == 3: # !=
             return not (self == other)
@@ -139,26 +305,15 @@ cdef class AbstractBitMap:
             return croaring.roaring_bitmap_is_subset((<AbstractBitMap?>other)._c_bitmap, (<AbstractBitMap?>self)._c_bitmap)
 
     cdef compute_hash(self):
-        cdef int64_t h_val = 0
-        cdef uint32_t i, count, max_count=256
-        cdef croaring.roaring_uint32_iterator_t *iterator = croaring.roaring_create_iterator(self._c_bitmap)
-        cdef uint32_t *buff = <uint32_t*>malloc(max_count*4)
-        while True:
-            count = croaring.roaring_read_uint32_iterator(iterator, buff, max_count)
-            i = 0
-            while i < count:
-                h_val = ((h_val << 2) + buff[i])
-                # TODO find a good hash formula
-                # This one should be better, but is too long:
-                # h_val = ((h_val<<16) + buff[i]) % 1748104473534059
-                i += 1
-            if count != max_count:
-                break
-        croaring.roaring_free_uint32_iterator(iterator)
-        free(buff)
-        if not self:
-            return -1
-        return h_val
+        cdef const croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef uint64_t h_val = 0
+        cdef int32_t i
+        for i in range(ra.size):
+            h_val = container_hash(ra.containers[i], ra.typecodes[i], ra.keys[i], h_val)
+        h_val = hash_mix(h_val ^ croaring.roaring_bitmap_get_cardinality(self._c_bitmap))
+        if <int64_t>h_val == 0 or <int64_t>h_val == -1: # 0 means "not computed" and -1 is not a valid hash
+            h_val = 1
+        return <int64_t>h_val
 
     def __hash__(self):
         if self._h_val == 0: 
@@ -174,6 +329,9 @@ cdef class AbstractBitMap:
         finally:
             croaring.roaring_free_uint32_iterator(iterator)
 
+    def __reversed__(self):
+        return Cursor(self, reverse=True)
+
     def __repr__(self):
         return str(self)
 
@@ -202,17 +360,29 @@ cdef class AbstractBitMap:
         BitMap([0, 3, 5, 10, 12])
         """
         size = len(bitmaps)
-        cdef croaring.roaring_bitmap_t *result
         cdef AbstractBitMap bm
         cdef vector[const croaring.roaring_bitmap_t*] buff
+        cdef operation_start start
+        cdef uint64_t input_cardinality = 0, n_bytes = 0
+        cdef bint profile = profiling_enabled # read once, the profiling may be toggled during the operation
         if size <= 1:
             return cls(*bitmaps)
         else:
+            if profile:
+                start = start_operation()
             for bm in bitmaps:
                 bitmaps[0].__check_compatibility(bm)
                 buff.push_back(bm._c_bitmap)
-            result = croaring.roaring_bitmap_or_many(size, &buff[0])
-            return (<AbstractBitMap>cls()).from_ptr(result) # FIXME to change when from_ptr is a classmethod
+                if profile:
+                    input_cardinality += croaring.roaring_bitmap_get_cardinality(bm._c_bitmap)
+                if memory_limit != 0:
+                    n_bytes += bitmap_memory_size(bm._c_bitmap)
+            if memory_limit != 0:
+                check_memory(n_bytes)
+            result = (<AbstractBitMap>cls()).from_ptr(croaring.roaring_bitmap_or_many(size, &buff[0])) # FIXME to change when from_ptr is a classmethod
+            if profile:
+                record_bitmap_operation('union', start, input_cardinality, (<AbstractBitMap>result)._c_bitmap)
+            return result
 
     @classmethod
     def intersection(cls, *bitmaps): # FIXME could be more efficient
@@ -224,47 +394,134 @@ cdef class AbstractBitMap:
         """
         size = len(bitmaps)
         cdef AbstractBitMap result, bm
+        cdef operation_start start
+        cdef uint64_t input_cardinality = 0
+        cdef bint profile = profiling_enabled
         if size <= 1:
             return cls(*bitmaps)
         else:
+            if profile:
+                start = start_operation()
+                for bm in bitmaps:
+                    input_cardinality += croaring.roaring_bitmap_get_cardinality(bm._c_bitmap)
             result = BitMap(bitmaps[0])
             for bm in bitmaps[1:]:
                 result &= bm
+            if profile:
+                record_bitmap_operation('intersection', start, input_cardinality, result._c_bitmap)
             return cls(result)
 
-    cdef binary_op(self, AbstractBitMap other, (croaring.roaring_bitmap_t*)func(const croaring.roaring_bitmap_t*, const croaring.roaring_bitmap_t*)):
+    cdef binary_op(self, AbstractBitMap other, (croaring.roaring_bitmap_t*)func(const croaring.roaring_bitmap_t*, const croaring.roaring_bitmap_t*) nogil):
         self.__check_compatibility(other)
-        cdef croaring.roaring_bitmap_t *r = func(self._c_bitmap, other._c_bitmap)
-        return self.from_ptr(r)
+        if memory_limit != 0:
+            check_binary_op_memory(self._c_bitmap, other._c_bitmap)
+        cdef operation_start start
+        cdef bint profile = profiling_enabled
+        if profile:
+            start = start_operation()
+        result = self.from_ptr(func(self._c_bitmap, other._c_bitmap)) # owned before the hook of the profiler runs
+        if profile:
+            record_bitmap_operation(binary_op_name(func), start, croaring.roaring_bitmap_get_cardinality(self._c_bitmap)
+                                    + croaring.roaring_bitmap_get_cardinality(other._c_bitmap),
+                                    (<AbstractBitMap>result)._c_bitmap)
+        return result
 
-    cdef binary_iop(self, AbstractBitMap other, (void)func(croaring.roaring_bitmap_t*, const croaring.roaring_bitmap_t*)):
+    cdef binary_iop(self, AbstractBitMap other, (void)func(croaring.roaring_bitmap_t*, const croaring.roaring_bitmap_t*) nogil):
         self.__check_compatibility(other)
+        if memory_limit != 0:
+            check_binary_op_memory(self._c_bitmap, other._c_bitmap)
+        cdef operation_start start
+        cdef uint64_t input_cardinality
+        cdef bint profile = profiling_enabled
+        if profile:
+            start = start_operation()
+            input_cardinality = croaring.roaring_bitmap_get_cardinality(self._c_bitmap) + \
+                croaring.roaring_bitmap_get_cardinality(other._c_bitmap)
         func(self._c_bitmap, other._c_bitmap)
+        if profile:
+            record_bitmap_operation(binary_iop_name(func), start, input_cardinality, self._c_bitmap)
         return self
 
+    cdef AbstractBitMap values_bitmap(self, values):
+        """Return the values as a bitmap with the same copy on write setting, without optimizing it."""
+        if isinstance(values, AbstractBitMap):
+            return values
+        if isinstance(values, range):
+            return AbstractBitMap(values, copy_on_write=self.copy_on_write, optimize=False)
+        cdef AbstractBitMap result = AbstractBitMap(copy_on_write=self.copy_on_write, optimize=False)
+        or_values(result._c_bitmap, uint32_view(values))
+        return result
+
+    cdef void _mutated(self):
+        """Called after an in-place operation, see BitMap."""
+        pass
+
     def __or__(self, other):
-        return (<AbstractBitMap>self).binary_op(<AbstractBitMap?>other, croaring.roaring_bitmap_or)
+        if not isinstance(self, AbstractBitMap): # reflected operation, the union is commutative
+            self, other = other, self
+        if not is_values(other):
+            return NotImplemented
+        if isinstance(other, AbstractBitMap) or isinstance(other, range):
+            return (<AbstractBitMap>self).binary_op((<AbstractBitMap>self).values_bitmap(other), croaring.roaring_bitmap_or)
+        cdef const uint32_t[::1] values = uint32_view(other)
+        cdef croaring.roaring_bitmap_t *r = croaring.roaring_bitmap_copy((<AbstractBitMap>self)._c_bitmap)
+        or_values(r, values)
+        return (<AbstractBitMap>self).from_ptr(r)
 
     def __ior__(self, other):
-        return (<AbstractBitMap>self).binary_iop(<AbstractBitMap?>other, croaring.roaring_bitmap_or_inplace)
+        if not is_values(other):
+            return NotImplemented
+        return (<AbstractBitMap>self).binary_iop((<AbstractBitMap>self).values_bitmap(other), croaring.roaring_bitmap_or_inplace)
 
     def __and__(self, other):
-        return (<AbstractBitMap>self).binary_op(<AbstractBitMap?>other, croaring.roaring_bitmap_and)
+        if not isinstance(self, AbstractBitMap): # reflected operation, the intersection is commutative
+            self, other = other, self
+        if not is_values(other):
+            return NotImplemented
+        if isinstance(other, AbstractBitMap) or isinstance(other, range):
+            return (<AbstractBitMap>self).binary_op((<AbstractBitMap>self).values_bitmap(other), croaring.roaring_bitmap_and)
+        return (<AbstractBitMap>self).from_ptr(and_values((<AbstractBitMap>self)._c_bitmap, uint32_view(other)))
 
     def __iand__(self, other):
-        return (<AbstractBitMap>self).binary_iop(<AbstractBitMap?>other, croaring.roaring_bitmap_and_inplace)
+        if not is_values(other):
+            return NotImplemented
+        if isinstance(other, AbstractBitMap) or isinstance(other, range):
+            return (<AbstractBitMap>self).binary_iop((<AbstractBitMap>self).values_bitmap(other), croaring.roaring_bitmap_and_inplace)
+        # the values found in the bitmap, the bitmap itself is modified in place since iterators may refer to it
+        found = (<AbstractBitMap>self).from_ptr(and_values((<AbstractBitMap>self)._c_bitmap, uint32_view(other)))
+        return (<AbstractBitMap>self).binary_iop(found, croaring.roaring_bitmap_and_inplace)
 
     def __xor__(self, other):
-        return (<AbstractBitMap>self).binary_op(<AbstractBitMap?>other, croaring.roaring_bitmap_xor)
+        if not isinstance(self, AbstractBitMap): # reflected operation, the symmetric difference is commutative
+            self, other = other, self
+        if not is_values(other):
+            return NotImplemented
+        return (<AbstractBitMap>self).binary_op((<AbstractBitMap>self).values_bitmap(other), croaring.roaring_bitmap_xor)
 
     def __ixor__(self, other):
-        return (<AbstractBitMap>self).binary_iop(<AbstractBitMap?>other, croaring.roaring_bitmap_xor_inplace)
+        if not is_values(other):
+            return NotImplemented
+        return (<AbstractBitMap>self).binary_iop((<AbstractBitMap>self).values_bitmap(other), croaring.roaring_bitmap_xor_inplace)
 
     def __sub__(self, other):
-        return (<AbstractBitMap>self).binary_op(<AbstractBitMap?>other, croaring.roaring_bitmap_andnot)
+        cdef AbstractBitMap bitmap
+        if not is_values(self) or not is_values(other):
+            return NotImplemented
+        if not isinstance(self, AbstractBitMap): # reflected operation, the result has the type of the bitmap
+            bitmap = (<AbstractBitMap>other).values_bitmap(self)
+            return (<AbstractBitMap>other).from_ptr(croaring.roaring_bitmap_andnot(bitmap._c_bitmap,
+                                                                                  (<AbstractBitMap>other)._c_bitmap))
+        if isinstance(other, AbstractBitMap) or isinstance(other, range):
+            return (<AbstractBitMap>self).binary_op((<AbstractBitMap>self).values_bitmap(other), croaring.roaring_bitmap_andnot)
+        cdef const uint32_t[::1] values = uint32_view(other)
+        cdef croaring.roaring_bitmap_t *r = croaring.roaring_bitmap_copy((<AbstractBitMap>self)._c_bitmap)
+        andnot_values(r, values)
+        return (<AbstractBitMap>self).from_ptr(r)
 
     def __isub__(self, other):
-        return (<AbstractBitMap>self).binary_iop(<AbstractBitMap?>other, croaring.roaring_bitmap_andnot_inplace)
+        if not is_values(other):
+            return NotImplemented
+        return (<AbstractBitMap>self).binary_iop((<AbstractBitMap>self).values_bitmap(other), croaring.roaring_bitmap_andnot_inplace)
 
     def union_cardinality(self, AbstractBitMap other):
         """
@@ -314,9 +571,10 @@ cdef class AbstractBitMap:
         self.__check_compatibility(other)
         return croaring.roaring_bitmap_xor_cardinality(self._c_bitmap, other._c_bitmap)
 
-    def intersect(self, AbstractBitMap other):
+    def intersect(self, other):
         """
-        Return True if and only if the two bitmaps have elements in common.
+        Return True if and only if the two bitmaps have elements in common. The other operand can also be an iterable
+        of integers, its values are then looked up in the bitmap.
 
         It is equivalent to len(self & other) > 0, but faster.
 
@@ -324,9 +582,14 @@ cdef class AbstractBitMap:
         True
         >>> BitMap([3, 12]).intersect(BitMap([5, 18]))
         False
+        >>> BitMap([3, 12]).intersect([18, 12])
+        True
         """
+        if not isinstance(other, AbstractBitMap) and not isinstance(other, range):
+            return intersect_values(self._c_bitmap, uint32_view(other))
+        other = self.values_bitmap(other)
         self.__check_compatibility(other)
-        return croaring.roaring_bitmap_intersect(self._c_bitmap, other._c_bitmap)
+        return croaring.roaring_bitmap_intersect(self._c_bitmap, (<AbstractBitMap>other)._c_bitmap)
 
     def jaccard_index(self, AbstractBitMap other):
         """
@@ -379,6 +642,151 @@ cdef class AbstractBitMap:
         croaring.roaring_bitmap_statistics(self._c_bitmap, &stat)
         return stat
 
+    def iter_containers(self):
+        """
+        Iterate over the containers of the bitmap, by increasing key.
+
+        A container holds the elements sharing the same 16 most significant bits, its key. It is described by
+        a tuple (key, type, cardinality, size), where type is 'array', 'bitset' or 'run' and size is the number
+        of bytes used by the content of the container.
+
+        >>> list(BitMap(list(range(18, 66000, 2)) + [2**20]).iter_containers())
+        [(0, 'bitset', 32759, 8192), (1, 'array', 232, 464), (16, 'array', 1, 2)]
+        """
+        cdef croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef int32_t i = 0
+        cdef uint8_t typecode
+        cdef const void *container
+        while i < ra.size:
+            typecode = ra.typecodes[i]
+            container = croaring.container_unwrap_shared(ra.containers[i], &typecode)
+            yield (ra.keys[i], container_type_names[typecode],
+                   croaring.container_get_cardinality(container, typecode),
+                   croaring.container_size_in_bytes(container, typecode))
+            i += 1
+
+    def container_keys(self):
+        """
+        Return an array.array containing the keys of the containers of the bitmap, in increasing order.
+
+        >>> BitMap([3, 12, 70000, 2**20]).container_keys()
+        array('H', [0, 1, 16])
+        """
+        cdef croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef array.array result = array.array('H')
+        cdef int32_t i
+        array.resize(result, ra.size)
+        for i in range(ra.size):
+            result.data.as_ushorts[i] = ra.keys[i]
+        return result
+
+    def restrict_to_keys(self, uint32_t start, uint32_t stop):
+        """
+        Return the elements of the bitmap whose key (see iter_containers) is in [start, stop).
+
+        It is equivalent to self & BitMap(range(start << 16, stop << 16)), but faster. If copy on write is
+        enabled, the containers are shared with the original bitmap instead of being copied.
+
+        >>> BitMap([3, 70000, 140000, 210000]).restrict_to_keys(1, 3)
+        BitMap([70000, 140000])
+        """
+        cdef croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef croaring.roaring_bitmap_t *result = croaring.roaring_bitmap_create()
+        cdef int32_t i = key_lower_bound(ra, start)
+        result.copy_on_write = self._c_bitmap.copy_on_write
+        while i < ra.size and ra.keys[i] < stop:
+            croaring.ra_append_copy(&result.high_low_container, ra, i, self._c_bitmap.copy_on_write)
+            i += 1
+        return self.from_ptr(result)
+
+    def range_cardinality(self, uint64_t start, uint64_t stop):
+        """
+        Return the number of elements of the bitmap in [start, stop).
+
+        It is equivalent to len(self & BitMap(range(start, stop))), but faster.
+
+        >>> BitMap([1, 2, 5, 11, 12, 13]).range_cardinality(2, 12)
+        3
+        """
+        cdef croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef int32_t i = key_lower_bound(ra, min(start >> 16, 1 << 16))
+        cdef uint64_t base, total = 0
+        while i < ra.size:
+            base = (<uint64_t>ra.keys[i]) << 16
+            if base >= stop:
+                break
+            total += container_range_cardinality(ra.containers[i], ra.typecodes[i],
+                                                 max(base, start) - base, min(base + (1 << 16), stop) - base)
+            i += 1
+        return total
+
+    def range_sum(self, uint64_t start, uint64_t stop):
+        """
+        Return the sum of the elements of the bitmap in [start, stop).
+
+        >>> BitMap([1, 2, 5, 11, 12, 13]).range_sum(2, 12)
+        18
+        """
+        cdef croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef int32_t i = key_lower_bound(ra, min(start >> 16, 1 << 16))
+        cdef uint64_t base, count, total = 0
+        while i < ra.size:
+            base = (<uint64_t>ra.keys[i]) << 16
+            if base >= stop:
+                break
+            total += container_range_sum(ra.containers[i], ra.typecodes[i],
+                                         max(base, start) - base, min(base + (1 << 16), stop) - base, &count)
+            total += base * count
+            i += 1
+        return total
+
+    def histogram(self, uint64_t bucket_width, uint64_t start=0, stop=None):
+        """
+        Return an array.array with the number of elements in each bucket [start + i*bucket_width,
+        start + (i+1)*bucket_width), for all the buckets intersecting [start, stop). By default, stop is the maximum
+        of the bitmap plus one.
+
+        >>> BitMap([1, 2, 5, 11, 12, 13]).histogram(5)
+        array('Q', [2, 1, 3])
+        >>> BitMap([1, 2, 5, 11, 12, 13]).histogram(5, start=2, stop=12)
+        array('Q', [2, 1])
+        """
+        cdef croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef uint64_t c_stop, base, container_stop, position, bucket, bucket_stop
+        cdef uint32_t low
+        cdef int32_t i
+        cdef vector[uint64_t] counts
+        if bucket_width == 0:
+            raise ValueError('The bucket width must be positive.')
+        if stop is None:
+            c_stop = self.max() + 1 if self else start
+        else:
+            c_stop = min(stop, 2**32)
+        if c_stop <= start:
+            return array.array(uint64_typecode)
+        bucket_width = min(bucket_width, (<uint64_t>1) << 33) # avoid overflows, there is a single bucket anyway
+        counts.resize((c_stop - start - 1) // bucket_width + 1, 0)
+        i = key_lower_bound(ra, min(start >> 16, 1 << 16))
+        while i < ra.size:
+            base = (<uint64_t>ra.keys[i]) << 16
+            if base >= c_stop:
+                break
+            container_stop = min(base + (1 << 16), c_stop)
+            position = max(start, base)
+            # Only the buckets holding elements are visited, by jumping to the next element after each bucket.
+            while position < container_stop and \
+                    container_next_value(ra.containers[i], ra.typecodes[i], position - base, &low):
+                position = base + low
+                if position >= container_stop:
+                    break
+                bucket = (position - start) // bucket_width
+                bucket_stop = min(start + (bucket + 1) * bucket_width, container_stop)
+                counts[bucket] += container_range_cardinality(ra.containers[i], ra.typecodes[i],
+                                                              position - base, bucket_stop - base)
+                position = bucket_stop
+            i += 1
+        return array.array(uint64_typecode, counts)
+
     def min(self):
         """
         Return the minimum element of the bitmap.
@@ -407,6 +815,70 @@ cdef class AbstractBitMap:
         else:
             return croaring.roaring_bitmap_maximum(self._c_bitmap)
 
+    cdef bool _next_value(self, uint64_t value, uint32_t *result):
+        """Find the smallest element greater or equal to the given value, return False if there is none."""
+        cdef croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef int32_t i
+        cdef uint32_t low
+        if value >> 32:
+            return False
+        i = key_lower_bound(ra, value >> 16)
+        if i < ra.size and ra.keys[i] == value >> 16:
+            if container_next_value(ra.containers[i], ra.typecodes[i], value & 0xFFFF, &low):
+                result[0] = ((<uint32_t>ra.keys[i]) << 16) | low
+                return True
+            i += 1
+        if i == ra.size:
+            return False
+        result[0] = ((<uint32_t>ra.keys[i]) << 16) | croaring.container_minimum(ra.containers[i], ra.typecodes[i])
+        return True
+
+    cdef bool _prev_value(self, int64_t value, uint32_t *result):
+        """Find the largest element lower or equal to the given value, return False if there is none."""
+        cdef croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef int32_t i
+        cdef uint32_t low
+        if value < 0:
+            return False
+        i = key_lower_bound(ra, value >> 16)
+        if i < ra.size and ra.keys[i] == value >> 16:
+            if container_prev_value(ra.containers[i], ra.typecodes[i], value & 0xFFFF, &low):
+                result[0] = ((<uint32_t>ra.keys[i]) << 16) | low
+                return True
+        if i == 0:
+            return False
+        i -= 1
+        result[0] = ((<uint32_t>ra.keys[i]) << 16) | croaring.container_maximum(ra.containers[i], ra.typecodes[i])
+        return True
+
+    def next_value(self, uint32_t value):
+        """
+        Return the smallest element of the bitmap greater or equal to the given value.
+
+        >>> BitMap([3, 12, 70000]).next_value(12)
+        12
+        >>> BitMap([3, 12, 70000]).next_value(13)
+        70000
+        """
+        cdef uint32_t result
+        if not self._next_value(value, &result):
+            raise ValueError('No element greater or equal to %d in the bitmap.' % value)
+        return result
+
+    def prev_value(self, uint32_t value):
+        """
+        Return the largest element of the bitmap lower or equal to the given value.
+
+        >>> BitMap([3, 12, 70000]).prev_value(12)
+        12
+        >>> BitMap([3, 12, 70000]).prev_value(69999)
+        12
+        """
+        cdef uint32_t result
+        if not self._prev_value(value, &result):
+            raise ValueError('No element lower or equal to %d in the bitmap.' % value)
+        return result
+
     def rank(self, uint32_t value):
         """
         Return the rank of the element in the bitmap.
@@ -414,10 +886,22 @@ cdef class AbstractBitMap:
         >>> BitMap([3, 12]).rank(12)
         2
         """
+        return self._rank(value)
+
+    cdef uint64_t _cardinality(self):
+        """Return the number of elements, cached by FrozenBitMap."""
+        return croaring.roaring_bitmap_get_cardinality(self._c_bitmap)
+
+    cdef bool _select(self, uint64_t rank, uint32_t *element):
+        """Write in element the element of the given rank (starting at 0), return False if there is none."""
+        return croaring.roaring_bitmap_select(self._c_bitmap, rank, element)
+
+    cdef uint64_t _rank(self, uint32_t value):
+        """Return the number of elements lower or equal to the value."""
         return croaring.roaring_bitmap_rank(self._c_bitmap, value)
 
     cdef int64_t _shift_index(self, int64_t index) except -1:
-        cdef int64_t size = len(self)
+        cdef int64_t size = self._cardinality()
         if index >= size or index < -size:
             raise IndexError('Index out of bound')
         if index < 0:
@@ -428,14 +912,25 @@ cdef class AbstractBitMap:
     cdef uint32_t _get_elt(self, int64_t index) except? 0:
         cdef uint64_t s_index = self._shift_index(index)
         cdef uint32_t elt
-        cdef bool valid = croaring.roaring_bitmap_select(self._c_bitmap, s_index, &elt)
+        cdef bool valid = self._select(s_index, &elt)
         if not valid:
             raise ValueError('Invalid rank')
         return elt
 
     cdef _get_slice(self, sl):
+        cdef operation_start start
+        if not profiling_enabled:
+            return self._compute_slice(sl)
+        start = start_operation()
+        result = self._compute_slice(sl)
+        record_bitmap_operation('get_slice', start, croaring.roaring_bitmap_get_cardinality(self._c_bitmap),
+                                (<AbstractBitMap>result)._c_bitmap)
+        return result
+
+    cdef _compute_slice(self, sl):
         """For a faster computation, four different methods, depending on the slice."""
-        start, stop, step = sl.indices(len(self))
+        cdef uint64_t size = self._cardinality()
+        start, stop, step = sl.indices(size)
         sign = 1 if step > 0 else -1
         if (sign > 0 and start >= stop) or (sign < 0 and start <= stop):
             return self.__class__()
@@ -447,7 +942,7 @@ cdef class AbstractBitMap:
             values = range(first_elt, last_elt+sign, step)
             result = self & self.__class__(values, copy_on_write=self.copy_on_write)
             return result
-        elif len(r) < len(self) / 100: # TODO find a good threshold for performance?
+        elif len(r) < size / 100.0: # TODO find a good threshold for performance?
             if step < 0:
                 start = r[-1]
                 stop = r[0] + 1
@@ -464,7 +959,7 @@ cdef class AbstractBitMap:
         cdef croaring.roaring_bitmap_t *result = croaring.roaring_bitmap_create()
         cdef croaring.roaring_uint32_iterator_t *iterator = croaring.roaring_create_iterator(self._c_bitmap)
         cdef uint32_t  count, max_count=256
-        cdef uint32_t *buff = <uint32_t*>malloc(max_count*4)
+        cdef uint32_t buff[256]
         cdef uint32_t i_loc=0, i_glob=start, i_buff=0
         result.copy_on_write = self.copy_on_write
         first_elt = self._get_elt(start)
@@ -483,9 +978,111 @@ cdef class AbstractBitMap:
             i_loc = 0
             i_buff = i_buff % max_count
         croaring.roaring_free_uint32_iterator(iterator)
-        free(buff)
         return self.from_ptr(result)
 
+    cdef void _select_sorted(self, const uint64_t *ranks, size_t count, uint32_t *result):
+        """
+        Write in result the elements with the given ranks (starting at 0), in a single pass over the containers.
+        The ranks are sorted in increasing order and are assumed to be lower than the cardinality.
+        """
+        cdef croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef int32_t i = 0
+        cdef size_t start = 0, stop
+        cdef uint64_t offset = 0, card
+        cdef uint32_t high
+        while start < count:
+            card = croaring.container_get_cardinality(ra.containers[i], ra.typecodes[i])
+            stop = start
+            while stop < count and ranks[stop] < offset + card:
+                stop += 1
+            container_select_sorted(ra.containers[i], ra.typecodes[i], ranks + start, stop - start, offset,
+                                    result + start)
+            high = (<uint32_t>ra.keys[i]) << 16
+            while start < stop:
+                result[start] |= high
+                start += 1
+            offset += card
+            i += 1
+
+    cdef _from_sorted_ranks(self, vector[uint64_t] &ranks):
+        """Return a bitmap with the elements of the given (sorted and distinct) ranks."""
+        cdef vector[uint32_t] values
+        cdef croaring.roaring_bitmap_t *result
+        if ranks.size() == 0:
+            result = croaring.roaring_bitmap_create()
+        else:
+            values.resize(ranks.size())
+            self._select_sorted(&ranks[0], ranks.size(), &values[0])
+            result = croaring.roaring_bitmap_of_ptr(values.size(), &values[0])
+            croaring.roaring_bitmap_run_optimize(result)
+            croaring.roaring_bitmap_shrink_to_fit(result)
+        result.copy_on_write = self._c_bitmap.copy_on_write
+        return self.from_ptr(result)
+
+    def sample(self, uint64_t k, seed=None, replace=False):
+        """
+        Return k elements of the bitmap drawn uniformly at random.
+
+        Without replacement, the result is a bitmap. With replacement, it is an array.array, sorted in increasing
+        order, which may contain duplicates. A seed can be given for reproducible samples.
+
+        >>> bm = BitMap(range(0, 1000, 10))
+        >>> sample = bm.sample(5)
+        >>> len(sample), sample <= bm
+        (5, True)
+        >>> bm.sample(3, seed=42) == bm.sample(3, seed=42)
+        True
+        >>> len(bm.sample(200, replace=True))
+        200
+        """
+        cdef uint64_t size = len(self)
+        cdef vector[uint64_t] ranks
+        cdef array.array result
+        generator = random.Random(seed)
+        if replace:
+            if size == 0 and k > 0:
+                raise ValueError('Cannot sample from an empty bitmap.')
+            ranks = sorted([generator.randrange(size) for _ in range(k)])
+            result = array.array('I')
+            array.resize(result, k)
+            if k > 0:
+                self._select_sorted(&ranks[0], k, result.data.as_uints)
+            return result
+        if k > size:
+            raise ValueError('Sample larger than the bitmap.')
+        ranks = sorted(generator.sample(range(size), k))
+        return self._from_sorted_ranks(ranks)
+
+    def sample_fraction(self, double p, seed=None):
+        """
+        Return a sample of the bitmap where each element is kept independently with probability p.
+
+        The number of random draws is proportional to the size of the sample, not to the size of the bitmap.
+
+        >>> bm = BitMap(range(100000))
+        >>> sample = bm.sample_fraction(0.01)
+        >>> sample <= bm
+        True
+        >>> 500 < len(sample) < 1500
+        True
+        """
+        cdef uint64_t size = len(self)
+        cdef vector[uint64_t] ranks
+        cdef double log_q, rank = -1
+        if not 0 <= p <= 1:
+            raise ValueError('The probability must be in [0, 1].')
+        if p == 1:
+            return self.__class__(self)
+        generator = random.Random(seed)
+        log_q = log1p(-p) # log(1 - p) would round to 0 for the tiny probabilities
+        if log_q < 0:
+            while True: # the gaps between two selected ranks follow a geometric distribution
+                rank += 1 + floor(log1p(-generator.random()) / log_q)
+                if rank >= size:
+                    break
+                ranks.push_back(<uint64_t>rank)
+        return self._from_sorted_ranks(ranks)
+
     def __getitem__(self, value):
         if isinstance(value, int):
             return self._get_elt(value)
@@ -501,11 +1098,16 @@ cdef class AbstractBitMap:
         >>> BitMap.deserialize(BitMap([3, 12]).serialize())
         BitMap([3, 12])
         """
+        cdef operation_start start
+        cdef bint profile = profiling_enabled
+        if profile:
+            start = start_operation()
         cdef size_t size = croaring.roaring_bitmap_portable_size_in_bytes(self._c_bitmap)
-        cdef char *buff = <char*>malloc(size)
-        cdef real_size = croaring.roaring_bitmap_portable_serialize(self._c_bitmap, buff)
-        result = buff[:size]
-        free(buff)
+        cdef bytes result = PyBytes_FromStringAndSize(NULL, size) # serialized in place, without a temporary buffer
+        croaring.roaring_bitmap_portable_serialize(self._c_bitmap, PyBytes_AS_STRING(result))
+        if profile:
+            record_operation('serialize', start, croaring.roaring_bitmap_get_cardinality(self._c_bitmap),
+                             croaring.roaring_bitmap_get_cardinality(self._c_bitmap), size)
         return result
 
 
@@ -517,7 +1119,14 @@ cdef class AbstractBitMap:
         >>> BitMap.deserialize(BitMap([3, 12]).serialize())
         BitMap([3, 12])
         """
-        return (<AbstractBitMap>cls()).from_ptr(deserialize_ptr(buff)) # FIXME to change when from_ptr is a classmethod
+        cdef operation_start start
+        cdef bint profile = profiling_enabled
+        if profile:
+            start = start_operation()
+        result = (<AbstractBitMap>cls()).from_ptr(deserialize_ptr(buff)) # FIXME to change when from_ptr is a classmethod
+        if profile:
+            record_bitmap_operation('deserialize', start, 0, (<AbstractBitMap>result)._c_bitmap)
+        return result
 
     def __getstate__(self):
         return self.serialize()
@@ -545,3 +1154,344 @@ cdef class AbstractBitMap:
         cdef unsigned[:] buff = result
         croaring.roaring_bitmap_to_uint32_array(self._c_bitmap, &buff[0])
         return result
+
+    @classmethod
+    def from_array(cls, values, size_t workers=1):
+        """
+        Generate a bitmap from unsorted values, for instance a large NumPy array or array.array of 32 bits unsigned
+        integers (other iterables are converted first).
+
+        The values are partitioned by container, then the containers are built independently, each one directly in
+        its most compact form. These steps are split among the given number of threads (at most one per CPU), without
+        the GIL.
+
+        >>> BitMap.from_array(array.array('I', [70000, 3, 12, 3]), workers=2)
+        BitMap([3, 12, 70000])
+        """
+        if workers == 0:
+            raise ValueError('The number of workers must be positive.')
+        return (<AbstractBitMap>cls()).from_ptr(parallel_from_array(uint32_view(values), workers)) # FIXME to change when from_ptr is a classmethod
+
+    @classmethod
+    def from_intervals(cls, starts, ends):
+        """
+        Generate a bitmap containing the integers of the intervals [starts[i], ends[i]), with ends[i] <= 2**32.
+
+        The intervals may overlap and be given in any order, but sorted intervals are faster to add.
+        See AbstractBitMap.to_intervals for the reverse operation.
+
+        >>> BitMap.from_intervals([3, 10], [6, 12])
+        BitMap([3, 4, 5, 10, 11])
+        """
+        cdef BitMapBuilder builder = BitMapBuilder()
+        if len(starts) != len(ends):
+            raise ValueError('Got %d starts but %d ends.' % (len(starts), len(ends)))
+        for start, end in zip(starts, ends):
+            if start > end:
+                raise ValueError('Invalid interval [%d, %d).' % (start, end))
+            builder.add_range(start, end)
+        return builder.finish(cls)
+
+    def to_intervals(self):
+        """
+        Return the maximal intervals [start, end) of consecutive elements of the bitmap, as two arrays of 64 bits
+        unsigned integers holding their starts and their ends, in increasing order.
+
+        The intervals are read from the run containers, and computed from the other ones.
+
+        >>> starts, ends = BitMap([3, 4, 5, 10, 11]).to_intervals()
+        >>> list(starts), list(ends)
+        ([3, 10], [6, 12])
+        """
+        cdef const croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef vector[uint64_t] starts, ends
+        cdef array.array result_starts = array.array(uint64_typecode)
+        cdef array.array result_ends = array.array(uint64_typecode)
+        cdef int32_t i
+        for i in range(ra.size):
+            container_intervals(ra.containers[i], ra.typecodes[i], (<uint64_t>ra.keys[i]) << 16, starts, ends)
+        if starts.size() > 0:
+            array.resize(result_starts, starts.size())
+            array.resize(result_ends, ends.size())
+            memcpy(result_starts.data.as_voidptr, &starts[0], starts.size() * sizeof(uint64_t))
+            memcpy(result_ends.data.as_voidptr, &ends[0], ends.size() * sizeof(uint64_t))
+        return result_starts, result_ends
+
+    def num_runs(self):
+        """
+        Return the number of maximal intervals of consecutive elements of the bitmap.
+
+        >>> BitMap([3, 4, 5, 10, 11, 2**16]).num_runs()
+        3
+        """
+        cdef const croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef uint64_t total = 0
+        cdef uint32_t first, last
+        cdef int32_t i
+        for i in range(ra.size):
+            total += container_number_of_runs(ra.containers[i], ra.typecodes[i])
+            if i > 0 and ra.keys[i] == ra.keys[i-1] + 1 and \
+                    container_prev_value(ra.containers[i-1], ra.typecodes[i-1], 0xFFFF, &last) and last == 0xFFFF and \
+                    container_next_value(ra.containers[i], ra.typecodes[i], 0, &first) and first == 0:
+                total -= 1 # a run spanning the two containers
+        return total
+
+    @classmethod
+    def from_bool_mask(cls, mask, uint64_t offset=0):
+        """
+        Generate a bitmap containing offset+i for all the indices i such that mask[i] is true.
+
+        The mask can be any contiguous buffer of one byte items, like bytes or a NumPy array of booleans.
+        See AbstractBitMap.to_bool_mask for the reverse operation.
+
+        >>> BitMap.from_bool_mask(b'\\x01\\x00\\x01\\x01')
+        BitMap([0, 2, 3])
+        >>> BitMap.from_bool_mask(bytearray([0, 1, 1]), offset=10)
+        BitMap([11, 12])
+        """
+        cdef _ReadBuffer view = _ReadBuffer(mask)
+        cdef uint64_t i, j, word
+        cdef uint64_t size = view.size
+        cdef BitMapBuilder builder = BitMapBuilder()
+        if view.itemsize != 1:
+            raise ValueError('The mask must have one byte items.')
+        if offset + size > 2**32:
+            raise OverflowError('The mask must be included in [0, 2**32) once shifted by the offset.')
+        i = 0
+        while i < size:
+            word = 0
+            for j in range(min(64, size - i)):
+                word |= (<uint64_t>(view.data[i + j] != 0)) << j
+            builder._add_word(offset + i, word)
+            i += 64
+        return builder.finish(cls)
+
+    @classmethod
+    def from_packed_bits(cls, buff, uint64_t n_bits):
+        """
+        Generate a bitmap containing all the indices i < n_bits of the bits set in the given buffer.
+
+        The bits are packed in least significant bit order, like the validity bitmaps of Apache Arrow.
+        See AbstractBitMap.to_packed_bits for the reverse operation.
+
+        >>> BitMap.from_packed_bits(b'\\x0d\\x01', 9)
+        BitMap([0, 2, 3, 8])
+        >>> BitMap.from_packed_bits(b'\\x0d\\x01', 3)
+        BitMap([0, 2])
+        """
+        cdef _ReadBuffer view = _ReadBuffer(buff)
+        cdef uint64_t i, j, word
+        cdef uint64_t n_bytes = (n_bits + 7) // 8
+        cdef BitMapBuilder builder = BitMapBuilder()
+        if n_bits > 2**32:
+            raise OverflowError('The number of bits must be at most 2**32.')
+        if <uint64_t>view.size < n_bytes:
+            raise ValueError('The buffer holds less than %d bits.' % n_bits)
+        i = 0
+        while i < n_bytes:
+            word = 0
+            for j in range(min(8, n_bytes - i)):
+                word |= (<uint64_t>view.data[i + j]) << (8 * j)
+            if n_bits - i * 8 < 64:
+                word &= ((<uint64_t>1) << (n_bits - i * 8)) - 1
+            builder._add_word(i * 8, word)
+            i += 8
+        return builder.finish(cls)
+
+    cdef _to_words(self, uint64_t length, void (*write)(uint64_t, uint64_t, uint64_t, char*), char *out):
+        """Call write(position, word, length, out) for all the non-empty words of the bitmap below length."""
+        cdef croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef uint64_t words[croaring.BITSET_CONTAINER_SIZE_IN_WORDS]
+        cdef uint64_t base
+        cdef int32_t i, j
+        for i in range(ra.size):
+            base = (<uint64_t>ra.keys[i]) << 16
+            if base >= length:
+                break
+            memset(words, 0, sizeof(words))
+            container_to_words(ra.containers[i], ra.typecodes[i], words)
+            for j in range(croaring.BITSET_CONTAINER_SIZE_IN_WORDS):
+                if base + 64 * j >= length:
+                    break
+                if words[j] != 0:
+                    write(base + 64 * j, words[j], length, out)
+
+    def to_bool_mask(self, uint64_t length):
+        """
+        Return a bytearray of the given length whose item i is 1 if i is in the bitmap, 0 otherwise.
+
+        A NumPy array of booleans can be obtained without copy with numpy.frombuffer(result, dtype=bool).
+
+        >>> BitMap([0, 2, 3, 12]).to_bool_mask(5)
+        bytearray(b'\\x01\\x00\\x01\\x01\\x00')
+        """
+        cdef bytearray result = bytearray(length)
+        if length > 0:
+            self._to_words(length, write_bool_mask_word, result)
+        return result
+
+    def to_packed_bits(self, uint64_t length):
+        """
+        Return a bytearray of length bits, packed in least significant bit order, whose bit i is set if i is in the
+        bitmap.
+
+        >>> BitMap([0, 2, 3, 8, 12]).to_packed_bits(9)
+        bytearray(b'\\r\\x01')
+        """
+        cdef bytearray result = bytearray((length + 7) // 8)
+        if length > 0:
+            self._to_words(length, write_packed_bits_word, result)
+        return result
+
+    def apply_mask(self, values):
+        """
+        Return the items of values whose indices are in the bitmap, in increasing order of index.
+
+        NumPy arrays are indexed along their first axis, an array.array gives an array.array of the same type and any
+        other sequence gives a list.
+
+        >>> BitMap([0, 2, 3]).apply_mask(['a', 'b', 'c', 'd'])
+        ['a', 'c', 'd']
+        >>> BitMap([1, 2]).apply_mask(array.array('d', [0.5, 1.5, 2.5]))
+        array('d', [1.5, 2.5])
+        """
+        cdef array.array indices, result, source
+        cdef Py_ssize_t i, itemsize
+        if self and self.max() >= len(values):
+            raise IndexError('The bitmap contains indices out of the range of the values.')
+        numpy = sys.modules.get('numpy') # no need to import numpy if it is not already used
+        if numpy is not None and isinstance(values, numpy.ndarray):
+            return values[numpy.frombuffer(self.to_array(), dtype=numpy.uint32)]
+        if isinstance(values, array.array):
+            source = values
+            indices = self.to_array()
+            result = array.clone(source, len(indices), False)
+            itemsize = source.itemsize
+            for i in range(len(indices)):
+                memcpy(result.data.as_chars + i * itemsize, source.data.as_chars + indices.data.as_uints[i] * itemsize,
+                       itemsize)
+            return result
+        return [values[i] for i in self]
+
+    def to_arrow(self):
+        """
+        Return a pyarrow.UInt32Array containing the elements of the bitmap, in increasing order.
+
+        The array is backed by the buffer returned by AbstractBitMap.to_array, without any other copy.
+        This requires pyarrow.
+        """
+        pyarrow = import_pyarrow()
+        values = self.to_array()
+        return pyarrow.Array.from_buffers(pyarrow.uint32(), len(values), [None, pyarrow.py_buffer(values)])
+
+    @classmethod
+    def from_arrow(cls, values):
+        """
+        Generate a bitmap from a pyarrow array (or chunked array) of unsigned 32 bits integers.
+
+        The values are read directly from the Arrow buffers. Arrays of other integer types are cast first, null values
+        are not allowed. This requires pyarrow.
+        """
+        pyarrow = import_pyarrow()
+        cdef AbstractBitMap result = cls()
+        cdef _ReadBuffer view
+        chunks = values.chunks if isinstance(values, pyarrow.ChunkedArray) else [values]
+        for chunk in chunks:
+            if chunk.null_count > 0:
+                raise ValueError('Cannot build a bitmap from an array with null values.')
+            if len(chunk) == 0:
+                continue
+            if chunk.type != pyarrow.uint32():
+                chunk = chunk.cast(pyarrow.uint32())
+            view = _ReadBuffer(chunk.buffers()[1])
+            croaring.roaring_bitmap_add_many(result._c_bitmap, len(chunk), (<const uint32_t*>view.data) + <Py_ssize_t>chunk.offset)
+        result.run_optimize()
+        result.shrink_to_fit()
+        return result
+
+    @staticmethod
+    def serialize_many(bitmaps):
+        """
+        Return a pyarrow.BinaryArray holding the serializations of the given bitmaps (None giving a null value).
+
+        All the bitmaps are serialized into a single contiguous buffer. A pyarrow.LargeBinaryArray is returned if this
+        buffer exceeds 2GB. See AbstractBitMap.deserialize_many for the reverse operation. This requires pyarrow.
+        """
+        pyarrow = import_pyarrow()
+        cdef AbstractBitMap bitmap
+        cdef size_t i, total = 0
+        cdef bytearray data
+        cdef char *out
+        bitmaps = list(bitmaps)
+        sizes = []
+        for bitmap in bitmaps:
+            sizes.append(0 if bitmap is None else croaring.roaring_bitmap_portable_size_in_bytes(bitmap._c_bitmap))
+            total += sizes[-1]
+        if total < 2**31:
+            offsets = array.array('i', [0])
+            binary_type = pyarrow.binary()
+        else:
+            offsets = array.array(uint64_typecode, [0])
+            binary_type = pyarrow.large_binary()
+        data = bytearray(total)
+        out = data
+        total = 0
+        for i in range(len(bitmaps)):
+            bitmap = bitmaps[i]
+            if bitmap is not None:
+                total += croaring.roaring_bitmap_portable_serialize(bitmap._c_bitmap, out + total)
+            offsets.append(total)
+        validity = None
+        if any(value is None for value in bitmaps):
+            valid = BitMap([i for i in range(len(bitmaps)) if bitmaps[i] is not None])
+            validity = pyarrow.py_buffer(valid.to_packed_bits(len(bitmaps)))
+        return pyarrow.Array.from_buffers(binary_type, len(bitmaps),
+                                          [validity, pyarrow.py_buffer(offsets), pyarrow.py_buffer(data)])
+
+    @classmethod
+    def deserialize_many(cls, serializations):
+        """
+        Return the list of bitmaps given by a pyarrow binary array of serializations (null values giving None).
+
+        See AbstractBitMap.serialize_many for the reverse operation. This requires pyarrow.
+        """
+        pyarrow = import_pyarrow()
+        cdef AbstractBitMap template = cls()
+        cdef _ReadBuffer validity, offsets, data
+        cdef const int32_t *offsets32
+        cdef const int64_t *offsets64
+        cdef int64_t i, start, stop, offset
+        cdef croaring.roaring_bitmap_t *ptr
+        result = []
+        if isinstance(serializations, pyarrow.ChunkedArray):
+            for chunk in serializations.chunks:
+                result.extend(cls.deserialize_many(chunk))
+            return result
+        if pyarrow.types.is_binary(serializations.type):
+            large = False
+        elif pyarrow.types.is_large_binary(serializations.type):
+            large = True
+        else:
+            raise TypeError('Expected a binary array, got an array of type %s.' % serializations.type)
+        if len(serializations) == 0:
+            return result
+        buffers = serializations.buffers()
+        validity = None if buffers[0] is None else _ReadBuffer(buffers[0])
+        offsets = _ReadBuffer(buffers[1])
+        data = _ReadBuffer(b'' if buffers[2] is None else buffers[2])
+        offset = serializations.offset
+        offsets32 = (<const int32_t*>offsets.data) + offset
+        offsets64 = (<const int64_t*>offsets.data) + offset
+        for i in range(len(serializations)):
+            if validity is not None and not (validity.data[(offset + i) >> 3] >> ((offset + i) & 7)) & 1:
+                result.append(None)
+                continue
+            if large:
+                start, stop = offsets64[i], offsets64[i+1]
+            else:
+                start, stop = offsets32[i], offsets32[i+1]
+            ptr = croaring.roaring_bitmap_portable_deserialize_safe(<const char*>data.data + start, stop - start)
+            if ptr is NULL:
+                raise ValueError('Invalid serialization at index %d.' % i)
+            result.append(template.from_ptr(ptr))
+        return result
@@ -0,0 +1,106 @@
+ctypedef void (*lazy_operation)(croaring.roaring_bitmap_t*, const croaring.roaring_bitmap_t*)
+
+cdef void lazy_or_inplace(croaring.roaring_bitmap_t *x1, const croaring.roaring_bitmap_t *x2):
+    croaring.roaring_bitmap_lazy_or_inplace(x1, x2, True)
+
+cdef void lazy_xor_inplace(croaring.roaring_bitmap_t *x1, const croaring.roaring_bitmap_t *x2):
+    croaring.roaring_bitmap_lazy_xor_inplace(x1, x2)
+
+cdef class _LazyAccumulator:
+    """
+    Base class of the accumulators, which combine many bitmaps arriving over time into a single one.
+
+    The bitmaps are combined with the "lazy" operations of CRoaring, which do not maintain the cardinality of the
+    containers nor convert them to their best type. This work is done once, when the result is read. Each subclass
+    sets the operation in its __cinit__.
+    """
+    cdef croaring.roaring_bitmap_t *_c_bitmap
+    cdef lazy_operation _operation
+    cdef bool _needs_repair
+    cdef bool _copy_on_write
+
+    def __cinit__(self, copy_on_write=False):
+        self._copy_on_write = copy_on_write
+        self._reset()
+
+    def __init__(self, copy_on_write=False):
+        """
+        Construct an empty accumulator. Copy on write is enabled on the resulting bitmaps with copy_on_write.
+        """
+
+    def __dealloc__(self):
+        if self._c_bitmap is not NULL:
+            croaring.roaring_bitmap_free(self._c_bitmap)
+
+    cdef _reset(self):
+        self._c_bitmap = croaring.roaring_bitmap_create()
+        self._c_bitmap.copy_on_write = self._copy_on_write
+        self._needs_repair = False
+
+    cdef void _repair(self):
+        if self._needs_repair:
+            croaring.roaring_bitmap_repair_after_lazy(self._c_bitmap)
+            self._needs_repair = False
+
+    def add(self, AbstractBitMap bitmap not None):
+        """
+        Combine the given bitmap with the accumulated one.
+        """
+        if bitmap.copy_on_write != self._copy_on_write:
+            raise ValueError('Cannot have interactions between bitmaps with and without copy_on_write.\n')
+        if self._operation is NULL:
+            raise TypeError('%s has no operation.' % self.__class__.__name__)
+        self._operation(self._c_bitmap, bitmap._c_bitmap)
+        self._needs_repair = True
+
+    def update(self, *bitmaps):
+        """
+        Combine all the given bitmaps with the accumulated one.
+        """
+        for bitmap in bitmaps:
+            self.add(bitmap)
+
+    def __len__(self):
+        self._repair()
+        return croaring.roaring_bitmap_get_cardinality(self._c_bitmap)
+
+    def finish(self, cls=BitMap):
+        """
+        Return the accumulated bitmap, as an instance of the given class, and reset the accumulator.
+        """
+        self._repair()
+        cdef croaring.roaring_bitmap_t *result = self._c_bitmap
+        croaring.roaring_bitmap_run_optimize(result)
+        croaring.roaring_bitmap_shrink_to_fit(result)
+        self._reset()
+        return (<AbstractBitMap>cls()).from_ptr(result) # FIXME to change when from_ptr is a classmethod
+
+cdef class UnionAccumulator(_LazyAccumulator):
+    """
+    Compute the union of many bitmaps arriving over time, faster than repeated in-place unions.
+
+    >>> acc = UnionAccumulator()
+    >>> acc.add(BitMap([3, 12]))
+    >>> acc.update(BitMap([5]), BitMap([3, 70000]))
+    >>> len(acc)
+    4
+    >>> acc.finish()
+    BitMap([3, 5, 12, 70000])
+    """
+
+    def __cinit__(self, copy_on_write=False):
+        self._operation = lazy_or_inplace
+
+cdef class SymmetricDifferenceAccumulator(_LazyAccumulator):
+    """
+    Compute the symmetric difference of many bitmaps arriving over time (i.e. the elements present in an odd number
+    of them), faster than repeated in-place symmetric differences.
+
+    >>> acc = SymmetricDifferenceAccumulator()
+    >>> acc.update(BitMap([3, 12]), BitMap([5, 12]), BitMap([3, 70000]))
+    >>> acc.finish()
+    BitMap([5, 70000])
+    """
+
+    def __cinit__(self, copy_on_write=False):
+        self._operation = lazy_xor_inplace
@@ -0,0 +1,239 @@
+#include <Python.h>
+#include <errno.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "allocator.h"
+
+/*
+ * Each block is preceded by a header of HEADER_SIZE bytes recording the requested size, the allocator used and the
+ * offset of the block from the address returned by the underlying allocator. Blocks allocated before a change of
+ * allocator are thus released by the right one, and the sizes are known when they are released.
+ *
+ * The header keeps the alignment of malloc (at most HEADER_SIZE), so most blocks directly follow their header and
+ * are resized by the underlying realloc. Only the blocks needing a larger alignment (posix_memalign) are padded.
+ */
+typedef struct {
+    size_t size;
+    int allocator;
+    uint32_t offset;
+} block_header_t;
+
+#define HEADER_SIZE 16
+
+/* Compilation fails if the header does not fit. */
+typedef char header_size_check[sizeof(block_header_t) <= HEADER_SIZE ? 1 : -1];
+
+/* The counters are updated by the threads building bitmaps in parallel, see pyroaring_atomic_counters. */
+#if defined(__GNUC__) || defined(__clang__)
+#define ATOMIC_COUNTERS 1
+#define ATOMIC_ADD(counter, value) __atomic_add_fetch(&(counter), (value), __ATOMIC_RELAXED)
+#define ATOMIC_SUB(counter, value) __atomic_sub_fetch(&(counter), (value), __ATOMIC_RELAXED)
+#define ATOMIC_LOAD(counter) __atomic_load_n(&(counter), __ATOMIC_RELAXED)
+#elif defined(_MSC_VER)
+#include <intrin.h>
+#define ATOMIC_COUNTERS 1
+#ifdef _WIN64
+#define ATOMIC_ADD(counter, value) _InterlockedExchangeAdd64((volatile __int64 *)&(counter), (__int64)(value))
+#define ATOMIC_SUB(counter, value) _InterlockedExchangeAdd64((volatile __int64 *)&(counter), -(__int64)(value))
+#else
+#define ATOMIC_ADD(counter, value) _InterlockedExchangeAdd((volatile long *)&(counter), (long)(value))
+#define ATOMIC_SUB(counter, value) _InterlockedExchangeAdd((volatile long *)&(counter), -(long)(value))
+#endif
+#define ATOMIC_LOAD(counter) (*(volatile size_t *)&(counter))
+#else
+#define ATOMIC_COUNTERS 0
+#define ATOMIC_ADD(counter, value) ((counter) += (value))
+#define ATOMIC_SUB(counter, value) ((counter) -= (value))
+#define ATOMIC_LOAD(counter) (counter)
+#endif
+
+static int current_allocator = PYROARING_ALLOCATOR_MALLOC;
+static size_t allocated_bytes = 0;
+static size_t allocated_blocks = 0;
+static size_t total_allocated_bytes = 0; /* never decreases, for the profiling */
+
+static void *raw_malloc(int allocator, size_t size) {
+#if PY_VERSION_HEX >= 0x03040000
+    if (allocator == PYROARING_ALLOCATOR_PYMEM) {
+        return PyMem_RawMalloc(size);
+    }
+#endif
+    return malloc(size);
+}
+
+static void *raw_realloc(int allocator, void *ptr, size_t size) {
+#if PY_VERSION_HEX >= 0x03040000
+    if (allocator == PYROARING_ALLOCATOR_PYMEM) {
+        return PyMem_RawRealloc(ptr, size);
+    }
+#endif
+    return realloc(ptr, size);
+}
+
+static void raw_free(int allocator, void *ptr) {
+#if PY_VERSION_HEX >= 0x03040000
+    if (allocator == PYROARING_ALLOCATOR_PYMEM) {
+        PyMem_RawFree(ptr);
+        return;
+    }
+#endif
+    free(ptr);
+}
+
+static block_header_t *get_header(void *ptr) {
+    return (block_header_t *)((char *)ptr - HEADER_SIZE);
+}
+
+/* Allocate a block aligned on the given power of two, or with the alignment of malloc if it is 0. */
+static void *allocate(size_t alignment, size_t size) {
+    int allocator = current_allocator;
+    size_t padding = alignment > 0 ? alignment - 1 : 0;
+    void *base;
+    uintptr_t start;
+    block_header_t *header;
+    if (size > SIZE_MAX - HEADER_SIZE - padding) {
+        return NULL;
+    }
+    base = raw_malloc(allocator, size + HEADER_SIZE + padding);
+    if (base == NULL) {
+        return NULL;
+    }
+    start = (uintptr_t)base + HEADER_SIZE;
+    if (alignment > 0) {
+        start = (start + padding) & ~((uintptr_t)alignment - 1);
+    }
+    header = get_header((void *)start);
+    header->size = size;
+    header->allocator = allocator;
+    header->offset = (uint32_t)(start - (uintptr_t)base);
+    ATOMIC_ADD(allocated_bytes, size);
+    ATOMIC_ADD(total_allocated_bytes, size);
+    ATOMIC_ADD(allocated_blocks, 1);
+    return (void *)start;
+}
+
+void *pyroaring_malloc(size_t size) {
+    return allocate(0, size);
+}
+
+void *pyroaring_calloc(size_t count, size_t size) {
+    void *ptr;
+    if (size != 0 && count > SIZE_MAX / size) {
+        return NULL;
+    }
+    ptr = allocate(0, count * size);
+    if (ptr != NULL) {
+        memset(ptr, 0, count * size);
+    }
+    return ptr;
+}
+
+void *pyroaring_realloc(void *ptr, size_t size) {
+    block_header_t *header;
+    void *base, *result;
+    size_t old_size;
+    if (ptr == NULL) {
+        return pyroaring_malloc(size);
+    }
+    header = get_header(ptr);
+    old_size = header->size;
+    if (header->offset == HEADER_SIZE) { /* not padded: resized by the allocator which allocated it */
+        if (size > SIZE_MAX - HEADER_SIZE) {
+            return NULL;
+        }
+        base = raw_realloc(header->allocator, header, size + HEADER_SIZE);
+        if (base == NULL) {
+            return NULL;
+        }
+        ((block_header_t *)base)->size = size;
+        ATOMIC_SUB(allocated_bytes, old_size);
+        ATOMIC_ADD(allocated_bytes, size);
+        if (size > old_size) {
+            ATOMIC_ADD(total_allocated_bytes, size - old_size);
+        }
+        return (char *)base + HEADER_SIZE;
+    }
+    result = pyroaring_malloc(size); /* realloc only guarantees the alignment of malloc */
+    if (result == NULL) {
+        return NULL;
+    }
+    memcpy(result, ptr, old_size < size ? old_size : size);
+    pyroaring_free(ptr);
+    return result;
+}
+
+void pyroaring_free(void *ptr) {
+    block_header_t *header;
+    if (ptr == NULL) {
+        return;
+    }
+    header = get_header(ptr);
+    ATOMIC_SUB(allocated_bytes, header->size);
+    ATOMIC_SUB(allocated_blocks, 1);
+    raw_free(header->allocator, (char *)ptr - header->offset);
+}
+
+int pyroaring_posix_memalign(void **ptr, size_t alignment, size_t size) {
+    void *result = NULL;
+    if (alignment <= HEADER_SIZE) { /* the alignment of malloc is usually enough, the block is then not padded */
+        result = allocate(0, size);
+        if (result == NULL) {
+            return ENOMEM;
+        }
+        if (((uintptr_t)result & (alignment - 1)) != 0) {
+            pyroaring_free(result);
+            result = NULL;
+        }
+    }
+    if (result == NULL) {
+        result = allocate(alignment, size);
+        if (result == NULL) {
+            return ENOMEM;
+        }
+    }
+    *ptr = result;
+    return 0;
+}
+
+void *pyroaring_aligned_malloc(size_t size, size_t alignment) {
+    void *result;
+    return pyroaring_posix_memalign(&result, alignment, size) == 0 ? result : NULL;
+}
+
+void pyroaring_aligned_free(void *ptr) {
+    pyroaring_free(ptr);
+}
+
+int pyroaring_set_allocator(int allocator) {
+    if (allocator == PYROARING_ALLOCATOR_MALLOC
+#if PY_VERSION_HEX >= 0x03040000
+            || allocator == PYROARING_ALLOCATOR_PYMEM
+#endif
+            ) {
+        current_allocator = allocator;
+        return 0;
+    }
+    return -1;
+}
+
+int pyroaring_get_allocator(void) {
+    return current_allocator;
+}
+
+size_t pyroaring_allocated_bytes(void) {
+    return ATOMIC_LOAD(allocated_bytes);
+}
+
+size_t pyroaring_allocated_blocks(void) {
+    return ATOMIC_LOAD(allocated_blocks);
+}
+
+size_t pyroaring_total_allocated_bytes(void) {
+    return ATOMIC_LOAD(total_allocated_bytes);
+}
+
+int pyroaring_atomic_counters(void) {
+    return ATOMIC_COUNTERS;
+}
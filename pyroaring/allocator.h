@@ -0,0 +1,46 @@
+/*
+ * Allocation functions used by CRoaring: amalgamation.py renames the calls to malloc, calloc, realloc, free and
+ * posix_memalign of the CRoaring sources into calls to these functions, as well as the calls to the aligned
+ * allocation functions of Windows (_aligned_malloc, _aligned_free and their MinGW versions).
+ */
+#ifndef PYROARING_ALLOCATOR_H
+#define PYROARING_ALLOCATOR_H
+
+#include <stddef.h>
+
+#ifdef __cplusplus
+extern "C" {
+#endif
+
+enum {
+    PYROARING_ALLOCATOR_MALLOC = 0, /* malloc and free of the C library */
+    PYROARING_ALLOCATOR_PYMEM = 1,  /* raw allocator of Python, visible to tracemalloc (Python >= 3.4) */
+};
+
+void *pyroaring_malloc(size_t size);
+void *pyroaring_calloc(size_t count, size_t size);
+void *pyroaring_realloc(void *ptr, size_t size);
+void pyroaring_free(void *ptr);
+int pyroaring_posix_memalign(void **ptr, size_t alignment, size_t size);
+void *pyroaring_aligned_malloc(size_t size, size_t alignment);
+void pyroaring_aligned_free(void *ptr);
+
+/* Select the allocator of the next allocations, return -1 if it is not available. */
+int pyroaring_set_allocator(int allocator);
+int pyroaring_get_allocator(void);
+
+/* Number of bytes and number of blocks currently allocated through these functions. */
+size_t pyroaring_allocated_bytes(void);
+size_t pyroaring_allocated_blocks(void);
+
+/* Number of bytes allocated through these functions since the start, released or not. */
+size_t pyroaring_total_allocated_bytes(void);
+
+/* 1 if the counters are updated atomically, so that several threads may allocate at the same time, 0 otherwise. */
+int pyroaring_atomic_counters(void);
+
+#ifdef __cplusplus
+}
+#endif
+
+#endif
@@ -0,0 +1,125 @@
+cdef extern from "allocator.h":
+    enum:
+        PYROARING_ALLOCATOR_MALLOC
+        PYROARING_ALLOCATOR_PYMEM
+    int pyroaring_set_allocator(int allocator)
+    int pyroaring_get_allocator()
+    size_t pyroaring_allocated_bytes()
+    size_t pyroaring_allocated_blocks()
+    size_t pyroaring_total_allocated_bytes()
+    int pyroaring_atomic_counters()
+
+cdef uint64_t memory_limit = 0 # 0 means no limit, checked by the operations allocating new containers
+
+allocator_names = {'malloc': PYROARING_ALLOCATOR_MALLOC, 'pymem': PYROARING_ALLOCATOR_PYMEM}
+
+def allocated_bytes():
+    """
+    Return the number of bytes currently allocated by CRoaring, for the bitmaps and their temporary buffers.
+
+    >>> before = allocated_bytes()
+    >>> bm = BitMap(range(0, 100000, 2))
+    >>> allocated_bytes() - before >= len(bm) // 8
+    True
+    """
+    return pyroaring_allocated_bytes()
+
+def allocated_blocks():
+    """
+    Return the number of memory blocks currently allocated by CRoaring.
+    """
+    return pyroaring_allocated_blocks()
+
+def set_allocator(name):
+    """
+    Select the allocator used by CRoaring for the next allocations: 'malloc' (default) for the C library, or 'pymem'
+    for the raw allocator of Python (Python 3.4 or later), whose allocations are traced by tracemalloc. Memory blocks
+    are always released by the allocator which allocated them.
+
+    >>> set_allocator('pymem')
+    >>> get_allocator()
+    'pymem'
+    >>> set_allocator('malloc')
+    """
+    if name not in allocator_names or pyroaring_set_allocator(allocator_names[name]) != 0:
+        raise ValueError('Unavailable allocator %r.' % (name,))
+
+def get_allocator():
+    """
+    Return the name of the allocator used by CRoaring.
+    """
+    allocator = pyroaring_get_allocator()
+    for name, value in allocator_names.items():
+        if value == allocator:
+            return name
+
+def set_memory_limit(limit):
+    """
+    Limit the number of bytes allocated by CRoaring, or remove the limit if it is None.
+
+    Before an operation building a new bitmap (binary operations and their in-place versions, union, intersection
+    and copy), an upper bound of its memory usage is compared with the remaining memory, and a MemoryError is raised
+    if it does not fit. The operation is then not started, so the process does not run out of memory in the middle of
+    it. The other operations are not checked.
+
+    >>> bm1, bm2 = BitMap(range(0, 2**20, 2)), BitMap(range(1, 2**20, 2)) # 128kB each
+    >>> set_memory_limit(allocated_bytes() + 2**17)
+    >>> try:
+    ...     bm1 | bm2
+    ... except MemoryError:
+    ...     print('not enough memory')
+    not enough memory
+    >>> set_memory_limit(None)
+    """
+    global memory_limit
+    if limit is None:
+        memory_limit = 0
+    elif limit <= 0:
+        raise ValueError('The memory limit must be positive.')
+    else:
+        memory_limit = limit
+
+def get_memory_limit():
+    """
+    Return the limit on the number of bytes allocated by CRoaring, or None if there is no limit.
+
+    >>> get_memory_limit() is None
+    True
+    """
+    return memory_limit if memory_limit != 0 else None
+
+cdef int check_memory(uint64_t n_bytes) except -1:
+    """Raise a MemoryError if allocating n_bytes more bytes would exceed the memory limit."""
+    if pyroaring_allocated_bytes() + n_bytes > memory_limit:
+        raise MemoryError('The operation needs up to %d bytes, which would exceed the memory limit.' % n_bytes)
+    return 0
+
+cdef uint64_t bitmap_memory_size(const croaring.roaring_bitmap_t *bitmap):
+    """
+    Return the number of bytes allocated for the bitmap (without the headers of the allocator): its arrays of keys,
+    containers and typecodes, and the structure and the allocated capacity of each container. A shared container is
+    counted in each bitmap sharing it.
+    """
+    cdef const croaring.roaring_array_t *ra = &bitmap.high_low_container
+    cdef uint64_t n_bytes = sizeof(croaring.roaring_bitmap_t) + \
+        <uint64_t>ra.allocation_size * (sizeof(void*) + sizeof(uint16_t) + sizeof(uint8_t))
+    cdef int32_t i = 0
+    cdef uint8_t typecode
+    cdef const void *container
+    while i < ra.size:
+        typecode = ra.typecodes[i]
+        container = croaring.container_unwrap_shared(ra.containers[i], &typecode)
+        if typecode == croaring.BITSET_CONTAINER_TYPE_CODE:
+            n_bytes += sizeof(croaring.bitset_container_t) + croaring.BITSET_CONTAINER_SIZE_IN_WORDS * sizeof(uint64_t)
+        elif typecode == croaring.ARRAY_CONTAINER_TYPE_CODE:
+            n_bytes += sizeof(croaring.array_container_t) + \
+                (<const croaring.array_container_t*>container).capacity * sizeof(uint16_t)
+        else:
+            n_bytes += sizeof(croaring.run_container_t) + \
+                (<const croaring.run_container_t*>container).capacity * sizeof(croaring.rle16_t)
+        i += 1
+    return n_bytes
+
+cdef int check_binary_op_memory(const croaring.roaring_bitmap_t *x1, const croaring.roaring_bitmap_t *x2) except -1:
+    """Check the memory needed by a binary operation, its result being at most as large as its two operands."""
+    return check_memory(bitmap_memory_size(x1) + bitmap_memory_size(x2))
@@ -0,0 +1,79 @@
+# Implementation of the functions declared in pyroaring.pxd, for the other Cython extensions.
+
+import os
+
+def get_include():
+    """
+    Return the directory holding pyroaring.pxd and the headers it needs, to be added to the include paths of Cython
+    and of the C compiler when building an extension which cimports pyroaring.
+
+    They are installed in the pyroaring_include directory, next to the module. When pyroaring is built in place, they
+    are found in the source directory instead.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    installed = os.path.join(directory, 'pyroaring_include')
+    if os.path.isdir(installed):
+        return installed
+    return os.path.join(directory, 'pyroaring')
+
+cdef AbstractBitMap bitmap_from_ptr(type cls, croaring.roaring_bitmap_t *ptr):
+    if not issubclass(cls, AbstractBitMap):
+        croaring.roaring_bitmap_free(ptr)
+        raise TypeError('Expected a subclass of AbstractBitMap, got %s.' % cls.__name__)
+    bitmap = cls.__new__(cls, no_init=True)
+    (<AbstractBitMap>bitmap)._c_bitmap = ptr
+    return bitmap
+
+cdef croaring.roaring_bitmap_t *bitmap_create() nogil:
+    return croaring.roaring_bitmap_create()
+
+cdef croaring.roaring_bitmap_t *bitmap_copy(const croaring.roaring_bitmap_t *ptr) nogil:
+    return croaring.roaring_bitmap_copy(ptr)
+
+cdef void bitmap_free(croaring.roaring_bitmap_t *ptr) nogil:
+    croaring.roaring_bitmap_free(ptr)
+
+cdef uint64_t bitmap_cardinality(const croaring.roaring_bitmap_t *ptr) nogil:
+    return croaring.roaring_bitmap_get_cardinality(ptr)
+
+cdef bool bitmap_contains(const croaring.roaring_bitmap_t *ptr, uint32_t value) nogil:
+    return croaring.roaring_bitmap_contains(ptr, value)
+
+cdef void bitmap_add(croaring.roaring_bitmap_t *ptr, uint32_t value) nogil:
+    croaring.roaring_bitmap_add(ptr, value)
+
+cdef void bitmap_add_many(croaring.roaring_bitmap_t *ptr, size_t count, const uint32_t *values) nogil:
+    croaring.roaring_bitmap_add_many(ptr, count, values)
+
+cdef void bitmap_remove(croaring.roaring_bitmap_t *ptr, uint32_t value) nogil:
+    croaring.roaring_bitmap_remove(ptr, value)
+
+cdef bool bitmap_select(const croaring.roaring_bitmap_t *ptr, uint64_t rank, uint32_t *element) nogil:
+    return croaring.roaring_bitmap_select(ptr, rank, element)
+
+cdef uint64_t bitmap_rank(const croaring.roaring_bitmap_t *ptr, uint32_t value) nogil:
+    return croaring.roaring_bitmap_rank(ptr, value)
+
+cdef void bitmap_to_array(const croaring.roaring_bitmap_t *ptr, uint32_t *values) nogil:
+    croaring.roaring_bitmap_to_uint32_array(ptr, values)
+
+cdef croaring.roaring_bitmap_t *bitmap_and(const croaring.roaring_bitmap_t *x1, const croaring.roaring_bitmap_t *x2) nogil:
+    return croaring.roaring_bitmap_and(x1, x2)
+
+cdef croaring.roaring_bitmap_t *bitmap_or(const croaring.roaring_bitmap_t *x1, const croaring.roaring_bitmap_t *x2) nogil:
+    return croaring.roaring_bitmap_or(x1, x2)
+
+cdef croaring.roaring_bitmap_t *bitmap_andnot(const croaring.roaring_bitmap_t *x1, const croaring.roaring_bitmap_t *x2) nogil:
+    return croaring.roaring_bitmap_andnot(x1, x2)
+
+cdef croaring.roaring_bitmap_t *bitmap_xor(const croaring.roaring_bitmap_t *x1, const croaring.roaring_bitmap_t *x2) nogil:
+    return croaring.roaring_bitmap_xor(x1, x2)
+
+cdef croaring.roaring_uint32_iterator_t *bitmap_iterator(const croaring.roaring_bitmap_t *ptr) nogil:
+    return croaring.roaring_create_iterator(ptr)
+
+cdef uint32_t bitmap_read(croaring.roaring_uint32_iterator_t *iterator, uint32_t *buff, uint32_t count) nogil:
+    return croaring.roaring_read_uint32_iterator(iterator, buff, count)
+
+cdef void bitmap_iterator_free(croaring.roaring_uint32_iterator_t *iterator) nogil:
+    croaring.roaring_free_uint32_iterator(iterator)
@@ -0,0 +1,290 @@
+cdef bool sorted_contains(const uint32_t *values, uint64_t size, uint32_t value):
+    """Binary search of the value in a sorted array."""
+    cdef uint64_t low = 0, high = size, middle
+    while low < high:
+        middle = (low + high) // 2
+        if values[middle] < value:
+            low = middle + 1
+        else:
+            high = middle
+    return low < size and values[low] == value
+
+cdef class BitMapArena:
+    """
+    A compact store for a large number of bitmaps, most of them small (e.g. posting lists).
+
+    The entries having at most max_small_size elements are stored as sorted arrays, one after the other, in a single
+    buffer: such an entry only costs 8 bytes in addition to 4 bytes per element, instead of a Python object, a roaring
+    bitmap and its containers. The larger entries are stored as frozen bitmaps.
+
+    >>> arena = BitMapArena()
+    >>> arena.append([3, 12])
+    0
+    >>> arena.append(range(0, 1000))
+    1
+    >>> arena[0]
+    FrozenBitMap([3, 12])
+    >>> arena.union([0, 1]) == BitMap(range(0, 1000))
+    True
+    """
+    cdef vector[uint32_t] _values   # elements of the small entries
+    cdef vector[uint64_t] _offsets  # the small entry i is _values[_offsets[i]:_offsets[i+1]]
+    cdef dict _large                # index -> FrozenBitMap, for the entries larger than _max_small_size
+    cdef uint32_t _max_small_size
+    cdef bool _copy_on_write
+
+    def __cinit__(self, entries=(), uint32_t max_small_size=64, copy_on_write=False):
+        self._offsets.push_back(0)
+        self._large = {}
+        self._max_small_size = max_small_size
+        self._copy_on_write = copy_on_write
+
+    def __init__(self, entries=(), uint32_t max_small_size=64, copy_on_write=False):
+        """
+        Construct an arena holding the given entries, whose entries with more than max_small_size elements are stored
+        as bitmaps. Copy on write is enabled on the bitmaps of the arena with copy_on_write.
+        """
+        self.extend(entries)
+
+    @property
+    def max_small_size(self):
+        """
+        The maximal number of elements of the entries stored as arrays.
+
+        >>> BitMapArena(max_small_size=16).max_small_size
+        16
+        """
+        return self._max_small_size
+
+    def __len__(self):
+        return self._offsets.size() - 1
+
+    cdef uint64_t _index(self, int64_t index) except? 0:
+        cdef int64_t size = self._offsets.size() - 1
+        if index < 0:
+            index += size
+        if index < 0 or index >= size:
+            raise IndexError('Index %d out of range for an arena of %d entries.' % (index, size))
+        return index
+
+    def append(self, values):
+        """
+        Add an entry holding the given values (a bitmap or an iterable of integers), return its index.
+
+        >>> arena = BitMapArena()
+        >>> arena.append(BitMap([3, 12]))
+        0
+        """
+        cdef AbstractBitMap bitmap
+        cdef uint64_t index = self._offsets.size() - 1, size, start
+        if isinstance(values, AbstractBitMap):
+            bitmap = values
+            if bitmap.copy_on_write != self._copy_on_write:
+                raise ValueError('Cannot have interactions between bitmaps with and without copy_on_write.\n')
+        else:
+            bitmap = AbstractBitMap(copy_on_write=self._copy_on_write, optimize=False)
+            or_values(bitmap._c_bitmap, uint32_view(values))
+        size = croaring.roaring_bitmap_get_cardinality(bitmap._c_bitmap)
+        if size <= self._max_small_size:
+            start = self._values.size()
+            self._values.resize(start + size)
+            if size > 0:
+                croaring.roaring_bitmap_to_uint32_array(bitmap._c_bitmap, &self._values[start])
+        else:
+            self._large[index] = FrozenBitMap(bitmap)
+        self._offsets.push_back(self._values.size())
+        return index
+
+    def extend(self, all_values):
+        """
+        Add an entry for each element of the given iterable.
+
+        >>> arena = BitMapArena([[3]])
+        >>> arena.extend([[5], [5, 12]])
+        >>> len(arena)
+        3
+        """
+        for values in all_values:
+            self.append(values)
+
+    def __getitem__(self, int64_t index):
+        cdef uint64_t i = self._index(index)
+        cdef croaring.roaring_bitmap_t *ptr
+        if self._offsets[i] == self._offsets[i+1]:
+            bitmap = self._large.get(i)
+            if bitmap is not None:
+                return bitmap
+            ptr = croaring.roaring_bitmap_create()
+        else:
+            ptr = croaring.roaring_bitmap_of_ptr(self._offsets[i+1] - self._offsets[i], &self._values[self._offsets[i]])
+        ptr.copy_on_write = self._copy_on_write
+        return (<AbstractBitMap>FrozenBitMap()).from_ptr(ptr)
+
+    def to_array(self, int64_t index):
+        """
+        Return the elements of the entry as an array.array, without building a bitmap for the small entries.
+
+        >>> BitMapArena([[3, 12]]).to_array(0)
+        array('I', [3, 12])
+        """
+        cdef uint64_t i = self._index(index)
+        cdef array.array result = array.array('I')
+        cdef uint64_t size = self._offsets[i+1] - self._offsets[i]
+        if i in self._large:
+            return self._large[i].to_array()
+        if size > 0:
+            array.resize(result, size)
+            memcpy(result.data.as_uints, &self._values[self._offsets[i]], size * sizeof(uint32_t))
+        return result
+
+    def cardinality(self, int64_t index):
+        """
+        Return the number of elements of the entry.
+
+        >>> BitMapArena([[3, 12]]).cardinality(-1)
+        2
+        """
+        cdef uint64_t i = self._index(index)
+        if i in self._large:
+            return len(self._large[i])
+        return self._offsets[i+1] - self._offsets[i]
+
+    def contains(self, int64_t index, uint32_t value):
+        """
+        Return True if and only if the entry contains the value.
+
+        >>> BitMapArena([[3, 12]]).contains(0, 12)
+        True
+        """
+        cdef uint64_t i = self._index(index)
+        if i in self._large:
+            return value in self._large[i]
+        if self._offsets[i+1] == self._offsets[i]:
+            return False
+        return sorted_contains(&self._values[self._offsets[i]], self._offsets[i+1] - self._offsets[i], value)
+
+    def union(self, indices=None, cls=BitMap):
+        """
+        Return the union of the given entries (all of them by default), as an instance of the given class.
+
+        The elements of the small entries are added all at once, the large entries are combined with in-place unions.
+
+        >>> BitMapArena([[3, 12], [5], [12, 18]]).union([0, 2])
+        BitMap([3, 12, 18])
+        """
+        cdef croaring.roaring_bitmap_t *result = croaring.roaring_bitmap_create()
+        cdef vector[uint32_t] values
+        cdef uint64_t i
+        result.copy_on_write = self._copy_on_write
+        if indices is None:
+            if self._values.size() > 0:
+                croaring.roaring_bitmap_add_many(result, self._values.size(), &self._values[0])
+            for bitmap in self._large.values():
+                croaring.roaring_bitmap_or_inplace(result, (<AbstractBitMap>bitmap)._c_bitmap)
+        else:
+            try:
+                for index in indices:
+                    i = self._index(index)
+                    if i in self._large:
+                        croaring.roaring_bitmap_or_inplace(result, (<AbstractBitMap>self._large[i])._c_bitmap)
+                    else:
+                        values.insert(values.end(), self._values.begin() + self._offsets[i],
+                                      self._values.begin() + self._offsets[i+1])
+            except:
+                croaring.roaring_bitmap_free(result)
+                raise
+            if values.size() > 0:
+                croaring.roaring_bitmap_add_many(result, values.size(), &values[0])
+        croaring.roaring_bitmap_run_optimize(result)
+        croaring.roaring_bitmap_shrink_to_fit(result)
+        return (<AbstractBitMap>cls()).from_ptr(result) # FIXME to change when from_ptr is a classmethod
+
+    def intersection(self, indices, cls=BitMap):
+        """
+        Return the intersection of the given entries, as an instance of the given class.
+
+        The elements of the smallest entry are looked up in the other ones, from the smallest to the largest, so
+        the cost depends on the size of the smallest entry.
+
+        >>> BitMapArena([[3, 5, 12], range(0, 1000, 3), [3, 12, 18]]).intersection([0, 1, 2])
+        BitMap([3, 12])
+        """
+        cdef vector[uint32_t] candidates
+        cdef uint64_t i, size, k, j, n_kept
+        cdef AbstractBitMap large
+        cdef croaring.roaring_bitmap_t *result
+        entries = sorted(set(self._index(index) for index in indices), key=self.cardinality)
+        if not entries:
+            return cls()
+        i = entries[0]
+        if i in self._large: # all the entries are large
+            return cls.intersection(*[self._large[index] for index in entries])
+        candidates.assign(self._values.begin() + self._offsets[i], self._values.begin() + self._offsets[i+1])
+        for i in entries[1:]:
+            if candidates.size() == 0:
+                break
+            n_kept = 0
+            if i in self._large:
+                large = self._large[i]
+                for k in range(candidates.size()):
+                    if croaring.roaring_bitmap_contains(large._c_bitmap, candidates[k]):
+                        candidates[n_kept] = candidates[k]
+                        n_kept += 1
+            else:
+                j = self._offsets[i]
+                for k in range(candidates.size()): # merge of two sorted arrays
+                    while j < self._offsets[i+1] and self._values[j] < candidates[k]:
+                        j += 1
+                    if j == self._offsets[i+1]:
+                        break
+                    if self._values[j] == candidates[k]:
+                        candidates[n_kept] = candidates[k]
+                        n_kept += 1
+            candidates.resize(n_kept)
+        result = croaring.roaring_bitmap_create()
+        result.copy_on_write = self._copy_on_write
+        if candidates.size() > 0:
+            croaring.roaring_bitmap_add_many(result, candidates.size(), &candidates[0])
+        return (<AbstractBitMap>cls()).from_ptr(result) # FIXME to change when from_ptr is a classmethod
+
+    def get_statistics(self):
+        """
+        Return a dictionary with the number of entries of the arena, the number of entries stored as bitmaps, the
+        number of elements of the small entries and the number of bytes used by the arena (excluding the Python
+        objects).
+
+        >>> stats = BitMapArena([[3, 12], range(1000)]).get_statistics()
+        >>> stats['n_entries'], stats['n_large_entries'], stats['n_small_values']
+        (2, 1, 2)
+        """
+        n_bytes = self._values.capacity() * sizeof(uint32_t) + self._offsets.capacity() * sizeof(uint64_t)
+        for bitmap in self._large.values():
+            n_bytes += croaring.roaring_bitmap_size_in_bytes((<AbstractBitMap>bitmap)._c_bitmap)
+        return {
+            'n_entries': len(self),
+            'n_large_entries': len(self._large),
+            'n_small_values': self._values.size(),
+            'n_bytes': n_bytes,
+        }
+
+    def __reduce__(self):
+        cdef array.array values = array.array('I')
+        cdef array.array offsets = array.array(uint64_typecode)
+        if self._values.size() > 0:
+            array.resize(values, self._values.size())
+            memcpy(values.data.as_uints, &self._values[0], self._values.size() * sizeof(uint32_t))
+        array.resize(offsets, self._offsets.size())
+        memcpy(offsets.data.as_voidptr, &self._offsets[0], self._offsets.size() * sizeof(uint64_t))
+        large = {index: bitmap.serialize() for index, bitmap in self._large.items()}
+        return (self.__class__, ((), self._max_small_size, self._copy_on_write), (values, offsets, large))
+
+    def __setstate__(self, state):
+        cdef array.array values, offsets
+        values, offsets, large = state
+        self._values.assign(values.data.as_uints, values.data.as_uints + len(values))
+        self._offsets.assign(<uint64_t*>offsets.data.as_voidptr, (<uint64_t*>offsets.data.as_voidptr) + len(offsets))
+        self._large = {}
+        for index, serialization in large.items():
+            bitmap = FrozenBitMap.deserialize(serialization)
+            (<AbstractBitMap>bitmap)._c_bitmap.copy_on_write = self._copy_on_write
+            self._large[index] = bitmap
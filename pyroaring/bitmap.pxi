@@ -1,4 +1,40 @@
 cdef class BitMap(AbstractBitMap):
+    cdef uint64_t _auto_optimize
+    cdef uint64_t _n_mutations
+
+    @property
+    def auto_optimize(self):
+        """
+        Number of mutations after which the bitmap is automatically optimized (see run_optimize and
+        shrink_to_fit), or 0 if this is disabled (default). Each call to a modifying method counts as one mutation.
+
+        >>> bm = BitMap()
+        >>> bm.auto_optimize = 1000
+        >>> for i in range(1000):
+        ...     bm.add(i)
+        >>> bm.get_statistics()['n_run_containers']
+        1
+        """
+        return self._auto_optimize
+
+    @auto_optimize.setter
+    def auto_optimize(self, uint64_t value):
+        self._auto_optimize = value
+        self._n_mutations = 0
+
+    cdef void _mutated(self):
+        if self._auto_optimize == 0:
+            return
+        self._n_mutations += 1
+        if self._n_mutations >= self._auto_optimize:
+            self._n_mutations = 0
+            croaring.roaring_bitmap_run_optimize(self._c_bitmap)
+            croaring.roaring_bitmap_shrink_to_fit(self._c_bitmap)
+
+    cdef binary_iop(self, AbstractBitMap other, (void)func(croaring.roaring_bitmap_t*, const croaring.roaring_bitmap_t*) nogil):
+        AbstractBitMap.binary_iop(self, other, func)
+        self._mutated()
+        return self
 
     cdef compute_hash(self):
         '''Unsupported method.'''
@@ -19,6 +55,7 @@ cdef class BitMap(AbstractBitMap):
         BitMap([42])
         """
         croaring.roaring_bitmap_add(self._c_bitmap, value)
+        self._mutated()
 
     def update(self, *all_values): # FIXME could be more efficient
         """
@@ -39,9 +76,33 @@ cdef class BitMap(AbstractBitMap):
             elif isinstance(values, array.array) and len(values) > 0:
                 buff = <array.array> values
                 croaring.roaring_bitmap_add_many(self._c_bitmap, len(values), &buff[0])
+                self._mutated()
             else:
                 buff_vect = values
                 croaring.roaring_bitmap_add_many(self._c_bitmap, len(values), &buff_vect[0])
+                self._mutated()
+
+    def lazy_update(self, *bitmaps):
+        """
+        Add all the elements of the given bitmaps.
+
+        It is equivalent to update, but the bitmaps are combined with the lazy union of CRoaring: the containers are
+        repaired only once, at the end, which is faster when there are many bitmaps.
+
+        >>> bm = BitMap([3, 12])
+        >>> bm.lazy_update(BitMap([8, 12]), BitMap([55]))
+        >>> bm
+        BitMap([3, 8, 12, 55])
+        """
+        cdef AbstractBitMap bitmap
+        for bitmap in bitmaps:
+            if bitmap.copy_on_write != self.copy_on_write:
+                raise ValueError('Cannot have interactions between bitmaps with and without copy_on_write.\n')
+        for bitmap in bitmaps:
+            if bitmap is not self:
+                croaring.roaring_bitmap_lazy_or_inplace(self._c_bitmap, bitmap._c_bitmap, True)
+        croaring.roaring_bitmap_repair_after_lazy(self._c_bitmap)
+        self._mutated()
 
     def discard(self, uint32_t value):
         """
@@ -56,6 +117,7 @@ cdef class BitMap(AbstractBitMap):
         BitMap([12])
         """
         croaring.roaring_bitmap_remove(self._c_bitmap, value)
+        self._mutated()
 
     def remove(self, uint32_t value):
         """
@@ -72,6 +134,7 @@ cdef class BitMap(AbstractBitMap):
         """
         if value in self:
             croaring.roaring_bitmap_remove(self._c_bitmap, value)
+            self._mutated()
         else:
             raise KeyError(value)
 
@@ -103,3 +166,4 @@ cdef class BitMap(AbstractBitMap):
         BitMap([3, 10, 11, 13, 14])
         """
         croaring.roaring_bitmap_flip_inplace(self._c_bitmap, start, end)
+        self._mutated()
@@ -0,0 +1,206 @@
+cdef class BitMapBuilder:
+    """
+    Build a bitmap incrementally, from values appended in (roughly) increasing order.
+
+    The values of the current 16-bit key are accumulated in an uncompressed buffer. When a greater key is
+    reached, the buffer is sealed into the most compact container (array, bitset or run), so the bitmap
+    returned by finish() is already optimized. Values smaller than the current key are still accepted, but
+    are slower to add.
+
+    >>> builder = BitMapBuilder()
+    >>> builder.add(3)
+    >>> builder.add_many([12, 18])
+    >>> builder.add_range(70000, 70003)
+    >>> builder.finish()
+    BitMap([3, 12, 18, 70000, 70001, 70002])
+    """
+    cdef croaring.roaring_bitmap_t *_c_bitmap
+    cdef croaring.bitset_container_t *_buffer
+    cdef int32_t _active_key # key of the values held in _buffer, -1 if the buffer is empty
+    cdef int32_t _last_key   # greatest key of the containers already sealed, -1 if there is none
+    cdef bool _needs_optimize
+    cdef bool _copy_on_write
+
+    def __cinit__(self, copy_on_write=False):
+        self._copy_on_write = copy_on_write
+        self._buffer = croaring.bitset_container_create()
+        if self._buffer is NULL:
+            raise MemoryError()
+        self._reset()
+
+    def __init__(self, copy_on_write=False):
+        """
+        Construct an empty builder. Copy on write is enabled on the resulting bitmaps with copy_on_write.
+        """
+
+    def __dealloc__(self):
+        if self._c_bitmap is not NULL:
+            croaring.roaring_bitmap_free(self._c_bitmap)
+        if self._buffer is not NULL:
+            croaring.bitset_container_free(self._buffer)
+
+    cdef _reset(self):
+        self._c_bitmap = croaring.roaring_bitmap_create()
+        self._c_bitmap.copy_on_write = self._copy_on_write
+        self._active_key = -1
+        self._last_key = -1
+        self._needs_optimize = False
+
+    cdef void _seal(self):
+        """Move the content of the buffer to a new container, converted to its most compact form."""
+        cdef void *container
+        cdef uint8_t typecode
+        if self._active_key < 0:
+            return
+        self._buffer.cardinality = croaring.bitset_container_compute_cardinality(self._buffer)
+        if self._buffer.cardinality > croaring.DEFAULT_MAX_SIZE:
+            container = self._buffer
+            typecode = croaring.BITSET_CONTAINER_TYPE_CODE
+            self._buffer = croaring.bitset_container_create()
+        else:
+            container = croaring.array_container_from_bitset(self._buffer)
+            typecode = croaring.ARRAY_CONTAINER_TYPE_CODE
+            croaring.bitset_container_clear(self._buffer)
+        container = croaring.convert_run_optimize(container, typecode, &typecode)
+        croaring.ra_append(&self._c_bitmap.high_low_container, self._active_key, container, typecode)
+        self._last_key = self._active_key
+        self._active_key = -1
+
+    cdef bool _activate(self, int32_t key):
+        """Make the given key the active one, return False if it is smaller than a key already seen."""
+        if key == self._active_key:
+            return True
+        if key <= self._last_key or key < self._active_key:
+            self._needs_optimize = True
+            return False
+        self._seal()
+        self._active_key = key
+        return True
+
+    cdef void _add(self, uint32_t value):
+        cdef uint16_t low = value & 0xFFFF
+        if self._activate(value >> 16):
+            self._buffer.array[low >> 6] |= (<uint64_t>1) << (low & 63)
+        else:
+            croaring.roaring_bitmap_add(self._c_bitmap, value)
+
+    cdef void _add_aligned_word(self, uint64_t position, uint64_t word):
+        """Add position + i for all the bits i set in the word, position being a multiple of 64."""
+        if word == 0:
+            return
+        if self._activate(position >> 16):
+            self._buffer.array[(position & 0xFFFF) >> 6] |= word
+        else:
+            while word != 0:
+                croaring.roaring_bitmap_add(self._c_bitmap, position + croaring.__builtin_ctzll(word))
+                word &= word - 1
+
+    cdef void _add_word(self, uint64_t position, uint64_t word):
+        """Add position + i for all the bits i set in the word."""
+        cdef uint64_t shift = position & 63
+        if shift == 0:
+            self._add_aligned_word(position, word)
+        else:
+            self._add_aligned_word(position - shift, word << shift)
+            self._add_aligned_word(position - shift + 64, word >> (64 - shift))
+
+    cdef void _add_range_in_key(self, uint32_t key, uint32_t start, uint32_t stop):
+        """Add all the integers of [start, stop) with the given key, with 0 <= start < stop <= 2**16."""
+        cdef croaring.roaring_bitmap_t *tmp
+        cdef uint64_t base = (<uint64_t>key) << 16
+        if key != self._active_key and start == 0 and stop == (1 << 16) and self._activate(key):
+            self._active_key = -1
+            croaring.ra_append(&self._c_bitmap.high_low_container, key,
+                               croaring.run_container_create_range(start, stop), croaring.RUN_CONTAINER_TYPE_CODE)
+            self._last_key = key
+        elif self._activate(key):
+            croaring.bitset_set_range(self._buffer.array, start, stop)
+        else:
+            tmp = croaring.roaring_bitmap_from_range(base + start, base + stop, 1)
+            croaring.roaring_bitmap_or_inplace(self._c_bitmap, tmp)
+            croaring.roaring_bitmap_free(tmp)
+
+    def add(self, uint32_t value):
+        """
+        Add an element to the bitmap being built.
+
+        >>> builder = BitMapBuilder()
+        >>> builder.add(42)
+        >>> builder.finish()
+        BitMap([42])
+        """
+        self._add(value)
+
+    def add_many(self, values):
+        """
+        Add all the given values to the bitmap being built.
+
+        >>> builder = BitMapBuilder()
+        >>> builder.add_many([3, 12])
+        >>> builder.add_many(array.array('I', [8, 55]))
+        >>> builder.finish()
+        BitMap([3, 8, 12, 55])
+        """
+        cdef vector[uint32_t] buff_vect
+        cdef unsigned[:] buff
+        cdef size_t i
+        if isinstance(values, AbstractBitMap):
+            if values.copy_on_write != self._copy_on_write:
+                raise ValueError('Cannot have interactions between bitmaps with and without copy_on_write.\n')
+            self._seal()
+            croaring.roaring_bitmap_or_inplace(self._c_bitmap, (<AbstractBitMap>values)._c_bitmap)
+            if self._c_bitmap.high_low_container.size > 0:
+                self._last_key = self._c_bitmap.high_low_container.keys[self._c_bitmap.high_low_container.size-1]
+            self._needs_optimize = True
+        elif isinstance(values, range):
+            _, (start, stop, step) = values.__reduce__()
+            if step == 1:
+                self.add_range(start, stop)
+            else:
+                self.add_many(AbstractBitMap(values, copy_on_write=self._copy_on_write, optimize=False))
+        elif isinstance(values, array.array):
+            if len(values) > 0:
+                buff = <array.array> values
+                for i in range(len(values)):
+                    self._add(buff[i])
+        else:
+            buff_vect = values
+            for i in range(buff_vect.size()):
+                self._add(buff_vect[i])
+
+    def add_range(self, uint64_t start, uint64_t stop):
+        """
+        Add all the integers of [start, stop) to the bitmap being built.
+
+        >>> builder = BitMapBuilder()
+        >>> builder.add_range(3, 8)
+        >>> builder.finish()
+        BitMap([3, 4, 5, 6, 7])
+        """
+        cdef uint64_t key, key_stop
+        if stop > 2**32:
+            raise OverflowError('The range must be included in [0, 2**32).')
+        while start < stop:
+            key = start >> 16
+            key_stop = min(stop, (key + 1) << 16)
+            self._add_range_in_key(key, start - (key << 16), key_stop - (key << 16))
+            start = key_stop
+
+    def finish(self, cls=BitMap):
+        """
+        Return the bitmap built so far, as an instance of the given class, and reset the builder.
+
+        >>> builder = BitMapBuilder()
+        >>> builder.add_range(0, 100)
+        >>> builder.finish(FrozenBitMap).get_statistics()['n_run_containers']
+        1
+        >>> builder.finish()
+        BitMap([])
+        """
+        self._seal()
+        cdef croaring.roaring_bitmap_t *result = self._c_bitmap
+        if self._needs_optimize:
+            croaring.roaring_bitmap_run_optimize(result)
+        croaring.roaring_bitmap_shrink_to_fit(result)
+        self._reset()
+        return (<AbstractBitMap>cls()).from_ptr(result) # FIXME to change when from_ptr is a classmethod
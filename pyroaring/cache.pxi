@@ -0,0 +1,188 @@
+import sys
+from collections import OrderedDict
+
+cdef class OpCache:
+    """
+    A least recently used cache for the results of operations on frozen bitmaps.
+
+    The entries are looked up with the hash of the operands, cached by the frozen bitmaps, and then by comparing the
+    operands, so equal bitmaps coming from different sources share the same entries. The results of commutative
+    operations do not depend on the order of the operands. The cache holds at most max_bytes bytes, counting the
+    memory of the results and of the operands kept by the entries.
+
+    >>> cache = OpCache(max_bytes=2**20)
+    >>> cache.intersection(FrozenBitMap([3, 12]), FrozenBitMap([3, 5, 8]))
+    FrozenBitMap([3])
+    >>> cache.intersection(FrozenBitMap([3, 5, 8]), FrozenBitMap([3, 12]))
+    FrozenBitMap([3])
+    >>> cache.stats()['hits']
+    1
+    """
+    cdef object _entries # (name, copy_on_write, operands...) -> (result, size), from the least to the most recently used
+    cdef uint64_t _max_bytes
+    cdef uint64_t _n_bytes
+    cdef uint64_t _hits, _misses, _evictions
+
+    def __init__(self, uint64_t max_bytes=64*2**20):
+        """
+        Construct an empty cache holding at most max_bytes bytes of results.
+        """
+        self._entries = OrderedDict()
+        self._max_bytes = max_bytes
+
+    @property
+    def max_bytes(self):
+        """
+        The maximal number of bytes of results held by the cache.
+
+        >>> OpCache(max_bytes=1024).max_bytes
+        1024
+        """
+        return self._max_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Return a dictionary with the number of hits, misses and evictions of the cache, and the number of entries
+        and bytes it holds.
+
+        >>> sorted(OpCache().stats().items())
+        [('evictions', 0), ('hits', 0), ('misses', 0), ('n_bytes', 0), ('n_entries', 0)]
+        """
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'evictions': self._evictions,
+            'n_entries': len(self._entries),
+            'n_bytes': self._n_bytes,
+        }
+
+    def clear(self):
+        """
+        Remove all the entries of the cache. The statistics are kept.
+        """
+        self._entries.clear()
+        self._n_bytes = 0
+
+    cdef tuple _key(self, str name, tuple bitmaps, bool commutative):
+        for bitmap in bitmaps:
+            if not isinstance(bitmap, FrozenBitMap):
+                raise TypeError('OpCache only accepts FrozenBitMap operands, got %s.' % type(bitmap).__name__)
+            if bitmap.copy_on_write != bitmaps[0].copy_on_write:
+                raise ValueError('Cannot have interactions between bitmaps with and without copy_on_write.\n')
+        if commutative:
+            bitmaps = tuple(sorted(bitmaps, key=hash))
+        return (name, len(bitmaps) > 0 and bitmaps[0].copy_on_write) + bitmaps
+
+    cdef _get(self, str name, tuple bitmaps, bool commutative, func):
+        """Return the cached result of func(*bitmaps), computing and storing it on a miss."""
+        key = self._key(name, bitmaps, commutative)
+        try:
+            entry = self._entries.pop(key)
+        except KeyError:
+            pass
+        else:
+            self._entries[key] = entry # most recently used
+            self._hits += 1
+            return entry[0]
+        self._misses += 1
+        result = func(*bitmaps)
+        size = 0
+        for bitmap in bitmaps: # the operands are kept alive by the key
+            size += bitmap_memory_size((<AbstractBitMap>bitmap)._c_bitmap)
+        if isinstance(result, AbstractBitMap):
+            size += bitmap_memory_size((<AbstractBitMap>result)._c_bitmap)
+        else:
+            size += sys.getsizeof(result)
+        if size <= self._max_bytes:
+            while self._n_bytes + size > self._max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._n_bytes -= evicted_size
+                self._evictions += 1
+            self._entries[key] = (result, size)
+            self._n_bytes += size
+        return result
+
+    def union(self, *bitmaps):
+        """
+        Return the union of the frozen bitmaps.
+
+        >>> OpCache().union(FrozenBitMap([3, 12]), FrozenBitMap([5]))
+        FrozenBitMap([3, 5, 12])
+        """
+        return self._get('union', bitmaps, True, FrozenBitMap.union)
+
+    def intersection(self, *bitmaps):
+        """
+        Return the intersection of the frozen bitmaps.
+
+        >>> OpCache().intersection(FrozenBitMap([3, 12]), FrozenBitMap([3, 5]))
+        FrozenBitMap([3])
+        """
+        return self._get('intersection', bitmaps, True, FrozenBitMap.intersection)
+
+    def difference(self, FrozenBitMap bitmap, FrozenBitMap other):
+        """
+        Return the elements of the first frozen bitmap that are not in the second one.
+
+        >>> OpCache().difference(FrozenBitMap([3, 12]), FrozenBitMap([3, 5]))
+        FrozenBitMap([12])
+        """
+        return self._get('difference', (bitmap, other), False, FrozenBitMap.__sub__)
+
+    def symmetric_difference(self, FrozenBitMap bitmap, FrozenBitMap other):
+        """
+        Return the elements that are in exactly one of the two frozen bitmaps.
+
+        >>> OpCache().symmetric_difference(FrozenBitMap([3, 12]), FrozenBitMap([3, 5]))
+        FrozenBitMap([5, 12])
+        """
+        return self._get('symmetric_difference', (bitmap, other), True, FrozenBitMap.__xor__)
+
+    def union_cardinality(self, FrozenBitMap bitmap, FrozenBitMap other):
+        """
+        Return the number of elements in the union of the two frozen bitmaps.
+
+        >>> OpCache().union_cardinality(FrozenBitMap([3, 12]), FrozenBitMap([3, 5]))
+        3
+        """
+        return self._get('union_cardinality', (bitmap, other), True, FrozenBitMap.union_cardinality)
+
+    def intersection_cardinality(self, FrozenBitMap bitmap, FrozenBitMap other):
+        """
+        Return the number of elements in the intersection of the two frozen bitmaps.
+
+        >>> OpCache().intersection_cardinality(FrozenBitMap([3, 12]), FrozenBitMap([3, 5]))
+        1
+        """
+        return self._get('intersection_cardinality', (bitmap, other), True, FrozenBitMap.intersection_cardinality)
+
+    def difference_cardinality(self, FrozenBitMap bitmap, FrozenBitMap other):
+        """
+        Return the number of elements of the first frozen bitmap that are not in the second one.
+
+        >>> OpCache().difference_cardinality(FrozenBitMap([3, 12]), FrozenBitMap([3, 5]))
+        1
+        """
+        return self._get('difference_cardinality', (bitmap, other), False, FrozenBitMap.difference_cardinality)
+
+    def symmetric_difference_cardinality(self, FrozenBitMap bitmap, FrozenBitMap other):
+        """
+        Return the number of elements that are in exactly one of the two frozen bitmaps.
+
+        >>> OpCache().symmetric_difference_cardinality(FrozenBitMap([3, 12]), FrozenBitMap([3, 5]))
+        2
+        """
+        return self._get('symmetric_difference_cardinality', (bitmap, other), True,
+                         FrozenBitMap.symmetric_difference_cardinality)
+
+    def jaccard_index(self, FrozenBitMap bitmap, FrozenBitMap other):
+        """
+        Return the Jaccard index of the two frozen bitmaps.
+
+        >>> OpCache().jaccard_index(FrozenBitMap([3, 12]), FrozenBitMap([3, 5]))
+        0.3333333333333333
+        """
+        return self._get('jaccard_index', (bitmap, other), True, FrozenBitMap.jaccard_index)
@@ -0,0 +1,168 @@
+import threading
+
+cdef class ConcurrentBitMap:
+    """
+    A bitmap shared between writer and reader threads.
+
+    The writers modify a private bitmap, under a lock, and publish a new version once they are done. The readers
+    never take the lock: they get the last published version as a FrozenBitMap, which stays consistent while the
+    writers carry on. The bitmaps use copy on write, so publishing a version only copies the list of containers, the
+    containers being shared until they are modified.
+
+    The readers being lock-free relies on the GIL: the reference counts of the shared containers are not atomic in
+    CRoaring, so the bitmaps must not be used from code running without the GIL.
+
+    The snapshots have copy_on_write enabled, and like any such bitmap they cannot be combined with bitmaps without
+    it: snapshot(copy_on_write=False) returns a copy which can. The bitmaps given to the modifying methods may have
+    either setting.
+
+    >>> bm = ConcurrentBitMap([3, 12])
+    >>> snapshot = bm.snapshot()
+    >>> with bm.batch() as writer:
+    ...     writer.add(5)
+    ...     writer.discard(12)
+    >>> snapshot, bm.snapshot()
+    (FrozenBitMap([3, 12]), FrozenBitMap([3, 5]))
+    """
+    cdef BitMap _bitmap
+    cdef FrozenBitMap _snapshot
+    cdef object _lock
+    cdef uint64_t _version
+    cdef uint64_t _batch_depth
+
+    def __init__(self, values=None):
+        """
+        Construct a concurrent bitmap, either empty or from an iterable, and publish its first version.
+        """
+        self._bitmap = BitMap(values, copy_on_write=True)
+        self._lock = threading.RLock()
+        self._publish()
+
+    cdef _publish(self):
+        self._snapshot = FrozenBitMap(self._bitmap, optimize=False) # replacing the reference is atomic
+        self._version += 1
+
+    cdef _rollback(self):
+        """Restore the private bitmap to the last published version, in place since the writers refer to it."""
+        self._bitmap &= self._snapshot
+        self._bitmap |= self._snapshot
+
+    @property
+    def version(self):
+        """
+        The number of versions published so far.
+
+        >>> bm = ConcurrentBitMap()
+        >>> bm.add(3)
+        >>> bm.version
+        2
+        """
+        return self._version
+
+    def snapshot(self, copy_on_write=True):
+        """
+        Return the last published version, as a FrozenBitMap. It is shared with the writers, and has copy_on_write
+        enabled; with copy_on_write=False, a copy without copy on write is returned instead, in time proportional to
+        the size of the bitmap.
+
+        >>> bm = ConcurrentBitMap([3, 12])
+        >>> bm.snapshot(copy_on_write=False) == FrozenBitMap([3, 12])
+        True
+        """
+        return with_copy_on_write(self._snapshot, copy_on_write)
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    def __contains__(self, uint32_t value):
+        return value in self._snapshot
+
+    def __iter__(self):
+        return iter(self._snapshot)
+
+    def batch(self):
+        """
+        Return a context manager giving the private BitMap of the writers, under the lock. The modifications are
+        published at the end of the outermost batch. If an exception is raised in a batch, the modifications made
+        since the last published version are discarded instead.
+
+        The BitMap given by the context manager must only be used inside the with block: it is modified by the other
+        writers once the lock is released, and is not a snapshot.
+
+        >>> bm = ConcurrentBitMap()
+        >>> with bm.batch() as writer:
+        ...     writer.update(range(3, 6))
+        ...     len(bm)
+        0
+        >>> len(bm)
+        3
+        >>> with bm.batch() as writer:
+        ...     writer.add(12)
+        ...     raise KeyError(12)
+        Traceback (most recent call last):
+        ...
+        KeyError: 12
+        >>> bm.snapshot()
+        FrozenBitMap([3, 4, 5])
+        """
+        return _Batch(self)
+
+    def add(self, uint32_t value):
+        """
+        Add an element and publish the new version.
+        """
+        with self.batch() as bitmap:
+            bitmap.add(value)
+
+    def discard(self, uint32_t value):
+        """
+        Remove an element if it is present and publish the new version.
+        """
+        with self.batch() as bitmap:
+            bitmap.discard(value)
+
+    def update(self, *all_values):
+        """
+        Add all the given values and publish the new version.
+        """
+        all_values = [with_copy_on_write(values, True) if isinstance(values, AbstractBitMap) else values
+                      for values in all_values]
+        with self.batch() as bitmap:
+            bitmap.update(*all_values)
+
+    def difference_update(self, values):
+        """
+        Remove all the given values and publish the new version.
+
+        >>> bm = ConcurrentBitMap([3, 5, 12])
+        >>> bm.difference_update([5, 12])
+        >>> bm.snapshot()
+        FrozenBitMap([3])
+        """
+        if isinstance(values, AbstractBitMap):
+            values = with_copy_on_write(values, True)
+        with self.batch() as bitmap:
+            bitmap -= values
+
+cdef class _Batch:
+    """Context manager returned by ConcurrentBitMap.batch."""
+    cdef ConcurrentBitMap _owner
+
+    def __cinit__(self, ConcurrentBitMap owner):
+        self._owner = owner
+
+    def __enter__(self):
+        self._owner._lock.acquire()
+        self._owner._batch_depth += 1
+        return self._owner._bitmap
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self._owner._batch_depth -= 1
+            if exc_type is not None:
+                self._owner._rollback()
+            elif self._owner._batch_depth == 0:
+                self._owner._publish()
+        finally:
+            self._owner._lock.release()
+        return False
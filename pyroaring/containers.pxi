@@ -0,0 +1,430 @@
+# Helpers working directly on the containers of a roaring bitmap.
+# The "low" values are the 16 least significant bits of the elements, the key of the container gives the other 16 bits.
+
+cimport croaring
+from libc.stdint cimport uint8_t, uint16_t, int32_t, uint32_t, uint64_t
+from libcpp cimport bool
+from libcpp.vector cimport vector
+from libc.string cimport memcpy
+
+container_type_names = {
+    croaring.BITSET_CONTAINER_TYPE_CODE: 'bitset',
+    croaring.ARRAY_CONTAINER_TYPE_CODE: 'array',
+    croaring.RUN_CONTAINER_TYPE_CODE: 'run',
+}
+
+cdef int32_t key_lower_bound(const croaring.roaring_array_t *ra, uint32_t key):
+    """Return the index of the first container whose key is greater or equal to the given key."""
+    cdef int32_t low = 0, high = ra.size, middle
+    while low < high:
+        middle = (low + high) >> 1
+        if ra.keys[middle] < key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+cdef uint32_t ra_cardinality(const croaring.roaring_array_t *ra, int32_t index):
+    """Return the cardinality of the container of the given index."""
+    cdef uint8_t typecode = ra.typecodes[index]
+    cdef const void *container = croaring.container_unwrap_shared(ra.containers[index], &typecode)
+    return croaring.container_get_cardinality(container, typecode)
+
+cdef int32_t array_lower_bound(const croaring.array_container_t *arr, uint32_t low):
+    """Return the index of the first value of the array container greater or equal to low."""
+    cdef int32_t start = 0, end = arr.cardinality, middle
+    while start < end:
+        middle = (start + end) >> 1
+        if arr.array[middle] < low:
+            start = middle + 1
+        else:
+            end = middle
+    return start
+
+cdef int32_t run_lower_bound(const croaring.run_container_t *run, uint32_t low):
+    """Return the index of the first run of the run container whose last value is greater or equal to low."""
+    cdef int32_t start = 0, end = run.n_runs, middle
+    while start < end:
+        middle = (start + end) >> 1
+        if <uint32_t>run.runs[middle].value + run.runs[middle].length < low:
+            start = middle + 1
+        else:
+            end = middle
+    return start
+
+cdef bool container_next_value(const void *container, uint8_t typecode, uint32_t low, uint32_t *result):
+    """Find the smallest value of the container greater or equal to low, return False if there is none."""
+    cdef const croaring.array_container_t *arr
+    cdef const croaring.run_container_t *run
+    cdef const uint64_t *words
+    cdef int32_t start
+    cdef uint32_t word_index
+    cdef uint64_t word
+    container = croaring.container_unwrap_shared(container, &typecode)
+    if typecode == croaring.ARRAY_CONTAINER_TYPE_CODE:
+        arr = <const croaring.array_container_t*>container
+        start = array_lower_bound(arr, low)
+        if start == arr.cardinality:
+            return False
+        result[0] = arr.array[start]
+        return True
+    elif typecode == croaring.RUN_CONTAINER_TYPE_CODE:
+        run = <const croaring.run_container_t*>container
+        start = run_lower_bound(run, low)
+        if start == run.n_runs:
+            return False
+        result[0] = max(low, run.runs[start].value)
+        return True
+    else:
+        words = (<const croaring.bitset_container_t*>container).array
+        word_index = low >> 6
+        word = words[word_index] & ((~(<uint64_t>0)) << (low & 63))
+        while word == 0:
+            word_index += 1
+            if word_index == croaring.BITSET_CONTAINER_SIZE_IN_WORDS:
+                return False
+            word = words[word_index]
+        result[0] = word_index * 64 + croaring.__builtin_ctzll(word)
+        return True
+
+cdef bool container_prev_value(const void *container, uint8_t typecode, uint32_t low, uint32_t *result):
+    """Find the largest value of the container lower or equal to low, return False if there is none."""
+    cdef const croaring.array_container_t *arr
+    cdef const croaring.run_container_t *run
+    cdef const uint64_t *words
+    cdef int32_t start, end, middle
+    cdef uint32_t word_index
+    cdef uint64_t word
+    container = croaring.container_unwrap_shared(container, &typecode)
+    if typecode == croaring.ARRAY_CONTAINER_TYPE_CODE:
+        arr = <const croaring.array_container_t*>container
+        start, end = 0, arr.cardinality
+        while start < end:
+            middle = (start + end) >> 1
+            if arr.array[middle] <= low:
+                start = middle + 1
+            else:
+                end = middle
+        if start == 0:
+            return False
+        result[0] = arr.array[start-1]
+        return True
+    elif typecode == croaring.RUN_CONTAINER_TYPE_CODE:
+        run = <const croaring.run_container_t*>container
+        start, end = 0, run.n_runs
+        while start < end: # first run whose first value is greater than low
+            middle = (start + end) >> 1
+            if run.runs[middle].value <= low:
+                start = middle + 1
+            else:
+                end = middle
+        if start == 0:
+            return False
+        result[0] = min(low, <uint32_t>run.runs[start-1].value + run.runs[start-1].length)
+        return True
+    else:
+        words = (<const croaring.bitset_container_t*>container).array
+        word_index = low >> 6
+        word = words[word_index] & ((~(<uint64_t>0)) >> (63 - (low & 63)))
+        while word == 0:
+            if word_index == 0:
+                return False
+            word_index -= 1
+            word = words[word_index]
+        result[0] = word_index * 64 + 63 - croaring.__builtin_clzll(word)
+        return True
+
+cdef void container_select_sorted(const void *container, uint8_t typecode, const uint64_t *ranks, size_t count,
+                                  uint64_t offset, uint32_t *result):
+    """
+    Write in result the low values of the elements of the container with the given ranks, minus offset. The ranks
+    are sorted in increasing order and are assumed to be lower than the container cardinality (plus offset).
+    """
+    cdef const croaring.array_container_t *arr
+    cdef const croaring.run_container_t *run
+    cdef const uint64_t *words
+    cdef size_t i
+    cdef uint32_t rank, position = 0, seen = 0, word_count
+    cdef uint64_t word
+    container = croaring.container_unwrap_shared(container, &typecode)
+    if typecode == croaring.ARRAY_CONTAINER_TYPE_CODE:
+        arr = <const croaring.array_container_t*>container
+        for i in range(count):
+            result[i] = arr.array[ranks[i] - offset]
+    elif typecode == croaring.RUN_CONTAINER_TYPE_CODE:
+        run = <const croaring.run_container_t*>container
+        for i in range(count): # position is the index of the current run, seen the number of elements before it
+            rank = ranks[i] - offset
+            while rank >= seen + run.runs[position].length + 1:
+                seen += run.runs[position].length + 1
+                position += 1
+            result[i] = run.runs[position].value + (rank - seen)
+    else:
+        words = (<const croaring.bitset_container_t*>container).array
+        for i in range(count): # position is the index of the current word, seen the number of elements before it
+            rank = ranks[i] - offset
+            word_count = croaring.__builtin_popcountll(words[position])
+            while rank >= seen + word_count:
+                seen += word_count
+                position += 1
+                word_count = croaring.__builtin_popcountll(words[position])
+            word = words[position]
+            for _ in range(rank - seen):
+                word &= word - 1
+            result[i] = position * 64 + croaring.__builtin_ctzll(word)
+
+# bit_index_masks[b] has the bits whose index has its b-th bit set, so that the sum of the indices of the bits set in
+# a word w is the sum of (popcount(w & bit_index_masks[b]) << b).
+cdef uint64_t[6] bit_index_masks
+bit_index_masks[:] = [0xAAAAAAAAAAAAAAAA, 0xCCCCCCCCCCCCCCCC, 0xF0F0F0F0F0F0F0F0,
+                      0xFF00FF00FF00FF00, 0xFFFF0000FFFF0000, 0xFFFFFFFF00000000]
+
+cdef uint64_t container_range_sum(const void *container, uint8_t typecode, uint32_t start, uint32_t stop,
+                                  uint64_t *count):
+    """
+    Return the sum of the low values of the container in [start, stop), with stop <= 2**16, and set count to their
+    number.
+    """
+    cdef const croaring.array_container_t *arr
+    cdef const croaring.run_container_t *run
+    cdef const uint64_t *words
+    cdef int32_t i
+    cdef uint32_t first, last, word_index
+    cdef uint64_t word, word_count, total = 0
+    count[0] = 0
+    if start >= stop:
+        return 0
+    container = croaring.container_unwrap_shared(container, &typecode)
+    if typecode == croaring.ARRAY_CONTAINER_TYPE_CODE:
+        arr = <const croaring.array_container_t*>container
+        i = array_lower_bound(arr, start)
+        while i < arr.cardinality and arr.array[i] < stop:
+            total += arr.array[i]
+            count[0] += 1
+            i += 1
+    elif typecode == croaring.RUN_CONTAINER_TYPE_CODE:
+        run = <const croaring.run_container_t*>container
+        i = run_lower_bound(run, start)
+        while i < run.n_runs and run.runs[i].value < stop:
+            first = max(start, run.runs[i].value)
+            last = min(stop - 1, <uint32_t>run.runs[i].value + run.runs[i].length)
+            total += (<uint64_t>first + last) * (last - first + 1) // 2
+            count[0] += last - first + 1
+            i += 1
+    else:
+        words = (<const croaring.bitset_container_t*>container).array
+        for word_index in range(start >> 6, ((stop - 1) >> 6) + 1):
+            word = words[word_index]
+            if word_index == start >> 6:
+                word &= (~(<uint64_t>0)) << (start & 63)
+            if word_index == (stop - 1) >> 6:
+                word &= (~(<uint64_t>0)) >> (63 - ((stop - 1) & 63))
+            word_count = croaring.__builtin_popcountll(word)
+            count[0] += word_count
+            total += word_index * 64 * word_count
+            for i in range(6):
+                total += (<uint64_t>croaring.__builtin_popcountll(word & bit_index_masks[i])) << i
+    return total
+
+cdef uint64_t container_range_cardinality(const void *container, uint8_t typecode, uint32_t start, uint32_t stop):
+    """Return the number of low values of the container in [start, stop), with stop <= 2**16."""
+    cdef const croaring.array_container_t *arr
+    cdef const croaring.run_container_t *run
+    cdef int32_t i
+    cdef uint64_t total = 0
+    if start >= stop:
+        return 0
+    container = croaring.container_unwrap_shared(container, &typecode)
+    if typecode == croaring.ARRAY_CONTAINER_TYPE_CODE:
+        arr = <const croaring.array_container_t*>container
+        return array_lower_bound(arr, stop) - array_lower_bound(arr, start)
+    elif typecode == croaring.RUN_CONTAINER_TYPE_CODE:
+        run = <const croaring.run_container_t*>container
+        i = run_lower_bound(run, start)
+        while i < run.n_runs and run.runs[i].value < stop:
+            total += min(stop - 1, <uint32_t>run.runs[i].value + run.runs[i].length) + 1 - max(start, run.runs[i].value)
+            i += 1
+        return total
+    else:
+        return croaring.bitset_range_cardinality(<uint64_t*>(<const croaring.bitset_container_t*>container).array, start, stop)
+
+cdef void container_to_words(const void *container, uint8_t typecode, uint64_t *words):
+    """Write the low values of the container in words, a zeroed bitset of BITSET_CONTAINER_SIZE_IN_WORDS words."""
+    cdef const croaring.array_container_t *arr
+    cdef const croaring.run_container_t *run
+    cdef int32_t i
+    container = croaring.container_unwrap_shared(container, &typecode)
+    if typecode == croaring.ARRAY_CONTAINER_TYPE_CODE:
+        arr = <const croaring.array_container_t*>container
+        croaring.bitset_set_list(words, arr.array, arr.cardinality)
+    elif typecode == croaring.RUN_CONTAINER_TYPE_CODE:
+        run = <const croaring.run_container_t*>container
+        for i in range(run.n_runs):
+            croaring.bitset_set_lenrange(words, run.runs[i].value, run.runs[i].length)
+    else:
+        memcpy(words, (<const croaring.bitset_container_t*>container).array,
+               croaring.BITSET_CONTAINER_SIZE_IN_WORDS * sizeof(uint64_t))
+
+cdef inline void append_interval(uint64_t start, uint64_t end, vector[uint64_t] &starts, vector[uint64_t] &ends):
+    """Append the interval [start, end) to starts and ends, merging it with the last interval if they are adjacent."""
+    if ends.size() > 0 and ends[ends.size() - 1] == start:
+        ends[ends.size() - 1] = end
+    else:
+        starts.push_back(start)
+        ends.push_back(end)
+
+cdef void container_intervals(const void *container, uint8_t typecode, uint64_t base, vector[uint64_t] &starts,
+                              vector[uint64_t] &ends):
+    """
+    Append to starts and ends the intervals [start, end) of consecutive elements of the container, its elements being
+    base plus its low values.
+    """
+    cdef const croaring.array_container_t *arr
+    cdef const croaring.run_container_t *run
+    cdef const uint64_t *words
+    cdef int32_t i
+    cdef uint64_t word, start, end
+    container = croaring.container_unwrap_shared(container, &typecode)
+    if typecode == croaring.ARRAY_CONTAINER_TYPE_CODE:
+        arr = <const croaring.array_container_t*>container
+        for i in range(arr.cardinality):
+            append_interval(base + arr.array[i], base + arr.array[i] + 1, starts, ends)
+    elif typecode == croaring.RUN_CONTAINER_TYPE_CODE:
+        run = <const croaring.run_container_t*>container
+        for i in range(run.n_runs):
+            append_interval(base + run.runs[i].value, base + run.runs[i].value + run.runs[i].length + 1, starts, ends)
+    else:
+        words = (<const croaring.bitset_container_t*>container).array
+        for i in range(croaring.BITSET_CONTAINER_SIZE_IN_WORDS):
+            word = words[i]
+            while word != 0:
+                start = croaring.__builtin_ctzll(word)
+                word |= ((<uint64_t>1) << start) - 1 # the run is now the lowest bits of the word
+                end = 64 if ~word == 0 else croaring.__builtin_ctzll(~word)
+                append_interval(base + 64 * i + start, base + 64 * i + end, starts, ends)
+                word = 0 if end == 64 else word & ~(((<uint64_t>1) << end) - 1)
+
+cdef uint64_t container_number_of_runs(const void *container, uint8_t typecode):
+    """Return the number of runs of consecutive low values of the container."""
+    cdef const croaring.array_container_t *arr
+    cdef const uint64_t *words
+    cdef int32_t i
+    cdef uint64_t total = 0, carry = 0
+    container = croaring.container_unwrap_shared(container, &typecode)
+    if typecode == croaring.ARRAY_CONTAINER_TYPE_CODE:
+        arr = <const croaring.array_container_t*>container
+        for i in range(arr.cardinality):
+            if i == 0 or arr.array[i] != arr.array[i-1] + 1:
+                total += 1
+        return total
+    elif typecode == croaring.RUN_CONTAINER_TYPE_CODE:
+        return (<const croaring.run_container_t*>container).n_runs
+    else:
+        words = (<const croaring.bitset_container_t*>container).array
+        for i in range(croaring.BITSET_CONTAINER_SIZE_IN_WORDS): # count the first bits of the runs
+            total += croaring.__builtin_popcountll(words[i] & ~((words[i] << 1) | carry))
+            carry = words[i] >> 63
+        return total
+
+cdef bool valid_container(const void *container, uint8_t typecode):
+    """
+    Return True if and only if the container (not shared) respects the invariants of CRoaring: non-empty, values or
+    runs sorted without duplicates, cardinality matching the content and the container type.
+    """
+    cdef const croaring.array_container_t *arr
+    cdef const croaring.run_container_t *run
+    cdef const croaring.bitset_container_t *bitset
+    cdef int32_t i
+    if typecode == croaring.ARRAY_CONTAINER_TYPE_CODE:
+        arr = <const croaring.array_container_t*>container
+        if not 0 < arr.cardinality <= croaring.DEFAULT_MAX_SIZE:
+            return False
+        for i in range(1, arr.cardinality):
+            if arr.array[i] <= arr.array[i-1]:
+                return False
+        return True
+    elif typecode == croaring.RUN_CONTAINER_TYPE_CODE:
+        run = <const croaring.run_container_t*>container
+        if run.n_runs <= 0:
+            return False
+        for i in range(run.n_runs):
+            if <uint32_t>run.runs[i].value + run.runs[i].length > 0xFFFF:
+                return False
+            if i > 0 and run.runs[i].value <= <uint32_t>run.runs[i-1].value + run.runs[i-1].length:
+                return False
+        return True
+    elif typecode == croaring.BITSET_CONTAINER_TYPE_CODE:
+        bitset = <const croaring.bitset_container_t*>container
+        return bitset.cardinality > croaring.DEFAULT_MAX_SIZE and \
+            bitset.cardinality == croaring.bitset_container_compute_cardinality(bitset)
+    return False
+
+cdef bool valid_bitmap(const croaring.roaring_bitmap_t *bitmap):
+    """Return True if and only if the keys of the bitmap are sorted without duplicates and its containers are valid."""
+    cdef const croaring.roaring_array_t *ra = &bitmap.high_low_container
+    cdef int32_t i
+    for i in range(ra.size):
+        if i > 0 and ra.keys[i] <= ra.keys[i-1]:
+            return False
+        if not valid_container(ra.containers[i], ra.typecodes[i]):
+            return False
+    return True
+
+cdef inline uint64_t hash_mix(uint64_t h):
+    """Finalizer of the SplitMix64 generator: a fast bijection of the 64 bits integers with a good avalanche effect."""
+    h = (h ^ (h >> 30)) * 0xbf58476d1ce4e5b9ULL
+    h = (h ^ (h >> 27)) * 0x94d049bb133111ebULL
+    return h ^ (h >> 31)
+
+cdef inline uint64_t hash_run(uint64_t h, uint64_t key, uint32_t start, uint32_t last):
+    return hash_mix(h ^ ((key << 32) | (start << 16) | last))
+
+cdef uint64_t container_hash(const void *container, uint8_t typecode, uint16_t key, uint64_t h):
+    """
+    Combine h with the maximal runs of consecutive values of the container.
+    The result only depends on the values of the container, not on its type.
+    """
+    cdef const croaring.array_container_t *arr
+    cdef const croaring.run_container_t *run
+    cdef const uint64_t *words
+    cdef int32_t i, word_index = 0
+    cdef uint32_t start, last
+    cdef uint64_t word, word_with_ones
+    container = croaring.container_unwrap_shared(container, &typecode)
+    if typecode == croaring.ARRAY_CONTAINER_TYPE_CODE:
+        arr = <const croaring.array_container_t*>container
+        start = last = arr.array[0]
+        for i in range(1, arr.cardinality):
+            if arr.array[i] != last + 1:
+                h = hash_run(h, key, start, last)
+                start = arr.array[i]
+            last = arr.array[i]
+        return hash_run(h, key, start, last)
+    elif typecode == croaring.RUN_CONTAINER_TYPE_CODE:
+        run = <const croaring.run_container_t*>container
+        start = run.runs[0].value
+        last = start + run.runs[0].length
+        for i in range(1, run.n_runs):
+            if run.runs[i].value != last + 1: # adjacent runs are merged
+                h = hash_run(h, key, start, last)
+                start = run.runs[i].value
+            last = <uint32_t>run.runs[i].value + run.runs[i].length
+        return hash_run(h, key, start, last)
+    else:
+        words = (<const croaring.bitset_container_t*>container).array
+        word = words[0]
+        while True:
+            while word == 0 and word_index < croaring.BITSET_CONTAINER_SIZE_IN_WORDS - 1:
+                word_index += 1
+                word = words[word_index]
+            if word == 0:
+                return h
+            start = 64 * word_index + croaring.__builtin_ctzll(word)
+            word_with_ones = word | (word - 1) # the bits below the start of the run are set
+            while word_with_ones == 0xFFFFFFFFFFFFFFFFULL and word_index < croaring.BITSET_CONTAINER_SIZE_IN_WORDS - 1:
+                word_index += 1
+                word_with_ones = words[word_index]
+            if word_with_ones == 0xFFFFFFFFFFFFFFFFULL:
+                return hash_run(h, key, start, 64 * word_index + 63)
+            h = hash_run(h, key, start, 64 * word_index + croaring.__builtin_ctzll(~word_with_ones) - 1)
+            word = word_with_ones & (word_with_ones + 1) # the bits of the run are cleared
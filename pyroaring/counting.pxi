@@ -0,0 +1,187 @@
+from libcpp.map cimport map as cpp_map
+from cython.operator cimport dereference, preincrement
+
+cdef class CountingBitMap:
+    """
+    Count, for each integer, how many of the added bitmaps contain it.
+
+    The counters are bit-sliced: for each 16-bit key, the i-th slice is a bitset holding the i-th bit of the counters
+    of the 65536 integers of the key. Adding a bitmap is a ripple-carry addition of its containers to the slices, and
+    the threshold queries are bitwise comparisons of the slices, so both run a word (64 integers) at a time. Each key
+    present in one of the bitmaps uses 8kB per slice, and there are log2(n) slices for n bitmaps.
+
+    >>> counter = CountingBitMap([BitMap([3, 12]), BitMap([3, 5]), BitMap([3, 5, 8])])
+    >>> counter.at_least(2)
+    BitMap([3, 5])
+    >>> counter.count(5)
+    2
+    """
+    cdef cpp_map[uint16_t, vector[uint64_t]] _slices # key -> slices of BITSET_CONTAINER_SIZE_IN_WORDS words
+    cdef uint64_t _n_bitmaps
+
+    def __init__(self, bitmaps=()):
+        """
+        Construct a counter, with the given bitmaps already added.
+        """
+        for bitmap in bitmaps:
+            self.add(bitmap)
+
+    @property
+    def n_bitmaps(self):
+        """
+        The number of bitmaps added to the counter.
+
+        >>> CountingBitMap([BitMap([3]), BitMap([3])]).n_bitmaps
+        2
+        """
+        return self._n_bitmaps
+
+    cdef void _add_words(self, uint16_t key, const uint64_t *words):
+        cdef vector[uint64_t] *slices = &self._slices[key]
+        cdef size_t n_words = croaring.BITSET_CONTAINER_SIZE_IN_WORDS
+        cdef size_t i, j
+        cdef uint64_t carry, word
+        for i in range(n_words):
+            carry = words[i]
+            j = i
+            while carry != 0:
+                if j >= slices.size():
+                    slices.resize(slices.size() + n_words, 0)
+                word = dereference(slices)[j]
+                dereference(slices)[j] = word ^ carry
+                carry &= word
+                j += n_words
+
+    def add(self, AbstractBitMap bitmap not None):
+        """
+        Increment the counters of the elements of the bitmap.
+
+        >>> counter = CountingBitMap()
+        >>> counter.add(BitMap([3, 12]))
+        >>> counter.count(12)
+        1
+        """
+        cdef const croaring.roaring_array_t *ra = &bitmap._c_bitmap.high_low_container
+        cdef vector[uint64_t] words
+        cdef int32_t i
+        words.resize(croaring.BITSET_CONTAINER_SIZE_IN_WORDS)
+        for i in range(ra.size):
+            memset(&words[0], 0, words.size() * sizeof(uint64_t))
+            container_to_words(ra.containers[i], ra.typecodes[i], &words[0])
+            self._add_words(ra.keys[i], &words[0])
+        self._n_bitmaps += 1
+
+    def update(self, *bitmaps):
+        """
+        Add all the given bitmaps to the counter.
+        """
+        for bitmap in bitmaps:
+            self.add(bitmap)
+
+    def count(self, uint32_t value):
+        """
+        Return the number of added bitmaps containing the value.
+
+        >>> CountingBitMap([BitMap([3, 12]), BitMap([3])]).count(3)
+        2
+        """
+        cdef cpp_map[uint16_t, vector[uint64_t]].iterator it = self._slices.find(value >> 16)
+        cdef size_t n_words = croaring.BITSET_CONTAINER_SIZE_IN_WORDS
+        cdef size_t index = (value & 0xFFFF) >> 6
+        cdef size_t j
+        cdef uint64_t result = 0
+        if it == self._slices.end():
+            return 0
+        for j in range(dereference(it).second.size() // n_words):
+            result |= ((dereference(it).second[j * n_words + index] >> (value & 63)) & 1) << j
+        return result
+
+    def at_least(self, uint64_t k, cls=BitMap):
+        """
+        Return the elements contained in at least k of the added bitmaps, as an instance of the given class.
+
+        >>> counter = CountingBitMap([BitMap(range(0, 10)), BitMap(range(5, 15)), BitMap(range(8, 20))])
+        >>> counter.at_least(3)
+        BitMap([8, 9])
+        >>> counter.at_least(1) == BitMap(range(0, 20))
+        True
+        """
+        if k == 0:
+            raise ValueError('The threshold must be positive.')
+        cdef croaring.roaring_bitmap_t *result = croaring.roaring_bitmap_create()
+        cdef cpp_map[uint16_t, vector[uint64_t]].iterator it = self._slices.begin()
+        cdef size_t n_words = croaring.BITSET_CONTAINER_SIZE_IN_WORDS
+        cdef const uint64_t *slices
+        cdef size_t n_slices, i
+        cdef Py_ssize_t j
+        cdef uint64_t greater, equal
+        cdef croaring.bitset_container_t *bitset
+        cdef void *container
+        cdef uint8_t typecode
+        while it != self._slices.end():
+            n_slices = dereference(it).second.size() // n_words
+            if n_slices >= 64 or (k >> n_slices) == 0: # otherwise k is larger than all the counters of the key
+                slices = &dereference(it).second[0]
+                bitset = croaring.bitset_container_create()
+                for i in range(n_words): # compare the counters with k, from their most significant bit
+                    greater = 0
+                    equal = ~(<uint64_t>0)
+                    for j in range(n_slices - 1, -1, -1):
+                        if (k >> j) & 1:
+                            equal &= slices[j * n_words + i]
+                        else:
+                            greater |= equal & slices[j * n_words + i]
+                            equal &= ~slices[j * n_words + i]
+                    bitset.array[i] = greater | equal
+                bitset.cardinality = croaring.bitset_container_compute_cardinality(bitset)
+                if bitset.cardinality == 0:
+                    croaring.bitset_container_free(bitset)
+                else:
+                    if bitset.cardinality > croaring.DEFAULT_MAX_SIZE:
+                        container = bitset
+                        typecode = croaring.BITSET_CONTAINER_TYPE_CODE
+                    else:
+                        container = croaring.array_container_from_bitset(bitset)
+                        typecode = croaring.ARRAY_CONTAINER_TYPE_CODE
+                        croaring.bitset_container_free(bitset)
+                    container = croaring.convert_run_optimize(container, typecode, &typecode)
+                    croaring.ra_append(&result.high_low_container, dereference(it).first, container, typecode)
+            preincrement(it)
+        return (<AbstractBitMap>cls()).from_ptr(result) # FIXME to change when from_ptr is a classmethod
+
+    def counts(self):
+        """
+        Return the counters of the elements contained in at least one of the added bitmaps, as an array in the
+        order of the elements.
+
+        >>> counter = CountingBitMap([BitMap([3, 12]), BitMap([3, 5])])
+        >>> list(counter.at_least(1)), list(counter.counts())
+        ([3, 5, 12], [2, 1, 1])
+        """
+        cdef cpp_map[uint16_t, vector[uint64_t]].iterator it = self._slices.begin()
+        cdef size_t n_words = croaring.BITSET_CONTAINER_SIZE_IN_WORDS
+        cdef const uint64_t *slices
+        cdef size_t n_slices, i, j, bit
+        cdef uint64_t present
+        cdef uint32_t count
+        cdef vector[uint32_t] result
+        while it != self._slices.end():
+            n_slices = dereference(it).second.size() // n_words
+            slices = &dereference(it).second[0]
+            for i in range(n_words):
+                present = 0
+                for j in range(n_slices):
+                    present |= slices[j * n_words + i]
+                while present != 0:
+                    bit = croaring.__builtin_ctzll(present)
+                    count = 0
+                    for j in range(n_slices):
+                        count |= ((slices[j * n_words + i] >> bit) & 1) << j
+                    result.push_back(count)
+                    present &= present - 1
+            preincrement(it)
+        cdef array.array counts = array.array('I')
+        if result.size() > 0:
+            array.resize(counts, result.size())
+            memcpy(counts.data.as_uints, &result[0], result.size() * sizeof(uint32_t))
+        return counts
@@ -1,9 +1,13 @@
-from libc.stdint cimport uint8_t, int32_t, uint32_t, uint64_t
+from libc.stdint cimport uint8_t, uint16_t, int32_t, uint32_t, uint64_t
 from libcpp cimport bool
 
-cdef extern from "roaring.h":
+cdef extern from "roaring.h" nogil:
     ctypedef struct roaring_array_t:
-        pass
+        int32_t size
+        int32_t allocation_size
+        void **containers
+        uint16_t *keys
+        uint8_t *typecodes
     ctypedef struct roaring_bitmap_t:
         roaring_array_t high_low_container
         bool copy_on_write
@@ -35,12 +39,13 @@ cdef extern from "roaring.h":
         uint64_t cardinality
 
     roaring_bitmap_t *roaring_bitmap_create()
+    roaring_bitmap_t *roaring_bitmap_create_with_capacity(uint32_t cap)
     void roaring_bitmap_add(roaring_bitmap_t *r, uint32_t x)
     void roaring_bitmap_add_many(roaring_bitmap_t *r, size_t n_args, const uint32_t *vals)
     void roaring_bitmap_remove(roaring_bitmap_t *r, uint32_t x)
     bool roaring_bitmap_contains(const roaring_bitmap_t *r, uint32_t val)
     roaring_bitmap_t *roaring_bitmap_copy(const roaring_bitmap_t *r)
-    roaring_bitmap_t *roaring_bitmap_from_range(uint32_t min, uint32_t max, uint32_t step)
+    roaring_bitmap_t *roaring_bitmap_from_range(uint64_t min, uint64_t max, uint32_t step)
     bool roaring_bitmap_run_optimize(roaring_bitmap_t *r)
     size_t roaring_bitmap_shrink_to_fit(roaring_bitmap_t *r)
     void roaring_bitmap_free(roaring_bitmap_t *r)
@@ -58,6 +63,9 @@ cdef extern from "roaring.h":
     void roaring_bitmap_and_inplace(roaring_bitmap_t *x1, const roaring_bitmap_t *x2)
     roaring_bitmap_t *roaring_bitmap_xor(const roaring_bitmap_t *x1, const roaring_bitmap_t *x2)
     void roaring_bitmap_xor_inplace(roaring_bitmap_t *x1, const roaring_bitmap_t *x2)
+    void roaring_bitmap_lazy_or_inplace(roaring_bitmap_t *x1, const roaring_bitmap_t *x2, const bool bitsetconversion)
+    void roaring_bitmap_lazy_xor_inplace(roaring_bitmap_t *x1, const roaring_bitmap_t *x2)
+    void roaring_bitmap_repair_after_lazy(roaring_bitmap_t *x1)
     roaring_bitmap_t *roaring_bitmap_andnot(const roaring_bitmap_t *x1, const roaring_bitmap_t *x2)
     void roaring_bitmap_andnot_inplace(roaring_bitmap_t *x1, const roaring_bitmap_t *x2)
     uint64_t roaring_bitmap_or_cardinality(const roaring_bitmap_t *x1, const roaring_bitmap_t *x2)
@@ -73,11 +81,61 @@ cdef extern from "roaring.h":
     void roaring_bitmap_flip_inplace(roaring_bitmap_t *x1, uint64_t range_start, uint64_t range_end)
     bool roaring_bitmap_select(const roaring_bitmap_t *r, uint32_t rank, uint32_t *element)
     void roaring_bitmap_statistics(const roaring_bitmap_t *r, roaring_statistics_t *stat)
+    size_t roaring_bitmap_size_in_bytes(const roaring_bitmap_t *ra)
     size_t roaring_bitmap_portable_size_in_bytes(const roaring_bitmap_t *ra)
     size_t roaring_bitmap_portable_serialize(const roaring_bitmap_t *ra, char *buf)
     roaring_bitmap_t *roaring_bitmap_portable_deserialize(const char *buf)
+    roaring_bitmap_t *roaring_bitmap_portable_deserialize_safe(const char *buf, size_t maxbytes)
     roaring_uint32_iterator_t *roaring_create_iterator(const roaring_bitmap_t *ra)
     bool roaring_advance_uint32_iterator(roaring_uint32_iterator_t *it)
     uint32_t roaring_read_uint32_iterator(roaring_uint32_iterator_t *it, uint32_t* buf, uint32_t count)
     bool roaring_move_uint32_iterator_equalorlarger(roaring_uint32_iterator_t *it, uint32_t val)
     void roaring_free_uint32_iterator(roaring_uint32_iterator_t *it)
+
+    # Container-level API, used to build or inspect bitmaps container by container.
+    enum:
+        BITSET_CONTAINER_TYPE_CODE
+        ARRAY_CONTAINER_TYPE_CODE
+        RUN_CONTAINER_TYPE_CODE
+        SHARED_CONTAINER_TYPE_CODE
+        DEFAULT_MAX_SIZE
+        BITSET_CONTAINER_SIZE_IN_WORDS
+    ctypedef struct array_container_t:
+        int32_t cardinality
+        int32_t capacity
+        uint16_t *array
+    ctypedef struct bitset_container_t:
+        int32_t cardinality
+        uint64_t *array
+    ctypedef struct rle16_t:
+        uint16_t value
+        uint16_t length
+    ctypedef struct run_container_t:
+        int32_t n_runs
+        int32_t capacity
+        rle16_t *runs
+
+    bitset_container_t *bitset_container_create()
+    void bitset_container_free(bitset_container_t *bitset)
+    void bitset_container_clear(bitset_container_t *bitset)
+    int bitset_container_compute_cardinality(const bitset_container_t *bitset)
+    void bitset_set_range(uint64_t *bitmap, uint32_t start, uint32_t end)
+    void bitset_set_lenrange(uint64_t *bitmap, uint32_t start, uint32_t lenminusone)
+    void bitset_set_list(void *bitset, const uint16_t *list, uint64_t length)
+    int bitset_range_cardinality(uint64_t *bitmap, uint32_t start, uint32_t end)
+    array_container_t *array_container_create_given_capacity(int32_t size)
+    array_container_t *array_container_from_bitset(const bitset_container_t *bits)
+    run_container_t *run_container_create_range(uint32_t start, uint32_t stop)
+    void *convert_run_optimize(void *c, uint8_t typecode_original, uint8_t *typecode_after)
+    void container_free(void *container, uint8_t typecode)
+    void *container_clone(const void *container, uint8_t typecode)
+    int __builtin_ctzll(unsigned long long input_num)
+    int __builtin_clzll(unsigned long long input_num)
+    int __builtin_popcountll(unsigned long long input_num)
+    const void *container_unwrap_shared(const void *candidate_shared_container, uint8_t *type)
+    uint16_t container_minimum(const void *container, uint8_t typecode)
+    uint16_t container_maximum(const void *container, uint8_t typecode)
+    int container_get_cardinality(const void *container, uint8_t typecode)
+    int32_t container_size_in_bytes(const void *container, uint8_t typecode)
+    void ra_append(roaring_array_t *ra, uint16_t s, void *c, uint8_t typecode)
+    void ra_append_copy(roaring_array_t *ra, const roaring_array_t *sa, uint16_t index, bool copy_on_write)
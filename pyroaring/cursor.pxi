@@ -0,0 +1,147 @@
+cdef class Cursor:
+    """
+    A cursor over the elements of a bitmap, in increasing order (or in decreasing order if reverse is True),
+    that can be moved to any position with seek.
+
+    The bitmap must not be modified while the cursor is used.
+
+    >>> cursor = Cursor(BitMap([3, 12, 18, 70000]))
+    >>> next(cursor)
+    3
+    >>> cursor.seek(13)
+    True
+    >>> cursor.next_block(10)
+    array('I', [18, 70000])
+    >>> cursor.has_value
+    False
+    >>> list(Cursor(BitMap([3, 12, 18, 70000]), reverse=True))
+    [70000, 18, 12, 3]
+    """
+    cdef AbstractBitMap _bitmap
+    cdef bool _reverse
+    # Forward cursors use the iterator of CRoaring.
+    cdef croaring.roaring_uint32_iterator_t *_iterator
+    # Reverse cursors keep track of the current element and of the index of its container.
+    cdef bool _has_value
+    cdef uint32_t _current
+    cdef int32_t _container_index
+
+    def __cinit__(self, AbstractBitMap bitmap, reverse=False):
+        self._bitmap = bitmap
+        self._reverse = reverse
+        if reverse:
+            self._container_index = bitmap._c_bitmap.high_low_container.size
+            self._move_to_container_maximum()
+        else:
+            self._iterator = croaring.roaring_create_iterator(bitmap._c_bitmap)
+
+    def __init__(self, AbstractBitMap bitmap, reverse=False):
+        """
+        Construct a cursor placed on the first element of the bitmap (or on its last element if reverse is True).
+        """
+
+    def __dealloc__(self):
+        if self._iterator is not NULL:
+            croaring.roaring_free_uint32_iterator(self._iterator)
+
+    cdef void _move_to_container_maximum(self):
+        """Move the reverse cursor to the maximum of the container preceding the current one."""
+        cdef croaring.roaring_array_t *ra = &self._bitmap._c_bitmap.high_low_container
+        self._container_index -= 1
+        self._has_value = self._container_index >= 0
+        if self._has_value:
+            self._current = ((<uint32_t>ra.keys[self._container_index]) << 16) | \
+                croaring.container_maximum(ra.containers[self._container_index], ra.typecodes[self._container_index])
+
+    cdef void _advance(self):
+        cdef croaring.roaring_array_t *ra
+        cdef uint32_t low
+        if not self._reverse:
+            croaring.roaring_advance_uint32_iterator(self._iterator)
+            return
+        ra = &self._bitmap._c_bitmap.high_low_container
+        if self._current & 0xFFFF and container_prev_value(ra.containers[self._container_index],
+                ra.typecodes[self._container_index], (self._current & 0xFFFF) - 1, &low):
+            self._current = (self._current & 0xFFFF0000) | low
+        else:
+            self._move_to_container_maximum()
+
+    @property
+    def has_value(self):
+        """True if and only if the cursor is placed on an element (i.e. the iteration is not over)."""
+        if self._reverse:
+            return self._has_value
+        return self._iterator.has_value
+
+    @property
+    def current(self):
+        """
+        The element on which the cursor is placed.
+
+        >>> Cursor(BitMap([3, 12]), reverse=True).current
+        12
+        """
+        if not self.has_value:
+            raise ValueError('The cursor has no current element.')
+        if self._reverse:
+            return self._current
+        return self._iterator.current_value
+
+    def seek(self, uint32_t value):
+        """
+        Move the cursor to the smallest element greater or equal to the given value (or to the largest element lower
+        or equal to the given value if the cursor is reversed). Return True if and only if there is such an element.
+
+        >>> cursor = Cursor(BitMap([3, 12, 18]), reverse=True)
+        >>> cursor.seek(17)
+        True
+        >>> list(cursor)
+        [12, 3]
+        """
+        cdef croaring.roaring_array_t *ra
+        cdef uint32_t low
+        if not self._reverse:
+            return croaring.roaring_move_uint32_iterator_equalorlarger(self._iterator, value)
+        ra = &self._bitmap._c_bitmap.high_low_container
+        self._container_index = key_lower_bound(ra, value >> 16)
+        if self._container_index < ra.size and ra.keys[self._container_index] == value >> 16 and \
+                container_prev_value(ra.containers[self._container_index], ra.typecodes[self._container_index],
+                                     value & 0xFFFF, &low):
+            self._current = (value & 0xFFFF0000) | low
+            self._has_value = True
+        else:
+            self._move_to_container_maximum()
+        return self._has_value
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.has_value:
+            raise StopIteration()
+        value = self.current
+        self._advance()
+        return value
+
+    def next_block(self, uint32_t size):
+        """
+        Return an array.array containing the (at most) size next elements, and move the cursor after them.
+
+        >>> cursor = Cursor(BitMap([3, 12, 18]), reverse=True)
+        >>> cursor.next_block(2)
+        array('I', [18, 12])
+        """
+        cdef array.array result = array.array('I')
+        cdef uint32_t count = 0
+        size = min(size, self._bitmap._cardinality()) # the array is not allocated for more elements than the bitmap has
+        array.resize(result, size)
+        if not self._reverse:
+            if size > 0:
+                count = croaring.roaring_read_uint32_iterator(self._iterator, result.data.as_uints, size)
+        else:
+            while count < size and self._has_value:
+                result.data.as_uints[count] = self._current
+                count += 1
+                self._advance()
+        array.resize(result, count)
+        return result
@@ -0,0 +1,202 @@
+import struct
+
+delta_header = struct.Struct('<4I') # sizes of the serializations of added, removed, replaced_keys and replaced
+
+cdef class BitMapDelta:
+    """
+    The changes between two versions of a bitmap, as computed by diff and applied by apply_delta.
+
+    The changes are stored per container. For a container with few changes, the delta holds the added and the removed
+    values. For a container with more changes than values in its new version, the delta holds its key and its new
+    version, which replaces the old one.
+
+    >>> delta = diff(BitMap([3, 5, 12]), BitMap([3, 12, 18]))
+    >>> delta.added, delta.removed
+    (FrozenBitMap([18]), FrozenBitMap([5]))
+    """
+    cdef FrozenBitMap _added
+    cdef FrozenBitMap _removed
+    cdef FrozenBitMap _replaced_keys
+    cdef FrozenBitMap _replaced
+
+    def __init__(self, FrozenBitMap added not None, FrozenBitMap removed not None,
+                 FrozenBitMap replaced_keys not None, FrozenBitMap replaced not None):
+        """
+        Construct a delta from its parts, which must all have the same copy on write setting.
+        """
+        for bitmap in (removed, replaced_keys, replaced):
+            if bitmap.copy_on_write != added.copy_on_write:
+                raise ValueError('Cannot have interactions between bitmaps with and without copy_on_write.\n')
+        if len(replaced_keys) > 0 and replaced_keys.max() >= 2**16:
+            raise ValueError('The replaced keys must be smaller than 2**16.')
+        self._added = added
+        self._removed = removed
+        self._replaced_keys = replaced_keys
+        self._replaced = replaced
+
+    @property
+    def added(self):
+        """
+        The values added to the containers which are not replaced.
+        """
+        return self._added
+
+    @property
+    def removed(self):
+        """
+        The values removed from the containers which are not replaced.
+        """
+        return self._removed
+
+    @property
+    def replaced_keys(self):
+        """
+        The keys (values divided by 2**16) of the replaced containers.
+        """
+        return self._replaced_keys
+
+    @property
+    def replaced(self):
+        """
+        The new values of the replaced containers.
+        """
+        return self._replaced
+
+    @property
+    def copy_on_write(self):
+        """
+        True if and only if the delta applies to bitmaps with copy on write.
+        """
+        return self._added.copy_on_write
+
+    def __reduce__(self):
+        return (BitMapDelta, (self._added, self._removed, self._replaced_keys, self._replaced), self.copy_on_write)
+
+    def __setstate__(self, copy_on_write):
+        cdef FrozenBitMap bitmap
+        for bitmap in (self._added, self._removed, self._replaced_keys, self._replaced):
+            bitmap._c_bitmap.copy_on_write = copy_on_write # the pickled bitmaps do not keep this setting
+
+    def serialize(self):
+        """
+        Return the serialization of the delta. See BitMapDelta.deserialize for the reverse operation.
+
+        >>> delta = diff(BitMap([3, 5, 12]), BitMap([3, 12, 18]))
+        >>> BitMapDelta.deserialize(delta.serialize()).added
+        FrozenBitMap([18])
+        """
+        parts = [bitmap.serialize() for bitmap in (self._added, self._removed, self._replaced_keys, self._replaced)]
+        return delta_header.pack(*[len(part) for part in parts]) + b''.join(parts)
+
+    @classmethod
+    def deserialize(cls, buff, copy_on_write=False):
+        """
+        Generate a delta from the given serialization, for bitmaps with or without copy on write. The serialization
+        is validated (sizes, and the keys and the content of every container), so it may come from an untrusted
+        source.
+        """
+        cdef const uint8_t[:] data = buff
+        cdef size_t offset = delta_header.size
+        cdef size_t size
+        cdef croaring.roaring_bitmap_t *ptr
+        cdef FrozenBitMap template = FrozenBitMap()
+        if data.shape[0] < delta_header.size:
+            raise ValueError('Invalid delta serialization.')
+        parts = []
+        for size in delta_header.unpack(bytes(buff[:delta_header.size])):
+            if offset + size > <size_t>data.shape[0]:
+                raise ValueError('Invalid delta serialization.')
+            ptr = croaring.roaring_bitmap_portable_deserialize_safe(<const char*>&data[0] + offset, size) \
+                if size > 0 else NULL
+            if ptr is NULL:
+                raise ValueError('Invalid delta serialization.')
+            if not valid_bitmap(ptr): # deserialize_safe only checks that the reads stay within the buffer
+                croaring.roaring_bitmap_free(ptr)
+                raise ValueError('Invalid delta serialization.')
+            ptr.copy_on_write = copy_on_write
+            parts.append(template.from_ptr(ptr))
+            offset += size
+        if offset != <size_t>data.shape[0]:
+            raise ValueError('Invalid delta serialization.')
+        return cls(*parts)
+
+def diff(AbstractBitMap old not None, AbstractBitMap new not None):
+    """
+    Return the BitMapDelta transforming old into new, see apply_delta.
+
+    Its size and the time to apply it are proportional to the number of changes, not to the size of the bitmaps.
+
+    >>> old = BitMap(range(0, 100000, 2))
+    >>> new = BitMap(old)
+    >>> new.update([3, 99999])
+    >>> delta = diff(old, new)
+    >>> len(delta.serialize()) < len(new.serialize()) // 100
+    True
+    >>> apply_delta(old, delta)
+    >>> old == new
+    True
+    """
+    if old.copy_on_write != new.copy_on_write:
+        raise ValueError('Cannot have interactions between bitmaps with and without copy_on_write.\n')
+    cdef bool copy_on_write = old.copy_on_write
+    cdef croaring.roaring_bitmap_t *added = croaring.roaring_bitmap_andnot(new._c_bitmap, old._c_bitmap)
+    cdef croaring.roaring_bitmap_t *removed = croaring.roaring_bitmap_andnot(old._c_bitmap, new._c_bitmap)
+    cdef const croaring.roaring_array_t *ra_added = &added.high_low_container
+    cdef const croaring.roaring_array_t *ra_removed = &removed.high_low_container
+    cdef const croaring.roaring_array_t *ra_new = &new._c_bitmap.high_low_container
+    cdef FrozenBitMap result_added = FrozenBitMap(copy_on_write=copy_on_write) # filled before being exposed
+    cdef FrozenBitMap result_removed = FrozenBitMap(copy_on_write=copy_on_write)
+    cdef FrozenBitMap replaced = FrozenBitMap(copy_on_write=copy_on_write)
+    cdef vector[uint32_t] replaced_keys
+    cdef int32_t i = 0, j = 0, k = 0
+    cdef uint32_t key, n_changes, n_new
+    cdef bool in_added, in_removed
+    while i < ra_added.size or j < ra_removed.size:
+        key = min(ra_added.keys[i] if i < ra_added.size else 2**16, ra_removed.keys[j] if j < ra_removed.size else 2**16)
+        in_added = i < ra_added.size and ra_added.keys[i] == key
+        in_removed = j < ra_removed.size and ra_removed.keys[j] == key
+        n_changes = (ra_cardinality(ra_added, i) if in_added else 0) + (ra_cardinality(ra_removed, j) if in_removed else 0)
+        while k < ra_new.size and ra_new.keys[k] < key:
+            k += 1
+        n_new = ra_cardinality(ra_new, k) if k < ra_new.size and ra_new.keys[k] == key else 0
+        if n_new < n_changes: # cheaper to send the new container than the changes
+            replaced_keys.push_back(key)
+            if n_new > 0:
+                croaring.ra_append_copy(&replaced._c_bitmap.high_low_container, ra_new, k, copy_on_write)
+        else:
+            if in_added:
+                croaring.ra_append_copy(&result_added._c_bitmap.high_low_container, ra_added, i, copy_on_write)
+            if in_removed:
+                croaring.ra_append_copy(&result_removed._c_bitmap.high_low_container, ra_removed, j, copy_on_write)
+        if in_added:
+            i += 1
+        if in_removed:
+            j += 1
+    croaring.roaring_bitmap_free(added)
+    croaring.roaring_bitmap_free(removed)
+    return BitMapDelta(result_added, result_removed, FrozenBitMap(replaced_keys, copy_on_write=copy_on_write), replaced)
+
+def apply_delta(BitMap bitmap not None, BitMapDelta delta not None):
+    """
+    Apply in place to the bitmap the changes of a delta computed by diff.
+
+    >>> bm = BitMap([3, 5, 12])
+    >>> apply_delta(bm, diff(BitMap([3, 5, 12]), BitMap([3, 12, 18])))
+    >>> bm
+    BitMap([3, 12, 18])
+    """
+    if bitmap.copy_on_write != delta.copy_on_write:
+        raise ValueError('Cannot have interactions between bitmaps with and without copy_on_write.\n')
+    cdef croaring.roaring_bitmap_t *mask
+    cdef uint32_t key
+    if len(delta._replaced_keys) > 0:
+        mask = croaring.roaring_bitmap_create()
+        for key in delta._replaced_keys:
+            croaring.ra_append(&mask.high_low_container, key, croaring.run_container_create_range(0, 2**16),
+                               croaring.RUN_CONTAINER_TYPE_CODE)
+        croaring.roaring_bitmap_andnot_inplace(bitmap._c_bitmap, mask)
+        croaring.roaring_bitmap_free(mask)
+        croaring.roaring_bitmap_or_inplace(bitmap._c_bitmap, delta._replaced._c_bitmap)
+    croaring.roaring_bitmap_andnot_inplace(bitmap._c_bitmap, delta._removed._c_bitmap)
+    croaring.roaring_bitmap_or_inplace(bitmap._c_bitmap, delta._added._c_bitmap)
+    bitmap._mutated()
@@ -1,4 +1,58 @@
 cdef class FrozenBitMap(AbstractBitMap):
+    cdef object __weakref__
+    cdef int64_t _cached_cardinality # -1 until computed
+    cdef vector[uint64_t] _rank_index # number of elements before each container (and in total), built lazily
+
+    def __cinit__(self, *args, **kwargs):
+        self._cached_cardinality = -1
+
+    cdef uint64_t _cardinality(self):
+        if self._cached_cardinality < 0:
+            self._cached_cardinality = croaring.roaring_bitmap_get_cardinality(self._c_bitmap)
+        return self._cached_cardinality
+
+    cdef void _build_rank_index(self):
+        """
+        Build the cumulative cardinalities of the containers, so that the positional accesses (select, rank, indexing
+        and slicing) are binary searches instead of linear scans of the containers.
+        """
+        cdef const croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef int32_t i
+        if self._rank_index.size() > 0:
+            return
+        self._rank_index.reserve(ra.size + 1)
+        self._rank_index.push_back(0)
+        for i in range(ra.size):
+            self._rank_index.push_back(self._rank_index.back() + ra_cardinality(ra, i))
+        self._cached_cardinality = self._rank_index.back()
+
+    cdef bool _select(self, uint64_t rank, uint32_t *element):
+        cdef const croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef int32_t low = 0, high, middle
+        self._build_rank_index()
+        if rank >= self._rank_index.back():
+            return False
+        high = ra.size - 1
+        while low < high: # last container whose first element has a rank lower or equal to the given one
+            middle = (low + high + 1) >> 1
+            if self._rank_index[middle] <= rank:
+                low = middle
+            else:
+                high = middle - 1
+        container_select_sorted(ra.containers[low], ra.typecodes[low], &rank, 1, self._rank_index[low], element)
+        element[0] |= (<uint32_t>ra.keys[low]) << 16
+        return True
+
+    cdef uint64_t _rank(self, uint32_t value):
+        cdef const croaring.roaring_array_t *ra = &self._c_bitmap.high_low_container
+        cdef uint32_t key = value >> 16
+        cdef int32_t i
+        self._build_rank_index()
+        i = key_lower_bound(ra, key)
+        if i == ra.size or ra.keys[i] != key:
+            return self._rank_index[i]
+        return self._rank_index[i] + container_range_cardinality(ra.containers[i], ra.typecodes[i], 0,
+                                                                 (value & 0xFFFF) + 1)
 
     def __ior__(self, other):
         '''Unsupported method.'''
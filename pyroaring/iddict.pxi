@@ -0,0 +1,186 @@
+from cpython.unicode cimport PyUnicode_DecodeUTF8
+
+cdef enum:
+    KEY_OBJECT = 0 # any other hashable key, kept as a Python object
+    KEY_UNICODE = 1
+    KEY_BYTES = 2
+    KEY_INT = 3    # kept in decimal
+
+cdef class IdDictionary:
+    """
+    A dictionary assigning dense 32 bits identifiers to arbitrary hashable keys (strings, bytes, UUIDs, large
+    integers...), so that sets of keys can be stored as bitmaps.
+
+    The identifiers are assigned in increasing order from 0, the i-th new key getting the identifier i. Keeping them
+    dense keeps the bitmaps small, as the identifiers of keys encoded together end up in bitset or run containers.
+    The dictionary can be pickled, to be stored alongside the serialized bitmaps.
+
+    The keys are decoded from a reverse table holding the strings, bytes and integers in a single buffer, with an
+    array of offsets and an array of types, instead of a Python object per identifier. The other keys are kept as
+    Python objects.
+
+    >>> ids = IdDictionary()
+    >>> ids.encode_many(['foo', 'bar', 'foo', 'baz'])
+    array('I', [0, 1, 0, 2])
+    >>> ids.decode_bitmap(BitMap([0, 2]))
+    ['foo', 'baz']
+    """
+    cdef dict _ids                # key -> identifier
+    cdef bytearray _buffer        # encoded keys, the key i being _buffer[_offsets[i]:_offsets[i+1]]
+    cdef vector[uint64_t] _offsets
+    cdef vector[uint8_t] _types   # identifier -> KEY_* constant
+    cdef dict _objects            # identifier -> key, for the KEY_OBJECT keys
+
+    def __init__(self, keys=()):
+        """
+        Construct a dictionary, assigning identifiers to the given keys in order.
+        """
+        self._ids = {}
+        self._buffer = bytearray()
+        self._offsets.push_back(0)
+        self._objects = {}
+        self.encode_many(keys)
+
+    def __len__(self):
+        return self._types.size()
+
+    def __contains__(self, key):
+        return key in self._ids
+
+    def __reduce__(self):
+        return (self.__class__, (self.keys(),))
+
+    cdef _append_key(self, key):
+        """Append the key to the reverse table."""
+        cdef uint8_t key_type = KEY_OBJECT
+        cdef bytes encoded
+        if type(key) is unicode:
+            try:
+                encoded = (<unicode>key).encode('utf-8')
+                key_type = KEY_UNICODE
+            except UnicodeEncodeError: # lone surrogates
+                pass
+        elif type(key) is bytes:
+            encoded = key
+            key_type = KEY_BYTES
+        elif type(key) is int or type(key) is long:
+            encoded = str(key).encode('ascii')
+            key_type = KEY_INT
+        if key_type == KEY_OBJECT:
+            self._objects[self._types.size()] = key
+        else:
+            self._buffer += encoded
+        self._offsets.push_back(len(self._buffer))
+        self._types.push_back(key_type)
+
+    cdef _decode(self, uint32_t identifier):
+        if identifier >= self._types.size():
+            raise KeyError(identifier)
+        cdef uint8_t key_type = self._types[identifier]
+        if key_type == KEY_OBJECT:
+            return self._objects[identifier]
+        cdef const char *start = <const char*>self._buffer + self._offsets[identifier]
+        cdef Py_ssize_t length = self._offsets[identifier + 1] - self._offsets[identifier]
+        if key_type == KEY_UNICODE:
+            return PyUnicode_DecodeUTF8(start, length, NULL)
+        encoded = PyBytes_FromStringAndSize(start, length)
+        return encoded if key_type == KEY_BYTES else int(encoded)
+
+    cdef uint32_t _encode(self, key, bool add) except? 0xFFFFFFFF:
+        try:
+            return self._ids[key]
+        except KeyError:
+            if not add:
+                raise
+        if self._types.size() >= 2**32:
+            raise OverflowError('Cannot assign more than 2**32 identifiers.')
+        identifier = self._types.size()
+        self._ids[key] = identifier
+        self._append_key(key)
+        return identifier
+
+    def encode(self, key, add=True):
+        """
+        Return the identifier of the key. A new identifier is assigned to an unknown key if add is True, otherwise a
+        KeyError is raised.
+
+        >>> ids = IdDictionary(['foo'])
+        >>> ids.encode('bar')
+        1
+        >>> ids.encode('foo', add=False)
+        0
+        """
+        return self._encode(key, add)
+
+    def encode_many(self, keys, add=True):
+        """
+        Return an array with the identifiers of the keys, in the same order, assigning new identifiers to the unknown
+        keys if add is True.
+
+        >>> IdDictionary(['foo', 'bar']).encode_many(['bar', 'foo'], add=False)
+        array('I', [1, 0])
+        """
+        cdef array.array result = array.array('I')
+        cdef Py_ssize_t i = 0
+        if hasattr(keys, '__len__'):
+            array.resize(result, len(keys))
+            for key in keys:
+                result.data.as_uints[i] = self._encode(key, add)
+                i += 1
+        else:
+            for key in keys:
+                result.append(self._encode(key, add))
+        return result
+
+    def encode_bitmap(self, keys, add=True, cls=BitMap):
+        """
+        Return the identifiers of the keys as an instance of the given bitmap class.
+
+        >>> IdDictionary(['foo', 'bar']).encode_bitmap(['bar', 'baz'])
+        BitMap([1, 2])
+        """
+        return cls(self.encode_many(keys, add))
+
+    def decode(self, uint32_t identifier):
+        """
+        Return the key having the given identifier.
+
+        >>> IdDictionary(['foo', 'bar']).decode(1)
+        'bar'
+        """
+        return self._decode(identifier)
+
+    def decode_many(self, identifiers):
+        """
+        Return the list of the keys having the given identifiers, in the same order.
+
+        >>> IdDictionary(['foo', 'bar']).decode_many([1, 0, 1])
+        ['bar', 'foo', 'bar']
+        """
+        cdef const uint32_t[::1] values = uint32_view(identifiers)
+        cdef Py_ssize_t i
+        cdef list result = [None] * values.shape[0]
+        for i in range(values.shape[0]):
+            result[i] = self._decode(values[i])
+        return result
+
+    def decode_bitmap(self, AbstractBitMap bitmap not None):
+        """
+        Return the list of the keys whose identifiers are in the bitmap, in increasing order of identifier.
+
+        >>> IdDictionary(['foo', 'bar', 'baz']).decode_bitmap(BitMap([0, 2]))
+        ['foo', 'baz']
+        """
+        if len(bitmap) > 0 and bitmap.max() >= self._types.size():
+            raise KeyError(bitmap.max())
+        return self.decode_many(bitmap.to_array())
+
+    def keys(self):
+        """
+        Return the list of the keys, in increasing order of identifier.
+
+        >>> IdDictionary(['foo', 'bar']).keys()
+        ['foo', 'bar']
+        """
+        cdef uint32_t identifier
+        return [self._decode(identifier) for identifier in range(self._types.size())]
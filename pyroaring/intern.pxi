@@ -0,0 +1,96 @@
+import weakref
+
+cdef class InternPool:
+    """
+    A pool of canonical frozen bitmaps, to share a single instance between all the equal bitmaps.
+
+    The pool only holds weak references: a canonical bitmap is removed from the pool once it is not used anymore.
+
+    >>> pool = InternPool()
+    >>> bm1 = pool.intern(FrozenBitMap([3, 12]))
+    >>> bm2 = pool.intern(FrozenBitMap([3, 12]))
+    >>> bm1 is bm2
+    True
+    >>> pool.stats()['hits']
+    1
+    """
+    cdef dict _buckets # (hash, copy_on_write) -> list of weak references to the canonical bitmaps
+    cdef uint64_t _n_entries
+    cdef uint64_t _hits, _misses, _saved_bytes
+    cdef object __weakref__
+
+    def __init__(self):
+        """
+        Construct an empty pool.
+        """
+        self._buckets = {}
+
+    def __len__(self):
+        return self._n_entries
+
+    def stats(self):
+        """
+        Return a dictionary with the number of hits and misses of the pool, the number of canonical bitmaps it holds
+        and the number of bytes saved by returning a canonical bitmap instead of an equal one.
+
+        >>> sorted(InternPool().stats().items())
+        [('hits', 0), ('misses', 0), ('n_entries', 0), ('saved_bytes', 0)]
+        """
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'n_entries': self._n_entries,
+            'saved_bytes': self._saved_bytes,
+        }
+
+    cdef _remove(self, key, ref):
+        """Remove a dead weak reference from the pool."""
+        bucket = self._buckets.get(key, [])
+        for i in range(len(bucket)):
+            if bucket[i] is ref:
+                del bucket[i]
+                self._n_entries -= 1
+                if not bucket:
+                    del self._buckets[key]
+                return
+
+    def intern(self, FrozenBitMap bitmap not None):
+        """
+        Return the canonical bitmap equal to the given one, which becomes canonical if there is none yet.
+
+        >>> pool = InternPool()
+        >>> bm = FrozenBitMap([3, 12])
+        >>> pool.intern(bm) is bm
+        True
+        """
+        key = (hash(bitmap), bitmap.copy_on_write)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = []
+        for ref in bucket:
+            canonical = ref()
+            if canonical is not None and canonical == bitmap:
+                if canonical is not bitmap:
+                    self._hits += 1
+                    self._saved_bytes += croaring.roaring_bitmap_size_in_bytes(bitmap._c_bitmap)
+                return canonical
+        self._misses += 1
+        self_ref = weakref.ref(self)
+        def callback(ref):
+            pool = self_ref()
+            if pool is not None:
+                (<InternPool>pool)._remove(key, ref)
+        bucket.append(weakref.ref(bitmap, callback))
+        self._n_entries += 1
+        return bitmap
+
+default_intern_pool = InternPool()
+
+def intern(FrozenBitMap bitmap not None):
+    """
+    Return the canonical bitmap equal to the given one in the default InternPool of the module.
+
+    >>> intern(FrozenBitMap([3, 12])) == FrozenBitMap([3, 12])
+    True
+    """
+    return default_intern_pool.intern(bitmap)
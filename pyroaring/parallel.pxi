@@ -0,0 +1,183 @@
+import threading
+import multiprocessing
+from libcpp.algorithm cimport sort, unique
+
+cdef void *container_from_lows(uint16_t *lows, size_t count, uint8_t *typecode) nogil:
+    """
+    Return a new container holding the given low values (unsorted, possibly with duplicates, which are reordered in
+    place), converted to its most compact form, or NULL if the allocation failed.
+    """
+    cdef croaring.bitset_container_t *bitset
+    cdef croaring.array_container_t *arr
+    cdef void *container
+    if count > croaring.DEFAULT_MAX_SIZE:
+        bitset = croaring.bitset_container_create()
+        if bitset is NULL:
+            return NULL
+        croaring.bitset_set_list(bitset.array, lows, count)
+        bitset.cardinality = croaring.bitset_container_compute_cardinality(bitset)
+        if bitset.cardinality > croaring.DEFAULT_MAX_SIZE:
+            container = bitset
+            typecode[0] = croaring.BITSET_CONTAINER_TYPE_CODE
+        else: # many duplicates
+            container = croaring.array_container_from_bitset(bitset)
+            typecode[0] = croaring.ARRAY_CONTAINER_TYPE_CODE
+            croaring.bitset_container_free(bitset)
+    else:
+        sort(lows, lows + count)
+        count = unique(lows, lows + count) - lows
+        arr = croaring.array_container_create_given_capacity(count)
+        if arr is not NULL:
+            memcpy(arr.array, lows, count * sizeof(uint16_t))
+            arr.cardinality = count
+        container = arr
+        typecode[0] = croaring.ARRAY_CONTAINER_TYPE_CODE
+    if container is NULL:
+        return NULL
+    return croaring.convert_run_optimize(container, typecode[0], typecode)
+
+cdef class _ParallelConstruction:
+    """
+    Construction of a bitmap from unsorted values, in three steps split among several workers:
+
+    - each worker counts the values of each key (16 most significant bits) in its chunk of the values,
+    - each worker copies the low values (16 least significant bits) of its chunk, grouped by key,
+    - each worker builds the containers of a range of keys, holding about the same number of values.
+
+    The workers run in threads, without the GIL. The bitmap is then assembled from the containers.
+    """
+    cdef const uint32_t *_values
+    cdef size_t _size
+    cdef size_t _n_workers
+    cdef vector[uint64_t] _positions   # _positions[w*2**16 + key]: number of values of the key in the chunk of the
+                                       # worker w, then position in _lows of its next value
+    cdef vector[uint64_t] _key_starts  # low values of the key k in _lows[_key_starts[k]:_key_starts[k+1]]
+    cdef vector[uint16_t] _lows
+    cdef vector[uint16_t] _keys        # keys having values, in increasing order
+    cdef vector[size_t] _key_bounds    # the worker w builds the containers of _keys[_key_bounds[w]:_key_bounds[w+1]]
+    cdef vector[void*] _containers
+    cdef vector[uint8_t] _typecodes
+
+    def __cinit__(self, const uint32_t[::1] values, size_t n_workers):
+        self._size = values.shape[0]
+        self._values = &values[0] # the values are kept alive by the caller
+        self._n_workers = n_workers
+
+    def __dealloc__(self):
+        cdef size_t i
+        for i in range(self._containers.size()): # containers not moved to a bitmap
+            if self._containers[i] is not NULL:
+                croaring.container_free(self._containers[i], self._typecodes[i])
+
+    cdef _run(self, method):
+        """Call method(worker) for each worker, in parallel."""
+        if self._n_workers == 1:
+            method(0)
+            return
+        threads = [threading.Thread(target=method, args=(worker,)) for worker in range(self._n_workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _count(self, size_t worker):
+        cdef size_t i = self._size * worker // self._n_workers, stop = self._size * (worker + 1) // self._n_workers
+        cdef uint64_t *positions = &self._positions[worker << 16]
+        with nogil:
+            while i < stop:
+                positions[self._values[i] >> 16] += 1
+                i += 1
+
+    def _scatter(self, size_t worker):
+        cdef size_t i = self._size * worker // self._n_workers, stop = self._size * (worker + 1) // self._n_workers
+        cdef uint64_t *positions = &self._positions[worker << 16]
+        cdef uint16_t *lows = &self._lows[0]
+        cdef uint32_t value
+        with nogil:
+            while i < stop:
+                value = self._values[i]
+                lows[positions[value >> 16]] = value & 0xFFFF
+                positions[value >> 16] += 1
+                i += 1
+
+    def _build(self, size_t worker):
+        cdef size_t i = self._key_bounds[worker]
+        cdef uint16_t key
+        with nogil:
+            while i < self._key_bounds[worker + 1]:
+                key = self._keys[i]
+                self._containers[i] = container_from_lows(&self._lows[self._key_starts[key]],
+                                                          self._key_starts[key + 1] - self._key_starts[key],
+                                                          &self._typecodes[i])
+                i += 1
+
+    cdef void _partition(self) nogil:
+        """Compute the positions where the workers copy the values of each key, and split the keys among them."""
+        cdef uint64_t position = 0, count
+        cdef size_t worker, key = 0, i = 0
+        while key < (1 << 16):
+            self._key_starts[key] = position
+            worker = 0
+            while worker < self._n_workers:
+                count = self._positions[(worker << 16) + key]
+                self._positions[(worker << 16) + key] = position
+                position += count
+                worker += 1
+            if position > self._key_starts[key]:
+                self._keys.push_back(key)
+            key += 1
+        self._key_starts[1 << 16] = position
+        self._key_bounds.push_back(0)
+        while i < self._keys.size():
+            if self._key_starts[self._keys[i] + 1] * self._n_workers >= self._size * self._key_bounds.size():
+                self._key_bounds.push_back(i + 1)
+            i += 1
+        while self._key_bounds.size() <= self._n_workers:
+            self._key_bounds.push_back(self._keys.size())
+
+    cdef croaring.roaring_bitmap_t *build(self) except NULL:
+        cdef croaring.roaring_bitmap_t *result
+        cdef size_t i
+        self._positions.resize(self._n_workers << 16)
+        self._key_starts.resize((1 << 16) + 1)
+        self._lows.resize(self._size)
+        self._run(self._count)
+        with nogil:
+            self._partition()
+        self._run(self._scatter)
+        self._containers.resize(self._keys.size(), NULL)
+        self._typecodes.resize(self._keys.size())
+        self._run(self._build)
+        for i in range(self._containers.size()):
+            if self._containers[i] is NULL:
+                raise MemoryError()
+        result = croaring.roaring_bitmap_create_with_capacity(self._containers.size()) # no reallocation when appending
+        if result is NULL: # the containers are released by __dealloc__
+            raise MemoryError()
+        for i in range(self._containers.size()):
+            croaring.ra_append(&result.high_low_container, self._keys[i], self._containers[i], self._typecodes[i])
+        self._containers.clear()
+        croaring.roaring_bitmap_shrink_to_fit(result)
+        return result
+
+cdef size_t cpu_count():
+    """Return the number of CPUs, or 1 if it is unknown."""
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+cdef croaring.roaring_bitmap_t *parallel_from_array(const uint32_t[::1] values, size_t n_workers) except NULL:
+    """
+    Return a new bitmap with the given values, built by n_workers threads (fewer for small inputs, at most one per CPU,
+    and only one if the compiler gave no atomic operations for the counters of the allocator).
+    """
+    cdef uint64_t size = values.shape[0]
+    if size == 0:
+        return croaring.roaring_bitmap_create()
+    if memory_limit != 0: # the containers take at most 2 bytes per value and 8kB per key, plus their headers
+        check_memory(min(2 * size, <uint64_t>8192 << 16) + min(size, 1 << 16) * 64)
+    n_workers = max(1, min(n_workers, size >> 16, cpu_count()))
+    if not pyroaring_atomic_counters():
+        n_workers = 1
+    return _ParallelConstruction(values, n_workers).build()
@@ -0,0 +1,144 @@
+import time
+
+timer = getattr(time, 'perf_counter', time.time) # Python 2 has no perf_counter
+
+cdef bint profiling_enabled = False # checked by the instrumented operations before doing anything else
+cdef dict profiling_records = {}     # operation name -> [calls, time, input cardinality, output cardinality, bytes]
+cdef object profiling_hook = None
+
+cdef struct operation_start:
+    double time
+    size_t allocated_bytes # pyroaring_total_allocated_bytes() when the operation started
+
+ctypedef croaring.roaring_bitmap_t *(*binary_func)(const croaring.roaring_bitmap_t*, const croaring.roaring_bitmap_t*)
+ctypedef void (*binary_ifunc)(croaring.roaring_bitmap_t*, const croaring.roaring_bitmap_t*)
+
+cdef str binary_op_name(binary_func func):
+    if func == croaring.roaring_bitmap_or:
+        return 'or'
+    elif func == croaring.roaring_bitmap_and:
+        return 'and'
+    elif func == croaring.roaring_bitmap_xor:
+        return 'xor'
+    elif func == croaring.roaring_bitmap_andnot:
+        return 'andnot'
+    return 'binary_op'
+
+cdef str binary_iop_name(binary_ifunc func):
+    if func == croaring.roaring_bitmap_or_inplace:
+        return 'or_inplace'
+    elif func == croaring.roaring_bitmap_and_inplace:
+        return 'and_inplace'
+    elif func == croaring.roaring_bitmap_xor_inplace:
+        return 'xor_inplace'
+    elif func == croaring.roaring_bitmap_andnot_inplace:
+        return 'andnot_inplace'
+    return 'binary_iop'
+
+cdef operation_start start_operation():
+    """Return the time and the allocation counter, to be given to record_operation at the end of the operation."""
+    cdef operation_start start
+    start.time = timer()
+    start.allocated_bytes = pyroaring_total_allocated_bytes()
+    return start
+
+cdef record_operation(str name, operation_start start, uint64_t input_cardinality, uint64_t output_cardinality,
+                      uint64_t other_bytes=0):
+    """
+    Account for an operation started at start. The bytes allocated by CRoaring are counted, other_bytes accounts for
+    the other allocations (e.g. a bytes object).
+    """
+    cdef double duration = timer() - start.time
+    cdef uint64_t n_bytes = pyroaring_total_allocated_bytes() - start.allocated_bytes + other_bytes
+    record = profiling_records.get(name)
+    if record is None:
+        record = profiling_records[name] = [0, 0.0, 0, 0, 0]
+    record[0] += 1
+    record[1] += duration
+    record[2] += input_cardinality
+    record[3] += output_cardinality
+    record[4] += n_bytes
+    if profiling_hook is not None:
+        profiling_hook(name, duration, input_cardinality, output_cardinality, n_bytes)
+
+cdef record_bitmap_operation(str name, operation_start start, uint64_t input_cardinality,
+                             const croaring.roaring_bitmap_t *result):
+    """Account for an operation returning the given bitmap."""
+    record_operation(name, start, input_cardinality, croaring.roaring_bitmap_get_cardinality(result))
+
+cdef class Profiler:
+    """
+    Opt-in instrumentation of the bitmap operations, available as pyroaring.profiling.
+
+    When enabled, the binary operations (and their in-place versions), union, intersection, serialize, deserialize and
+    slicing record their number of calls, cumulative time, cumulative input and output cardinalities and the
+    cumulative number of bytes allocated while they run, released afterwards or not (serialize also counts its
+    bytes object). An operation implemented with other ones also records them. When
+    disabled, each operation only checks a boolean.
+
+    >>> profiling.enable()
+    >>> _ = BitMap([3, 12]) | BitMap([5])
+    >>> record = profiling.snapshot()['or']
+    >>> record['calls'], record['input_cardinality'], record['output_cardinality']
+    (1, 3, 3)
+    >>> profiling.disable()
+    >>> profiling.reset()
+    """
+
+    def enable(self):
+        """
+        Start recording the operations.
+        """
+        global profiling_enabled
+        profiling_enabled = True
+
+    def disable(self):
+        """
+        Stop recording the operations. The records are kept.
+        """
+        global profiling_enabled
+        profiling_enabled = False
+
+    @property
+    def enabled(self):
+        """
+        True if and only if the operations are being recorded.
+
+        >>> profiling.enabled
+        False
+        """
+        return profiling_enabled
+
+    def snapshot(self):
+        """
+        Return a dictionary mapping the name of each recorded operation to a dictionary with its number of calls,
+        cumulative time (in seconds), input and output cardinalities and bytes.
+
+        >>> profiling.snapshot()
+        {}
+        """
+        return {name: {
+                    'calls': record[0],
+                    'time': record[1],
+                    'input_cardinality': record[2],
+                    'output_cardinality': record[3],
+                    'bytes': record[4],
+                } for name, record in profiling_records.items()}
+
+    def reset(self):
+        """
+        Remove all the records.
+        """
+        profiling_records.clear()
+
+    def set_hook(self, hook):
+        """
+        Call hook(name, duration, input_cardinality, output_cardinality, n_bytes) after each recorded operation, or
+        remove the hook if it is None.
+        """
+        global profiling_hook
+        if hook is not None and not callable(hook):
+            raise TypeError('The hook must be callable.')
+        profiling_hook = hook
+
+profiling = Profiler()
@@ -0,0 +1,62 @@
+# Cython declarations of pyroaring, for the extensions working directly on the bitmaps:
+#
+#     from pyroaring cimport AbstractBitMap, bitmap_from_ptr, bitmap_contains
+#
+# They are compiled with pyroaring.get_include() in the include path of Cython and of the C compiler. The functions
+# below are called through pointers exported by pyroaring, so the bitmaps are always allocated and released by the
+# same copy of CRoaring. The bitmap functions do not need the GIL, but a bitmap must not be modified while it is
+# used by another thread, and a FrozenBitMap must never be modified.
+
+cimport croaring
+from libc.stdint cimport uint32_t, uint64_t, int64_t
+from libcpp cimport bool
+from libcpp.vector cimport vector
+
+cdef class AbstractBitMap:
+    cdef croaring.roaring_bitmap_t* _c_bitmap
+    cdef int64_t _h_val
+
+    cdef from_ptr(self, croaring.roaring_bitmap_t *ptr)
+    cdef compute_hash(self)
+    cdef binary_op(self, AbstractBitMap other, (croaring.roaring_bitmap_t*)func(const croaring.roaring_bitmap_t*, const croaring.roaring_bitmap_t*) nogil)
+    cdef binary_iop(self, AbstractBitMap other, (void)func(croaring.roaring_bitmap_t*, const croaring.roaring_bitmap_t*) nogil)
+    cdef AbstractBitMap values_bitmap(self, values)
+    cdef void _mutated(self)
+    cdef bool _next_value(self, uint64_t value, uint32_t *result)
+    cdef bool _prev_value(self, int64_t value, uint32_t *result)
+    cdef uint64_t _cardinality(self)
+    cdef bool _select(self, uint64_t rank, uint32_t *element)
+    cdef uint64_t _rank(self, uint32_t value)
+    cdef int64_t _shift_index(self, int64_t index) except -1
+    cdef uint32_t _get_elt(self, int64_t index) except? 0
+    cdef _get_slice(self, sl)
+    cdef _compute_slice(self, sl)
+    cdef _generic_get_slice(self, uint32_t start, uint32_t stop, uint32_t step)
+    cdef void _select_sorted(self, const uint64_t *ranks, size_t count, uint32_t *result)
+    cdef _from_sorted_ranks(self, vector[uint64_t] &ranks)
+    cdef _to_words(self, uint64_t length, void (*write)(uint64_t, uint64_t, uint64_t, char*), char *out)
+
+# Return a new instance of the given subclass of AbstractBitMap, which takes the ownership of the pointer.
+cdef AbstractBitMap bitmap_from_ptr(type cls, croaring.roaring_bitmap_t *ptr)
+
+# Operations on the bitmaps, without the GIL.
+cdef croaring.roaring_bitmap_t *bitmap_create() nogil
+cdef croaring.roaring_bitmap_t *bitmap_copy(const croaring.roaring_bitmap_t *ptr) nogil
+cdef void bitmap_free(croaring.roaring_bitmap_t *ptr) nogil
+cdef uint64_t bitmap_cardinality(const croaring.roaring_bitmap_t *ptr) nogil
+cdef bool bitmap_contains(const croaring.roaring_bitmap_t *ptr, uint32_t value) nogil
+cdef void bitmap_add(croaring.roaring_bitmap_t *ptr, uint32_t value) nogil
+cdef void bitmap_add_many(croaring.roaring_bitmap_t *ptr, size_t count, const uint32_t *values) nogil
+cdef void bitmap_remove(croaring.roaring_bitmap_t *ptr, uint32_t value) nogil
+cdef bool bitmap_select(const croaring.roaring_bitmap_t *ptr, uint64_t rank, uint32_t *element) nogil
+cdef uint64_t bitmap_rank(const croaring.roaring_bitmap_t *ptr, uint32_t value) nogil
+cdef void bitmap_to_array(const croaring.roaring_bitmap_t *ptr, uint32_t *values) nogil
+cdef croaring.roaring_bitmap_t *bitmap_and(const croaring.roaring_bitmap_t *x1, const croaring.roaring_bitmap_t *x2) nogil
+cdef croaring.roaring_bitmap_t *bitmap_or(const croaring.roaring_bitmap_t *x1, const croaring.roaring_bitmap_t *x2) nogil
+cdef croaring.roaring_bitmap_t *bitmap_andnot(const croaring.roaring_bitmap_t *x1, const croaring.roaring_bitmap_t *x2) nogil
+cdef croaring.roaring_bitmap_t *bitmap_xor(const croaring.roaring_bitmap_t *x1, const croaring.roaring_bitmap_t *x2) nogil
+
+# Iteration by blocks: bitmap_read writes up to count values in buff and returns the number of values written.
+cdef croaring.roaring_uint32_iterator_t *bitmap_iterator(const croaring.roaring_bitmap_t *ptr) nogil
+cdef uint32_t bitmap_read(croaring.roaring_uint32_iterator_t *iterator, uint32_t *buff, uint32_t count) nogil
+cdef void bitmap_iterator_free(croaring.roaring_uint32_iterator_t *iterator) nogil
@@ -1,6 +1,23 @@
 # distutils: language = c++
 
 include 'version.pxi'
+include 'simd.pxi'
+include 'containers.pxi'
+include 'allocator.pxi'
+include 'profiling.pxi'
+include 'parallel.pxi'
 include 'abstract_bitmap.pxi'
 include 'frozen_bitmap.pxi'
 include 'bitmap.pxi'
+include 'builder.pxi'
+include 'accumulator.pxi'
+include 'counting.pxi'
+include 'cursor.pxi'
+include 'cache.pxi'
+include 'intern.pxi'
+include 'iddict.pxi'
+include 'concurrent.pxi'
+include 'delta.pxi'
+include 'arena.pxi'
+include 'windowed.pxi'
+include 'api.pxi'
@@ -0,0 +1,32 @@
+# Instruction set used by the container kernels of CRoaring.
+# CRoaring chooses its SIMD kernels at compile time, from the -march option given by setup.py (see the ARCHI
+# environment variable): there is no dispatch at run time, simd_level() only reports what was compiled in.
+
+cdef extern from *:
+    """
+    #include "roaring.h"
+
+    static const char *pyroaring_simd_level(void) {
+    #if defined(USEAVX)
+        return "avx2";
+    #elif defined(USESSE4)
+        return "sse4.2";
+    #else
+        return "scalar";
+    #endif
+    }
+    """
+    const char *pyroaring_simd_level()
+
+def simd_level():
+    """
+    Return the instruction set used by the container kernels: 'avx2', 'sse4.2' or 'scalar'.
+
+    It is chosen when pyroaring is compiled, and does not depend on the CPU running it: by default pyroaring is built
+    for the compiling machine (ARCHI=native), see the README for portable builds. A binary built for a CPU type must
+    only be run on CPUs supporting its instructions.
+
+    >>> simd_level() in ('avx2', 'sse4.2', 'scalar')
+    True
+    """
+    return str(pyroaring_simd_level().decode('ascii'))
@@ -0,0 +1,185 @@
+from libcpp.unordered_map cimport unordered_map
+from cython.operator cimport dereference
+
+cdef class WindowedBitMap:
+    """
+    The union of the elements seen during the last n_slots time slots (e.g. the users active during the last n_slots
+    minutes), maintained incrementally as the window slides.
+
+    The elements are added to the current slot, and advance() starts a new slot. Each slot holds the elements whose
+    last occurrence is in it, so the slots are disjoint and the elements leaving the window are exactly those of the
+    oldest slot: sliding the window costs as much as the oldest slot, whatever the size of the window. The last slot
+    of each element of the window is also indexed, so adding an element or looking up its last slot takes a constant
+    time, and adding several elements costs as much as these elements.
+
+    >>> active = WindowedBitMap(2)
+    >>> active.update([3, 12])
+    >>> active.advance()
+    FrozenBitMap([])
+    >>> active.add(12)
+    >>> active.advance() # 3 was last seen 2 slots ago
+    FrozenBitMap([3])
+    >>> active.window()
+    FrozenBitMap([12])
+    """
+    cdef list _slots       # _slots[i % n_slots] holds the elements last seen in the slot i
+    cdef BitMap _union     # union of the slots
+    cdef unordered_map[uint32_t, uint64_t] _last_seen # element of the window -> number of its last slot
+    cdef uint64_t _n_slots
+    cdef uint64_t _current # number of the current slot
+    cdef bool _copy_on_write
+
+    def __init__(self, uint64_t n_slots, copy_on_write=False):
+        """
+        Construct an empty window of n_slots slots. Copy on write is enabled on the bitmaps of the window with
+        copy_on_write.
+        """
+        if n_slots == 0:
+            raise ValueError('The window must have at least one slot.')
+        self._n_slots = n_slots
+        self._copy_on_write = copy_on_write
+        self._slots = [BitMap(copy_on_write=copy_on_write) for _ in range(n_slots)]
+        self._union = BitMap(copy_on_write=copy_on_write)
+        self._current = 0
+
+    @property
+    def n_slots(self):
+        """
+        The number of slots of the window.
+
+        >>> WindowedBitMap(60).n_slots
+        60
+        """
+        return self._n_slots
+
+    @property
+    def current_slot(self):
+        """
+        The number of the current slot, starting at 0 and incremented by advance().
+        """
+        return self._current
+
+    def __len__(self):
+        return len(self._union)
+
+    def __contains__(self, uint32_t value):
+        return value in self._union
+
+    cdef BitMap _current_bitmap(self):
+        return self._slots[self._current % self._n_slots]
+
+    def add(self, uint32_t value):
+        """
+        Add an element to the current slot.
+
+        >>> active = WindowedBitMap(5)
+        >>> active.add(3)
+        >>> 3 in active
+        True
+        """
+        self._add(value)
+        croaring.roaring_bitmap_add(self._current_bitmap()._c_bitmap, value)
+
+    cdef _add(self, uint32_t value):
+        """Record the value in the current slot, removing it from its previous slot, but not from the current bitmap."""
+        cdef unordered_map[uint32_t, uint64_t].iterator found = self._last_seen.find(value)
+        if found == self._last_seen.end():
+            self._last_seen[value] = self._current
+            croaring.roaring_bitmap_add(self._union._c_bitmap, value)
+        elif dereference(found).second != self._current: # the element moves from its previous slot
+            croaring.roaring_bitmap_remove(
+                (<AbstractBitMap>self._slots[dereference(found).second % self._n_slots])._c_bitmap, value)
+            dereference(found).second = self._current
+
+    def update(self, values):
+        """
+        Add all the given values (a bitmap, whatever its copy_on_write setting, or an iterable of integers) to the
+        current slot.
+
+        >>> active = WindowedBitMap(5)
+        >>> active.update(range(3, 6))
+        >>> len(active)
+        3
+        """
+        cdef AbstractBitMap new
+        if isinstance(values, AbstractBitMap):
+            new = with_copy_on_write(values, self._copy_on_write)
+        else:
+            new = BitMap(values, copy_on_write=self._copy_on_write, optimize=False)
+        cdef croaring.roaring_uint32_iterator_t *iterator = croaring.roaring_create_iterator(new._c_bitmap)
+        try:
+            while iterator.has_value:
+                self._add(iterator.current_value)
+                croaring.roaring_advance_uint32_iterator(iterator)
+        finally:
+            croaring.roaring_free_uint32_iterator(iterator)
+        current = self._current_bitmap()
+        current |= new
+
+    def advance(self):
+        """
+        Start a new slot, and return the elements leaving the window (those last seen n_slots slots ago), as a
+        FrozenBitMap.
+
+        >>> active = WindowedBitMap(1)
+        >>> active.add(3)
+        >>> active.advance()
+        FrozenBitMap([3])
+        """
+        self._current += 1
+        cdef uint64_t index = self._current % self._n_slots
+        cdef BitMap expired = self._slots[index]
+        cdef croaring.roaring_uint32_iterator_t *iterator = croaring.roaring_create_iterator(expired._c_bitmap)
+        try:
+            while iterator.has_value:
+                self._last_seen.erase(iterator.current_value)
+                croaring.roaring_advance_uint32_iterator(iterator)
+        finally:
+            croaring.roaring_free_uint32_iterator(iterator)
+        self._union -= expired
+        self._slots[index] = BitMap(copy_on_write=self._copy_on_write)
+        return FrozenBitMap(expired)
+
+    def window(self):
+        """
+        Return the elements seen during the last n_slots slots (including the current one), as a FrozenBitMap.
+        """
+        return FrozenBitMap(self._union)
+
+    def last_seen(self, uint32_t value):
+        """
+        Return the number of the last slot in which the element was seen, or None if it is not in the window.
+
+        >>> active = WindowedBitMap(5)
+        >>> active.add(3)
+        >>> active.advance()
+        FrozenBitMap([])
+        >>> active.last_seen(3), active.last_seen(12)
+        (0, None)
+        """
+        cdef unordered_map[uint32_t, uint64_t].iterator found = self._last_seen.find(value)
+        if found == self._last_seen.end():
+            return None
+        return dereference(found).second
+
+    def __reduce__(self):
+        return (self.__class__, (self._n_slots, self._copy_on_write), (self._current, self._slots))
+
+    def __setstate__(self, state):
+        self._current, slots = state
+        for bitmap in slots: # the pickled bitmaps do not keep this setting
+            (<AbstractBitMap>bitmap)._c_bitmap.copy_on_write = self._copy_on_write
+        self._slots = list(slots)
+        self._union = BitMap.union(*self._slots)
+        self._last_seen.clear()
+        cdef uint64_t age, slot
+        cdef croaring.roaring_uint32_iterator_t *iterator
+        for age in range(min(self._n_slots, self._current + 1)):
+            slot = self._current - age
+            iterator = croaring.roaring_create_iterator((<AbstractBitMap>self._slots[slot % self._n_slots])._c_bitmap)
+            try:
+                while iterator.has_value:
+                    self._last_seen[iterator.current_value] = slot
+                    croaring.roaring_advance_uint32_iterator(iterator)
+            finally:
+                croaring.roaring_free_uint32_iterator(iterator)
@@ -10,6 +10,7 @@ import platform
 
 VERSION = '0.2.1'
 PKG_DIR = 'pyroaring'
+INCLUDE_DIR = 'pyroaring_include'
 
 PLATFORM_WINDOWS = (platform.system() == 'Windows')
 PLATFORM_MACOSX = (platform.system() == 'Darwin')
@@ -87,14 +88,13 @@ else:
         compile_args.extend(['-O0', '-g'])
     else:
         compile_args.append('-O3')
-    if 'ARCHI' in os.environ:
-        compile_args.extend(['-march=%s' % os.environ['ARCHI']])
-    else:
-        compile_args.append('-march=native')
+    archi = os.environ.get('ARCHI', 'native') # ARCHI=none leaves the choice of the instructions to the compiler
+    if archi != 'none':
+        compile_args.append('-march=%s' % archi)
 
 filename = os.path.join(PKG_DIR, 'pyroaring.%s' % ext)
 pyroaring = Extension('pyroaring',
-                      sources=[filename, os.path.join(PKG_DIR, 'roaring.c')],
+                      sources=[filename, os.path.join(PKG_DIR, 'roaring.c'), os.path.join(PKG_DIR, 'allocator.c')],
                       extra_compile_args=compile_args,
                       )
 if USE_CYTHON:
@@ -105,6 +105,11 @@ else:
 setup(
     name='pyroaring',
     ext_modules=pyroaring,
+    # not a Python package: the Cython declarations and the headers, installed next to the module for the other
+    # extensions, see pyroaring.get_include()
+    packages=[INCLUDE_DIR],
+    package_dir={INCLUDE_DIR: PKG_DIR},
+    package_data={INCLUDE_DIR: ['pyroaring.pxd', 'croaring.pxd', 'roaring.h', 'allocator.h']},
     version=VERSION,
     description='Fast and lightweight set for unsigned 32 bits integers.',
     long_description=long_description,
@@ -112,6 +117,9 @@ setup(
     author='Tom Cornebize',
     author_email='tom.cornebize@gmail.com',
     license='MIT',
+    extras_require={
+        'arrow': ['pyarrow'],
+    },
     classifiers=[
         'License :: OSI Approved :: MIT License',
         'Intended Audience :: Developers',
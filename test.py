@@ -6,12 +6,16 @@ import functools
 import os
 import sys
 import pickle
+import struct
 import re
+import threading
 from hypothesis import given, settings, unlimited, Verbosity, errors
 import hypothesis.strategies as st
 import array
 import pyroaring
-from pyroaring import BitMap, FrozenBitMap
+from pyroaring import BitMap, FrozenBitMap, BitMapBuilder, Cursor, OpCache, InternPool, IdDictionary
+from pyroaring import UnionAccumulator, SymmetricDifferenceAccumulator, CountingBitMap, ConcurrentBitMap
+from pyroaring import BitMapDelta, diff, apply_delta, BitMapArena, WindowedBitMap
 
 is_python2 = sys.version_info < (3, 0)
 
@@ -302,6 +306,73 @@ class SelectRankTest(Util):
             m = bitmap.max()
 
 
+class CursorTest(Util):
+
+    @given(bitmap_cls, hyp_collection, uint32, st.booleans())
+    def test_next_value(self, cls, values, value, cow):
+        bitmap = cls(values, copy_on_write=cow)
+        larger = [v for v in values if v >= value]
+        if larger:
+            self.assertEqual(bitmap.next_value(value), min(larger))
+        else:
+            with self.assertRaises(ValueError):
+                bitmap.next_value(value)
+        for v in self.bitmap_sample(bitmap, min(len(bitmap), 20)):
+            self.assertEqual(bitmap.next_value(v), v)
+            if v > 0:
+                self.assertEqual(bitmap.next_value(v-1), v-1 if v-1 in bitmap else v)
+
+    @given(bitmap_cls, hyp_collection, uint32, st.booleans())
+    def test_prev_value(self, cls, values, value, cow):
+        bitmap = cls(values, copy_on_write=cow)
+        smaller = [v for v in values if v <= value]
+        if smaller:
+            self.assertEqual(bitmap.prev_value(value), max(smaller))
+        else:
+            with self.assertRaises(ValueError):
+                bitmap.prev_value(value)
+        for v in self.bitmap_sample(bitmap, min(len(bitmap), 20)):
+            self.assertEqual(bitmap.prev_value(v), v)
+            if v < 2**32-1:
+                self.assertEqual(bitmap.prev_value(v+1), v+1 if v+1 in bitmap else v)
+
+    @given(bitmap_cls, hyp_collection, st.booleans())
+    def test_reversed(self, cls, values, cow):
+        bitmap = cls(values, copy_on_write=cow)
+        self.assertEqual(list(reversed(bitmap)), sorted(set(values), reverse=True))
+
+    @given(bitmap_cls, hyp_collection, st.booleans(), st.integers(min_value=1, max_value=1000))
+    def test_next_block(self, cls, values, reverse, size):
+        bitmap = cls(values)
+        cursor = Cursor(bitmap, reverse=reverse)
+        result = []
+        while cursor.has_value:
+            block = cursor.next_block(size)
+            self.assertTrue(0 < len(block) <= size)
+            result.extend(block)
+        self.assertEqual(len(cursor.next_block(size)), 0)
+        self.assertEqual(result, sorted(set(values), reverse=reverse))
+
+    def test_huge_block(self):
+        for reverse in [False, True]:
+            self.assertEqual(Cursor(BitMap([3, 12]), reverse=reverse).next_block(2**32 - 1),
+                             array.array('I', [12, 3] if reverse else [3, 12]))
+
+    @given(bitmap_cls, hyp_collection, st.booleans(), st.lists(uint32, max_size=20))
+    def test_seek(self, cls, values, reverse, targets):
+        bitmap = cls(values)
+        expected = sorted(set(values), reverse=reverse)
+        cursor = Cursor(bitmap, reverse=reverse)
+        for target in targets:
+            remaining = [v for v in expected if (v <= target if reverse else v >= target)]
+            self.assertEqual(cursor.seek(target), len(remaining) > 0)
+            self.assertEqual(cursor.has_value, len(remaining) > 0)
+            self.assertEqual(cursor.next_block(10), array.array('I', remaining[:10]))
+            self.assertEqual(list(cursor), remaining[10:])
+            with self.assertRaises(ValueError):
+                cursor.current
+
+
 class BinaryOperationsTest(Util):
 
     @given(bitmap_cls, bitmap_cls, hyp_collection, hyp_collection, st.booleans())
@@ -394,6 +465,129 @@ class ComparisonTest(Util):
         self.assertEqual(bm1.intersect(bm2), len(bm1 & bm2) > 0)
 
 
+class IterableOperandTest(Util):
+
+    operand_kinds = st.sampled_from([list, lambda values: array.array('I', values), lambda values: iter(list(values))])
+
+    @given(bitmap_cls, hyp_collection, hyp_collection, operand_kinds, st.booleans())
+    def do_test_binary_op(self, op, cls, values1, values2, kind, cow):
+        bitmap = cls(values1, copy_on_write=cow)
+        old_bitmap = cls(bitmap)
+        values2 = sorted(values2)
+        result = op(bitmap, kind(values2))
+        self.assertEqual(bitmap, old_bitmap)
+        self.assertEqual(type(result), cls)
+        self.assertEqual(result.copy_on_write, cow)
+        self.compare_with_set(result, op(set(values1), set(values2)))
+        reflected = op(kind(values2), bitmap)
+        self.assertEqual(type(reflected), cls)
+        self.compare_with_set(reflected, op(set(values2), set(values1)))
+
+    def test_or(self):
+        self.do_test_binary_op(lambda x, y: x | y)
+
+    def test_and(self):
+        self.do_test_binary_op(lambda x, y: x & y)
+
+    def test_xor(self):
+        self.do_test_binary_op(lambda x, y: x ^ y)
+
+    def test_sub(self):
+        self.do_test_binary_op(lambda x, y: x - y)
+
+    @given(hyp_collection, hyp_collection, operand_kinds, st.booleans())
+    def do_test_binary_op_inplace(self, op, values1, values2, kind, cow):
+        bitmap = BitMap(values1, copy_on_write=cow)
+        original = bitmap
+        expected = set(values1)
+        op(expected, set(values2))
+        bitmap = op(bitmap, kind(values2))
+        self.assertIs(bitmap, original)
+        self.assertEqual(bitmap.copy_on_write, cow)
+        self.compare_with_set(bitmap, expected)
+
+    def test_or_inplace(self):
+        self.do_test_binary_op_inplace(lambda x, y: x.__ior__(y))
+
+    def test_and_inplace(self):
+        self.do_test_binary_op_inplace(lambda x, y: x.__iand__(y))
+
+    def test_xor_inplace(self):
+        self.do_test_binary_op_inplace(lambda x, y: x.__ixor__(y))
+
+    def test_sub_inplace(self):
+        self.do_test_binary_op_inplace(lambda x, y: x.__isub__(y))
+
+    @given(bitmap_cls, hyp_collection, hyp_collection, st.booleans())
+    def test_comparisons(self, cls, values1, values2, cow):
+        bitmap = cls(values1, copy_on_write=cow)
+        set1, set2 = set(values1), set(values2)
+        self.assertEqual(bitmap <= list(values2), set1 <= set2)
+        self.assertEqual(bitmap < list(values2), set1 < set2)
+        self.assertEqual(bitmap >= list(values2), set1 >= set2)
+        self.assertEqual(bitmap > list(values2), set1 > set2)
+        self.assertEqual(bitmap <= values2, set1 <= set2)
+        self.assertEqual(bitmap.intersect(list(values2)), len(set1 & set2) > 0)
+        self.assertEqual(bitmap.intersect(values2), len(set1 & set2) > 0)
+
+    def test_equality(self):
+        bitmap = BitMap([3, 12])
+        self.assertFalse(bitmap == [3, 12])
+        self.assertTrue(bitmap != [3, 12])
+        self.assertFalse(bitmap == None)
+        self.assertNotIn(bitmap, [None, 'foo'])
+
+    def test_wrong_operands(self):
+        bitmap = BitMap([3, 12])
+        with self.assertRaises(TypeError):
+            bitmap & 42
+        with self.assertRaises(TypeError):
+            bitmap | None
+        with self.assertRaises(TypeError):
+            42 - bitmap
+        with self.assertRaises(OverflowError):
+            bitmap - [-1]
+        with self.assertRaises(ValueError):
+            bitmap & BitMap([3], copy_on_write=True)
+        with self.assertRaises(TypeError):
+            FrozenBitMap([3]).__ior__([12])
+        with self.assertRaises(TypeError):
+            bitmap &= 42
+        with self.assertRaises(TypeError) as context:
+            bitmap.intersect(42)
+        self.assertIn('iterable of integers', str(context.exception))
+        self.assertIs(bitmap.__isub__(42), NotImplemented)
+
+    def test_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('numpy is not installed')
+        bitmap = BitMap(range(0, 100, 3))
+        values = numpy.arange(50, dtype=numpy.uint32)
+        self.assertEqual(bitmap & values, BitMap(range(0, 50, 3)))
+        self.assertEqual(bitmap - values, BitMap(range(51, 100, 3)))
+        self.assertEqual(bitmap & values[::2], BitMap(range(0, 50, 6)))
+        self.assertEqual(bitmap & values.astype(numpy.int64), BitMap(range(0, 50, 3)))
+
+    def test_numpy_non_contiguous(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('numpy is not installed')
+        values = numpy.arange(20, dtype=numpy.uint32)
+        for view in [values[::2], values[::-1], values[::-3]]:
+            expected = set(view.tolist())
+            self.compare_with_set(BitMap([100]) | view, expected | {100})
+            self.compare_with_set(BitMap(range(10)) & view, expected & set(range(10)))
+            self.compare_with_set(BitMap(range(10)) - view, set(range(10)) - expected)
+            bitmap = BitMap([100])
+            bitmap |= view
+            self.compare_with_set(bitmap, expected | {100})
+            self.assertEqual(BitMap([100]).intersect(view), False)
+            self.assertEqual(BitMap([2]).intersect(view), 2 in expected)
+
+
 class CardinalityTest(Util):
 
     @given(bitmap_cls, bitmap_cls, hyp_collection, hyp_collection, st.booleans())
@@ -551,6 +745,968 @@ class StatisticsTest(Util):
         self.assertEqual(stats['n_bytes_run_containers'], 12)
 
 
+class ContainerTest(Util):
+
+    @given(bitmap_cls, hyp_collection, st.booleans())
+    def test_iter_containers(self, cls, values, cow):
+        bitmap = cls(values, copy_on_write=cow)
+        stats = bitmap.get_statistics()
+        containers = list(bitmap.iter_containers())
+        self.assertEqual(len(containers), stats['n_containers'])
+        self.assertEqual([key for key, _, _, _ in containers], sorted(set(v >> 16 for v in values)))
+        for key, typ, card, size in containers:
+            self.assertEqual(card, len([v for v in bitmap if v >> 16 == key]))
+        for typ in ['array', 'bitset', 'run']:
+            self.assertEqual(sum(1 for c in containers if c[1] == typ), stats['n_%s_containers' % typ])
+            self.assertEqual(sum(c[2] for c in containers if c[1] == typ), stats['n_values_%s_containers' % typ])
+            self.assertEqual(sum(c[3] for c in containers if c[1] == typ), stats['n_bytes_%s_containers' % typ])
+
+    @given(bitmap_cls, hyp_collection, st.booleans())
+    def test_container_keys(self, cls, values, cow):
+        bitmap = cls(values, copy_on_write=cow)
+        expected = array.array('H', sorted(set(v >> 16 for v in values)))
+        self.assertEqual(bitmap.container_keys(), expected)
+
+    @given(bitmap_cls, hyp_collection, st.integers(min_value=0, max_value=2**16), st.integers(min_value=0, max_value=2**16), st.booleans())
+    def test_restrict_to_keys(self, cls, values, start, stop, cow):
+        bitmap = cls(values, copy_on_write=cow)
+        result = bitmap.restrict_to_keys(start, stop)
+        self.assertIsInstance(result, cls)
+        self.assertEqual(result.copy_on_write, cow)
+        self.compare_with_set(result, set(v for v in values if start <= v >> 16 < stop))
+        self.assertEqual(bitmap, cls(values, copy_on_write=cow))
+
+    @given(hyp_collection, st.integers(min_value=1, max_value=2**16), st.booleans())
+    def test_shards(self, values, width, cow):
+        bitmap = BitMap(values, copy_on_write=cow)
+        shards = [bitmap.restrict_to_keys(key, key + width) for key in range(0, 2**16, width)]
+        self.assertEqual(sum(len(shard) for shard in shards), len(bitmap))
+        self.assertEqual(BitMap.union(*shards), bitmap)
+        for shard in shards:
+            shard.add(2**32-1)
+        self.assertEqual(bitmap, BitMap(values, copy_on_write=cow))
+
+
+class SampleTest(Util):
+
+    @given(bitmap_cls, hyp_collection, st.integers(min_value=0, max_value=2**10), st.booleans())
+    def test_sample(self, cls, values, k, cow):
+        bitmap = cls(values, copy_on_write=cow)
+        if k > len(bitmap):
+            with self.assertRaises(ValueError):
+                bitmap.sample(k)
+            return
+        sample = bitmap.sample(k)
+        self.assertIsInstance(sample, cls)
+        self.assertEqual(len(sample), k)
+        self.assertLessEqual(sample, bitmap)
+        self.assertEqual(bitmap.sample(len(bitmap)), bitmap)
+
+    @given(bitmap_cls, hyp_collection, st.integers(min_value=0, max_value=2**10))
+    def test_sample_replace(self, cls, values, k):
+        st.assume(len(values) > 0)
+        bitmap = cls(values)
+        sample = bitmap.sample(k, replace=True)
+        self.assertIsInstance(sample, array.array)
+        self.assertEqual(len(sample), k)
+        self.assertEqual(list(sample), sorted(sample))
+        for value in sample:
+            self.assertIn(value, bitmap)
+
+    @given(bitmap_cls, hyp_collection, st.integers(min_value=0, max_value=2**10), st.integers())
+    def test_sample_seed(self, cls, values, k, seed):
+        bitmap = cls(values)
+        k = min(k, len(bitmap))
+        self.assertEqual(bitmap.sample(k, seed=seed), bitmap.sample(k, seed=seed))
+        self.assertEqual(bitmap.sample(k, seed=seed, replace=True), bitmap.sample(k, seed=seed, replace=True))
+
+    def test_sample_uniformity(self):
+        bitmap = BitMap(range(0, 2**20, 3)) | BitMap(range(2**20, 2**21)) | BitMap([2**30, 2**31])
+        counts = [0, 0, 0]
+        for value in bitmap.sample(30000, seed=1, replace=True):
+            counts[0 if value < 2**20 else 1 if value < 2**21 else 2] += 1
+        total = float(len(bitmap))
+        self.assertAlmostEqual(counts[0] / 30000., len(range(0, 2**20, 3)) / total, delta=0.02)
+        self.assertAlmostEqual(counts[1] / 30000., 2**20 / total, delta=0.02)
+
+    @given(bitmap_cls, hyp_collection, st.floats(min_value=0, max_value=1), st.integers())
+    def test_sample_fraction(self, cls, values, p, seed):
+        bitmap = cls(values)
+        sample = bitmap.sample_fraction(p, seed=seed)
+        self.assertIsInstance(sample, cls)
+        self.assertLessEqual(sample, bitmap)
+        self.assertEqual(sample, bitmap.sample_fraction(p, seed=seed))
+        if p == 0:
+            self.assertEqual(len(sample), 0)
+        elif p == 1:
+            self.assertEqual(sample, bitmap)
+
+    def test_sample_fraction_size(self):
+        bitmap = BitMap(range(0, 2**22, 2))
+        for p in [0.001, 0.1, 0.5, 0.9]:
+            expected = p * len(bitmap)
+            self.assertAlmostEqual(len(bitmap.sample_fraction(p, seed=1)), expected, delta=5 * expected ** 0.5)
+
+    def test_tiny_fraction(self):
+        bitmap = BitMap(range(1000))
+        for p in [1e-17, 5e-324]:
+            self.assertEqual(bitmap.sample_fraction(p, seed=1), BitMap())
+
+    def test_wrong_fraction(self):
+        with self.assertRaises(ValueError):
+            BitMap([1]).sample_fraction(1.5)
+
+
+class AggregateTest(Util):
+
+    @given(bitmap_cls, hyp_collection, uint32, uint32, st.booleans())
+    def test_range_cardinality(self, cls, values, start, stop, cow):
+        bitmap = cls(values, copy_on_write=cow)
+        self.assertEqual(bitmap.range_cardinality(start, stop), len([v for v in values if start <= v < stop]))
+        self.assertEqual(bitmap.range_cardinality(0, 2**32), len(bitmap))
+
+    @given(bitmap_cls, hyp_collection, uint32, uint32, st.booleans())
+    def test_range_sum(self, cls, values, start, stop, cow):
+        bitmap = cls(values, copy_on_write=cow)
+        self.assertEqual(bitmap.range_sum(start, stop), sum(v for v in set(values) if start <= v < stop))
+        self.assertEqual(bitmap.range_sum(0, 2**32), bitmap.get_statistics()['sum_value'])
+
+    @given(bitmap_cls, hyp_collection, st.integers(min_value=1, max_value=2**20), uint18, st.none() | uint18)
+    def test_histogram(self, cls, values, width, start, stop):
+        bitmap = cls(values)
+        values = set(values)
+        result = bitmap.histogram(width, start=start, stop=stop)
+        if stop is None:
+            stop = max(values) + 1 if values else start
+        n_buckets = max(0, (stop - start + width - 1) // width)
+        expected = [0] * n_buckets
+        for value in values:
+            if start <= value < stop:
+                expected[(value - start) // width] += 1
+        self.assertEqual(list(result), expected)
+
+    def test_large_histogram(self):
+        bitmap = BitMap(list(range(0, 2**32, 2**20))) | BitMap(range(2**31, 2**31 + 2**18))
+        result = bitmap.histogram(2**30)
+        self.assertEqual(list(result), [2**10] * 2 + [2**10 + 2**18 - 1] + [2**10])
+        self.assertEqual(list(bitmap.histogram(2**40)), [len(bitmap)])
+        with self.assertRaises(ValueError):
+            bitmap.histogram(0)
+
+
+class MaskTest(Util):
+
+    @given(bitmap_cls, hyp_collection, uint18)
+    def test_bool_mask(self, cls, values, offset):
+        values = set(values)
+        length = max(values) + 1 if values else 0
+        mask = bytearray(length)
+        for value in values:
+            mask[value] = 1
+        bitmap = cls.from_bool_mask(mask, offset=offset)
+        self.assertIsInstance(bitmap, cls)
+        self.compare_with_set(bitmap, set(value + offset for value in values))
+        self.assertEqual(cls(values).to_bool_mask(length), mask)
+        self.assertEqual(bitmap.to_bool_mask(length + offset), bytearray(offset) + mask)
+        self.assertEqual(cls(values).to_bool_mask(length // 2), mask[:length // 2])
+
+    @given(bitmap_cls, hyp_collection, uint18)
+    def test_packed_bits(self, cls, values, n_bits):
+        values = set(values)
+        packed = bytearray((max(values) // 8 + 1) if values else 0)
+        for value in values:
+            packed[value // 8] |= 1 << (value % 8)
+        packed.extend(bytearray(n_bits // 8 + 1))
+        bitmap = cls.from_packed_bits(packed, n_bits)
+        self.assertIsInstance(bitmap, cls)
+        expected = set(value for value in values if value < n_bits)
+        self.compare_with_set(bitmap, expected)
+        packed = packed[:(n_bits + 7) // 8]
+        if n_bits % 8:
+            packed[-1] &= (1 << (n_bits % 8)) - 1
+        self.assertEqual(cls(values).to_packed_bits(n_bits), packed)
+
+    def test_mask_errors(self):
+        with self.assertRaises(ValueError):
+            BitMap.from_bool_mask(array.array('I', [1, 0, 1]))
+        with self.assertRaises(OverflowError):
+            BitMap.from_bool_mask(b'\x01', offset=2**32)
+        with self.assertRaises(ValueError):
+            BitMap.from_packed_bits(b'\x01', 9)
+        with self.assertRaises(IndexError):
+            BitMap([3]).apply_mask([1, 2, 3])
+
+    @given(hyp_collection, st.sampled_from(['b', 'I', 'd']))
+    def test_apply_mask(self, values, typecode):
+        bitmap = BitMap(values)
+        length = bitmap.max() + 10 if bitmap else 5
+        items = array.array(typecode, [i % 100 for i in range(length)])
+        expected = [items[i] for i in sorted(set(values))]
+        result = bitmap.apply_mask(items)
+        self.assertEqual(result, array.array(typecode, expected))
+        self.assertEqual(bitmap.apply_mask(list(items)), expected)
+
+    def test_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('numpy is not installed')
+        mask = numpy.zeros(2**17, dtype=bool)
+        mask[[3, 12, 70000]] = True
+        bitmap = BitMap.from_bool_mask(mask)
+        self.assertEqual(bitmap, BitMap([3, 12, 70000]))
+        self.assertTrue((numpy.frombuffer(bitmap.to_bool_mask(len(mask)), dtype=bool) == mask).all())
+        rows = numpy.arange(2**18).reshape(2**17, 2)
+        self.assertEqual(bitmap.apply_mask(rows).tolist(), [[6, 7], [24, 25], [140000, 140001]])
+
+
+class FromArrayTest(Util):
+
+    @given(bitmap_cls, hyp_collection, st.integers(min_value=1, max_value=8))
+    def test_from_array(self, cls, values, workers):
+        bitmap = cls.from_array(values, workers=workers)
+        self.assertIsInstance(bitmap, cls)
+        self.compare_with_set(bitmap, set(values))
+
+    def test_workers(self):
+        random.seed(42)
+        values = array.array('I', [random.randint(0, 2**22) for _ in range(300000)])
+        values.extend(range(2**23, 2**23 + 70000)) # run containers
+        values.extend([2**24 + 5] * 10000 + [2**32 - 1] * 5000) # containers with many duplicates
+        random.shuffle(values)
+        expected = BitMap(values)
+        for workers in [1, 2, 3, 8]:
+            bitmap = BitMap.from_array(values, workers=workers)
+            self.assertEqual(bitmap, expected)
+            self.assertEqual(bitmap.get_statistics(), expected.get_statistics())
+
+    def test_non_contiguous(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('numpy is not installed')
+        values = numpy.arange(2**18, dtype=numpy.uint32)
+        for view in [values[::2], values[::-1], values[::-5], values[:20:2]]:
+            for workers in [1, 4]:
+                self.compare_with_set(BitMap.from_array(view, workers=workers), set(view.tolist()))
+
+    def test_from_array_errors(self):
+        with self.assertRaises(ValueError):
+            BitMap.from_array([3], workers=0)
+        with self.assertRaises(OverflowError):
+            BitMap.from_array([-1])
+
+
+class IntervalTest(Util):
+
+    @staticmethod
+    def expected_intervals(values):
+        starts, ends = [], []
+        for value in sorted(set(values)):
+            if ends and ends[-1] == value:
+                ends[-1] += 1
+            else:
+                starts.append(value)
+                ends.append(value + 1)
+        return starts, ends
+
+    @given(bitmap_cls, hyp_collection, st.booleans())
+    def test_to_intervals(self, cls, values, optimize):
+        bitmap = cls(values, optimize=optimize)
+        starts, ends = bitmap.to_intervals()
+        self.assertEqual((list(starts), list(ends)), self.expected_intervals(values))
+        self.assertEqual(bitmap.num_runs(), len(starts))
+        self.assertEqual(cls.from_intervals(starts, ends), bitmap)
+        self.assertIsInstance(cls.from_intervals(starts, ends), cls)
+
+    @given(st.lists(st.tuples(uint18, uint18)))
+    def test_from_intervals(self, intervals):
+        intervals = [(min(a, b), max(a, b)) for a, b in intervals]
+        expected = set()
+        for start, end in intervals:
+            expected.update(range(start, end))
+        bitmap = BitMap.from_intervals([start for start, _ in intervals], [end for _, end in intervals])
+        self.compare_with_set(bitmap, expected)
+
+    def test_container_boundaries(self):
+        values = list(range(2**16 - 70, 2**16 + 70)) + list(range(2**17, 2**17 + 20000, 2)) + [2**32 - 2, 2**32 - 1]
+        values += list(range(2**17 + 30000, 2**17 + 30200)) + list(range(3 * 2**16 - 1, 3 * 2**16 + 2**15))
+        bitmap = BitMap(values, optimize=False)
+        self.assertEqual(bitmap.get_statistics()['n_bitset_containers'], 2)
+        expected = self.expected_intervals(list(bitmap))
+        self.assertEqual(tuple(list(array) for array in bitmap.to_intervals()), expected)
+        self.assertEqual(bitmap.num_runs(), len(expected[0]))
+        self.assertEqual(BitMap.from_intervals(*expected), bitmap)
+        bitmap.run_optimize()
+        self.assertEqual(tuple(list(array) for array in bitmap.to_intervals()), expected)
+        self.assertEqual(bitmap.num_runs(), len(expected[0]))
+
+    def test_interval_errors(self):
+        with self.assertRaises(ValueError):
+            BitMap.from_intervals([3, 5], [4])
+        with self.assertRaises(ValueError):
+            BitMap.from_intervals([5], [3])
+        with self.assertRaises(OverflowError):
+            BitMap.from_intervals([5], [2**32 + 1])
+        self.assertEqual(BitMap.from_intervals([], []), BitMap())
+        self.assertEqual(BitMap().num_runs(), 0)
+
+
+class ArrowTest(Util):
+
+    def setUp(self):
+        try:
+            import pyarrow
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+        self.pyarrow = pyarrow
+
+    @given(bitmap_cls, hyp_collection)
+    def test_arrow(self, cls, values):
+        bitmap = cls(values)
+        arrow_array = bitmap.to_arrow()
+        self.assertEqual(arrow_array.type, self.pyarrow.uint32())
+        self.assertEqual(arrow_array.to_pylist(), list(bitmap))
+        self.assertEqual(cls.from_arrow(arrow_array), bitmap)
+        self.assertEqual(cls.from_arrow(arrow_array[len(arrow_array) // 2:]), bitmap[len(bitmap) // 2:])
+        chunked = self.pyarrow.chunked_array([arrow_array[:3], self.pyarrow.array([5, 2], self.pyarrow.uint32())])
+        self.assertEqual(cls.from_arrow(chunked), bitmap[:3] | cls([2, 5]))
+        self.assertEqual(cls.from_arrow(self.pyarrow.array([5, 2], self.pyarrow.int64())), cls([2, 5]))
+        self.assertIsInstance(cls.from_arrow(arrow_array), cls)
+
+    def test_arrow_null(self):
+        with self.assertRaises(ValueError):
+            BitMap.from_arrow(self.pyarrow.array([1, None], self.pyarrow.uint32()))
+
+    @given(bitmap_cls, hyp_many_collections, st.booleans())
+    def test_serialize_many(self, cls, collections, with_null):
+        bitmaps = [cls(values) for values in collections]
+        if with_null:
+            bitmaps.insert(len(bitmaps) // 2, None)
+        serialized = cls.serialize_many(bitmaps)
+        self.assertEqual(serialized.to_pylist(), [None if bm is None else bm.serialize() for bm in bitmaps])
+        self.assertEqual(cls.deserialize_many(serialized), bitmaps)
+        self.assertEqual(cls.deserialize_many(serialized[1:]), bitmaps[1:])
+        chunked = self.pyarrow.chunked_array([serialized, serialized])
+        self.assertEqual(cls.deserialize_many(chunked), bitmaps * 2)
+        for bm in cls.deserialize_many(serialized):
+            if bm is not None:
+                self.assertIsInstance(bm, cls)
+
+    def test_deserialize_many_errors(self):
+        with self.assertRaises(ValueError):
+            BitMap.deserialize_many(self.pyarrow.array([b'foo'], self.pyarrow.binary()))
+        with self.assertRaises(TypeError):
+            BitMap.deserialize_many(self.pyarrow.array([1, 2]))
+        large = self.pyarrow.array([BitMap([3, 12]).serialize()], self.pyarrow.large_binary())
+        self.assertEqual(BitMap.deserialize_many(large), [BitMap([3, 12])])
+
+
+class OpCacheTest(Util):
+
+    @given(hyp_collection, hyp_collection, st.booleans())
+    def test_operations(self, values1, values2, cow):
+        cache = OpCache()
+        bm1 = FrozenBitMap(values1, copy_on_write=cow)
+        bm2 = FrozenBitMap(values2, copy_on_write=cow)
+        for _ in range(2):
+            self.assertEqual(cache.union(bm1, bm2), bm1 | bm2)
+            self.assertEqual(cache.intersection(bm1, bm2), bm1 & bm2)
+            self.assertEqual(cache.difference(bm1, bm2), bm1 - bm2)
+            self.assertEqual(cache.difference(bm2, bm1), bm2 - bm1)
+            self.assertEqual(cache.symmetric_difference(bm1, bm2), bm1 ^ bm2)
+            self.assertEqual(cache.union_cardinality(bm1, bm2), len(bm1 | bm2))
+            self.assertEqual(cache.intersection_cardinality(bm1, bm2), len(bm1 & bm2))
+            self.assertEqual(cache.difference_cardinality(bm1, bm2), len(bm1 - bm2))
+            self.assertEqual(cache.symmetric_difference_cardinality(bm1, bm2), len(bm1 ^ bm2))
+            self.assertIsInstance(cache.union(bm1, bm2), FrozenBitMap)
+            self.assertEqual(cache.union(bm1, bm2).copy_on_write, cow)
+        stats = cache.stats()
+        n_misses = 8 if bm1 == bm2 else 9 # both differences are the same operation when the operands are equal
+        self.assertEqual(stats['misses'], n_misses)
+        self.assertEqual(stats['hits'], 22 - n_misses)
+        self.assertEqual(stats['n_entries'], len(cache))
+
+    @given(hyp_many_collections)
+    def test_multiway(self, collections):
+        cache = OpCache()
+        bitmaps = [FrozenBitMap(values) for values in collections]
+        self.assertEqual(cache.union(*bitmaps), BitMap.union(*bitmaps))
+        self.assertEqual(cache.intersection(*bitmaps), BitMap.intersection(*bitmaps))
+        copies = [FrozenBitMap(list(bm)) for bm in reversed(bitmaps)]
+        self.assertEqual(cache.union(*copies), BitMap.union(*bitmaps))
+        self.assertEqual(cache.intersection(*copies), BitMap.intersection(*bitmaps))
+        self.assertEqual(cache.stats()['hits'], 2)
+
+    def test_eviction(self):
+        bitmaps = [FrozenBitMap(range(i, 2**20, 3)) for i in range(3)]
+        cache = OpCache()
+        cache.union(bitmaps[0], bitmaps[1])
+        size = cache.stats()['n_bytes'] # the same for all the unions of two of these bitmaps
+        self.assertGreater(size, 3 * len(bitmaps[0].serialize())) # the operands and the result
+        cache = OpCache(max_bytes=int(size * 2.5))
+        cache.union(bitmaps[0], bitmaps[1])
+        cache.union(bitmaps[0], bitmaps[2])
+        cache.union(bitmaps[0], bitmaps[1])
+        cache.union(bitmaps[1], bitmaps[2])
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertLessEqual(stats['n_bytes'], cache.max_bytes)
+        cache.union(bitmaps[0], bitmaps[1])
+        self.assertEqual(cache.stats()['hits'], 2)
+        cache.union(bitmaps[0], bitmaps[2])
+        self.assertEqual(cache.stats()['misses'], 4)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()['n_bytes'], 0)
+
+    def test_errors(self):
+        cache = OpCache()
+        with self.assertRaises(TypeError):
+            cache.union(FrozenBitMap([1]), BitMap([2]))
+        with self.assertRaises(TypeError):
+            cache.intersection_cardinality(BitMap([1]), FrozenBitMap([2]))
+        with self.assertRaises(ValueError):
+            cache.union(FrozenBitMap([1]), FrozenBitMap([2], copy_on_write=True))
+
+
+class InternTest(Util):
+
+    @given(hyp_many_collections, st.booleans())
+    def test_intern(self, collections, cow):
+        pool = InternPool()
+        bitmaps = [FrozenBitMap(values, copy_on_write=cow) for values in collections]
+        canonicals = [pool.intern(bm) for bm in bitmaps]
+        copies = [pool.intern(FrozenBitMap(list(bm), copy_on_write=cow)) for bm in bitmaps]
+        distinct = set(bitmaps)
+        self.assertEqual(len(pool), len(distinct))
+        for bm, canonical, copy in zip(bitmaps, canonicals, copies):
+            self.assertEqual(bm, canonical)
+            self.assertIs(canonical, copy)
+        stats = pool.stats()
+        self.assertEqual(stats['misses'], len(distinct))
+        self.assertEqual(stats['hits'], 2 * len(bitmaps) - len(distinct))
+        self.assertEqual(stats['n_entries'], len(distinct))
+        self.assertGreater(stats['saved_bytes'], 0)
+
+    def test_weak_references(self):
+        pool = InternPool()
+        bm1 = pool.intern(FrozenBitMap([3, 12]))
+        bm2 = pool.intern(FrozenBitMap(range(100)))
+        self.assertEqual(len(pool), 2)
+        del bm1
+        self.assertEqual(len(pool), 1)
+        other = FrozenBitMap([3, 12])
+        self.assertIs(pool.intern(other), other)
+        self.assertIs(pool.intern(FrozenBitMap(range(100))), bm2)
+        del pool
+        del bm2 # the callback must not fail once the pool is gone
+
+    def test_copy_on_write(self):
+        pool = InternPool()
+        bm1 = pool.intern(FrozenBitMap([3, 12]))
+        bm2 = pool.intern(FrozenBitMap([3, 12], copy_on_write=True))
+        self.assertIsNot(bm1, bm2)
+        self.assertTrue(bm2.copy_on_write)
+
+    def test_errors(self):
+        with self.assertRaises(TypeError):
+            InternPool().intern(BitMap([3]))
+        with self.assertRaises(TypeError):
+            pyroaring.intern(None)
+
+    def test_default_pool(self):
+        bm = FrozenBitMap(range(12345, 12400))
+        self.assertIs(pyroaring.intern(FrozenBitMap(bm)), pyroaring.intern(bm))
+
+
+class IdDictionaryTest(Util):
+
+    keys = st.lists(st.text(max_size=3) | st.binary(max_size=3) | st.integers(min_value=-2**70, max_value=2**70) |
+                    st.uuids() | st.tuples(st.integers(), st.text(max_size=3)))
+
+    @given(keys, keys)
+    def test_encode_decode(self, keys1, keys2):
+        ids = IdDictionary(keys1)
+        encoded = ids.encode_many(iter(keys2))
+        self.assertEqual(len(ids), len(set(keys1) | set(keys2)))
+        self.assertEqual(sorted(set(ids.encode_many(keys1 + keys2))), list(range(len(ids))))
+        self.assertEqual(ids.decode_many(encoded), keys2)
+        self.assertEqual([ids.decode(identifier) for identifier in encoded], keys2)
+        self.assertEqual(set(ids.decode_bitmap(ids.encode_bitmap(keys2))), set(keys2))
+        self.assertEqual(ids.decode_bitmap(BitMap(range(len(ids)))), ids.keys())
+        for key in keys2:
+            self.assertIn(key, ids)
+            self.assertEqual(ids.decode(ids.encode(key, add=False)), key)
+
+    @given(keys)
+    def test_pickle(self, keys):
+        ids = IdDictionary(keys)
+        loaded = pickle.loads(pickle.dumps(ids))
+        self.assertEqual(loaded.keys(), ids.keys())
+        self.assertEqual(loaded.encode_many(keys, add=False), ids.encode_many(keys, add=False))
+
+    def test_key_types(self):
+        keys = [u'caf\xe9', u'\ud800', b'caf\xc3\xa9', 2**70, -3, True, 3.5, (1, u'foo'), None]
+        ids = IdDictionary(keys)
+        self.assertEqual(ids.keys(), keys)
+        self.assertEqual([type(key) for key in ids.keys()], [type(key) for key in keys])
+        self.assertEqual(ids.decode_bitmap(BitMap(range(len(keys)))), keys)
+
+    def test_unknown(self):
+        ids = IdDictionary(['foo'])
+        with self.assertRaises(KeyError):
+            ids.encode('bar', add=False)
+        with self.assertRaises(KeyError):
+            ids.encode_many(['foo', 'bar'], add=False)
+        with self.assertRaises(KeyError):
+            ids.decode(1)
+        with self.assertRaises(KeyError):
+            ids.decode_bitmap(BitMap([0, 1]))
+        with self.assertRaises(TypeError):
+            ids.encode(['unhashable'])
+
+
+class ConcurrentTest(Util):
+
+    @given(hyp_collection, hyp_collection, hyp_collection)
+    def test_snapshots(self, values1, values2, values3):
+        bm = ConcurrentBitMap(values1)
+        snapshot = bm.snapshot()
+        self.assertIsInstance(snapshot, FrozenBitMap)
+        self.assertTrue(snapshot.copy_on_write)
+        with bm.batch() as writer:
+            writer.update(values2)
+            self.assertIs(bm.snapshot(), snapshot)
+        bm.difference_update(values3)
+        self.compare_with_set(snapshot, set(values1))
+        self.compare_with_set(bm.snapshot(), (set(values1) | set(values2)) - set(values3))
+        self.assertEqual(bm.version, 3)
+        self.assertEqual(len(bm), len(bm.snapshot()))
+        self.assertEqual(list(bm), list(bm.snapshot()))
+
+    @given(hyp_collection, hyp_collection, hyp_collection)
+    def test_plain_operands(self, values1, values2, values3):
+        bm = ConcurrentBitMap(values1)
+        bm.update(BitMap(values2), FrozenBitMap(values3, copy_on_write=True))
+        bm.difference_update(BitMap(values3))
+        expected = (set(values1) | set(values2)) - set(values3)
+        self.compare_with_set(bm.snapshot(), expected)
+        plain = bm.snapshot(copy_on_write=False)
+        self.assertFalse(plain.copy_on_write)
+        self.assertEqual(plain, FrozenBitMap(expected))
+        self.compare_with_set(plain | BitMap(values2), expected | set(values2))
+        bm.update(values2) # the containers of the copy are not shared with the private bitmap
+        bm.difference_update(values1)
+        self.compare_with_set(plain, expected)
+
+    def test_failed_batch(self):
+        bm = ConcurrentBitMap([3, 12])
+        with self.assertRaises(ZeroDivisionError):
+            with bm.batch() as writer:
+                writer.add(5)
+                writer.discard(12)
+                1 / 0
+        self.assertEqual(bm.version, 1)
+        self.assertEqual(list(bm.snapshot()), [3, 12])
+        with bm.batch() as writer:
+            writer.add(18)
+        self.assertEqual(list(bm.snapshot()), [3, 12, 18])
+
+    def test_threads(self):
+        bm = ConcurrentBitMap()
+        n_batches, batch_size = 200, 1000
+        errors = []
+
+        def write():
+            for i in range(n_batches):
+                with bm.batch() as writer:
+                    for value in range(i * batch_size, (i + 1) * batch_size):
+                        writer.add(value * 7)
+                bm.discard(i * batch_size * 7)
+
+        def read():
+            while bm.version <= n_batches * 2:
+                snapshot = bm.snapshot()
+                n = len(snapshot)
+                values = list(snapshot)
+                if len(values) != n or values != sorted(values):
+                    errors.append(n)
+
+        threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(bm), n_batches * (batch_size - 1))
+        self.assertNotIn(0, bm)
+        self.assertIn(7, bm)
+
+
+class DeltaTest(Util):
+
+    @given(hyp_collection, hyp_collection, hyp_collection, st.booleans(), bitmap_cls)
+    def test_diff_apply(self, values, added, removed, cow, cls):
+        old = cls(values, copy_on_write=cow)
+        new = cls((set(values) | set(added)) - set(removed), copy_on_write=cow)
+        delta = diff(old, new)
+        self.assertEqual(delta.copy_on_write, cow)
+        self.assertEqual(old, cls(values, copy_on_write=cow))
+        self.assertTrue(delta.added <= new - old)
+        self.assertTrue(delta.removed <= old - new)
+        for loaded in [delta, BitMapDelta.deserialize(delta.serialize(), copy_on_write=cow),
+                       pickle.loads(pickle.dumps(delta))]:
+            bitmap = BitMap(values, copy_on_write=cow)
+            apply_delta(bitmap, loaded)
+            self.assertEqual(bitmap, new)
+
+    def test_replaced_containers(self):
+        old = BitMap(range(0, 2**20, 2))
+        new = BitMap(old)
+        new.flip_inplace(2**16, 2**17)
+        new.add(2**18 + 1)
+        new -= BitMap(range(2**19, 2**19 + 2**16))
+        delta = diff(old, new)
+        self.assertEqual(delta.replaced_keys, FrozenBitMap([1, 8]))
+        self.assertEqual(delta.replaced, FrozenBitMap(range(2**16 + 1, 2**17, 2)))
+        self.assertEqual(delta.added, FrozenBitMap([2**18 + 1]))
+        self.assertEqual(len(delta.removed), 0)
+        apply_delta(old, delta)
+        self.assertEqual(old, new)
+
+    def test_invalid(self):
+        serialization = diff(BitMap([3, 5]), BitMap([3, 12])).serialize()
+        for invalid in [b'', serialization[:20], serialization + b'\0', serialization[:16] + b'\0' * 100]:
+            with self.assertRaises(ValueError):
+                BitMapDelta.deserialize(invalid)
+        empty = FrozenBitMap().serialize()
+        unsorted = BitMap([3, 5]).serialize()
+        unsorted = unsorted[:-4] + unsorted[-2:] + unsorted[-4:-2] # the values of the array container are swapped
+        two_keys = BitMap([3, 2**16 + 3]).serialize()
+        duplicate_keys = two_keys[:12] + two_keys[8:10] + two_keys[14:] # the second key is replaced by the first one
+        for part in [unsorted, duplicate_keys]:
+            self.assertEqual(len(part), len(BitMap.deserialize(part).serialize())) # accepted by CRoaring
+            with self.assertRaises(ValueError):
+                BitMapDelta.deserialize(struct.pack('<4I', len(part), len(empty), len(empty), len(empty)) + part +
+                                        empty * 3)
+        with self.assertRaises(ValueError):
+            diff(BitMap([3]), BitMap([3], copy_on_write=True))
+        with self.assertRaises(ValueError):
+            apply_delta(BitMap([3], copy_on_write=True), diff(BitMap([3]), BitMap([5])))
+
+
+class ArenaTest(Util):
+
+    small_collection = st.lists(uint32, max_size=20)
+
+    @given(st.lists(small_collection | hyp_collection, max_size=20), st.integers(min_value=0, max_value=30),
+           st.booleans())
+    def test_entries(self, collections, max_small_size, cow):
+        arena = BitMapArena(collections, max_small_size=max_small_size, copy_on_write=cow)
+        self.assertEqual(len(arena), len(collections))
+        for i, values in enumerate(collections):
+            expected = set(values)
+            self.compare_with_set(arena[i], expected)
+            self.assertIsInstance(arena[i], FrozenBitMap)
+            self.assertEqual(arena[i].copy_on_write, cow)
+            self.assertEqual(list(arena.to_array(i)), sorted(expected))
+            self.assertEqual(arena.cardinality(i), len(expected))
+            for value in list(expected)[:10]:
+                self.assertTrue(arena.contains(i, value))
+            self.assertEqual(arena.contains(i, 2**32 - 1), 2**32 - 1 in expected)
+        stats = arena.get_statistics()
+        self.assertEqual(stats['n_entries'], len(collections))
+        self.assertEqual(stats['n_large_entries'], len([values for values in collections
+                                                        if len(set(values)) > max_small_size]))
+        loaded = pickle.loads(pickle.dumps(arena))
+        self.assertEqual(len(loaded), len(arena))
+        for i in range(len(arena)):
+            self.assertEqual(loaded[i], arena[i])
+            self.assertEqual(loaded[i].copy_on_write, cow)
+
+    def test_append_non_contiguous(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest('numpy is not installed')
+        values = numpy.arange(100, dtype=numpy.uint32)
+        arena = BitMapArena(max_small_size=10)
+        for view in [values[:20:2], values[::-1], values[::-7]]:
+            index = arena.append(view)
+            self.compare_with_set(arena[index], set(view.tolist()))
+
+    @given(st.lists(small_collection | hyp_collection, min_size=1, max_size=20), st.data(), st.booleans())
+    def test_set_operations(self, collections, data, cow):
+        arena = BitMapArena(collections, max_small_size=10, copy_on_write=cow)
+        indices = data.draw(st.lists(st.integers(min_value=-len(collections), max_value=len(collections) - 1)))
+        union = set()
+        for values in collections:
+            union |= set(values)
+        self.compare_with_set(arena.union(), union)
+        self.assertEqual(arena.union(cls=FrozenBitMap).copy_on_write, cow)
+        expected = BitMap(copy_on_write=cow)
+        for i in indices:
+            expected |= arena[i]
+        self.assertEqual(arena.union(indices), expected)
+        if indices:
+            expected = BitMap.intersection(*[arena[i] for i in indices])
+            self.assertEqual(arena.intersection(indices, FrozenBitMap), expected)
+        else:
+            self.assertEqual(len(arena.intersection(indices)), 0)
+
+    def test_wrong_index(self):
+        arena = BitMapArena([[3]])
+        for operation in [lambda: arena[1], lambda: arena[-2], lambda: arena.cardinality(5),
+                          lambda: arena.union([0, 1]), lambda: arena.intersection([2])]:
+            with self.assertRaises(IndexError):
+                operation()
+        with self.assertRaises(ValueError):
+            arena.append(BitMap([3], copy_on_write=True))
+
+
+class WindowedTest(Util):
+
+    @given(st.integers(min_value=1, max_value=5),
+           st.lists(st.one_of(st.just(None), st.lists(st.integers(min_value=0, max_value=50))), max_size=30),
+           st.booleans())
+    def test_window(self, n_slots, operations, cow):
+        """Compare with the union of the last n_slots sets, an operation being either an update or advance()."""
+        windowed = WindowedBitMap(n_slots, copy_on_write=cow)
+        history = [set()]
+        for values in operations:
+            if values is None:
+                expired = windowed.advance()
+                history.append(set())
+                seen = set().union(*history[-n_slots:])
+                self.assertEqual(expired, FrozenBitMap(history[-n_slots - 1] - seen if len(history) > n_slots else [],
+                                                       copy_on_write=cow))
+            elif len(values) == 1:
+                windowed.add(values[0])
+                history[-1].update(values)
+            else:
+                windowed.update(values)
+                history[-1].update(values)
+            window = set().union(*history[-n_slots:])
+            self.compare_with_set(windowed.window(), window)
+            self.assertEqual(len(windowed), len(window))
+            self.assertEqual(windowed.current_slot, len(history) - 1)
+        for value in range(51):
+            last_seen = max([i for i, values in enumerate(history) if value in values] or [None])
+            expected = last_seen if last_seen is not None and last_seen > len(history) - 1 - n_slots else None
+            self.assertEqual(windowed.last_seen(value), expected)
+            self.assertEqual(value in windowed, expected is not None)
+        loaded = pickle.loads(pickle.dumps(windowed))
+        self.assertEqual(loaded.window(), windowed.window())
+        self.assertEqual(loaded.current_slot, windowed.current_slot)
+        for value in range(51):
+            self.assertEqual(loaded.last_seen(value), windowed.last_seen(value))
+        loaded.advance()
+        self.assertEqual(loaded.window().copy_on_write, cow)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            WindowedBitMap(0)
+
+    @given(st.booleans())
+    def test_other_copy_on_write(self, cow):
+        windowed = WindowedBitMap(3, copy_on_write=cow)
+        windowed.update(BitMap([3, 12], copy_on_write=not cow))
+        windowed.advance()
+        windowed.update(FrozenBitMap([12, 15], copy_on_write=not cow))
+        self.assertEqual(windowed.window(), FrozenBitMap([3, 12, 15], copy_on_write=cow))
+        self.assertEqual([windowed.last_seen(value) for value in [3, 12, 15]], [0, 1, 1])
+
+
+class AllocatorTest(unittest.TestCase):
+
+    def test_allocated_bytes(self):
+        before = pyroaring.allocated_bytes(), pyroaring.allocated_blocks()
+        bm = BitMap(range(0, 2**20, 2))
+        self.assertGreaterEqual(pyroaring.allocated_bytes() - before[0], 2**17)
+        self.assertGreater(pyroaring.allocated_blocks(), before[1])
+        self.assertEqual(BitMap.deserialize(bm.serialize()), bm)
+        del bm
+        self.assertEqual((pyroaring.allocated_bytes(), pyroaring.allocated_blocks()), before)
+
+    def test_realloc(self):
+        before = pyroaring.allocated_bytes(), pyroaring.allocated_blocks()
+        bm = BitMap(range(0, 2**18, 64))
+        try:
+            pyroaring.set_allocator('pymem')
+        except ValueError:
+            pass
+        try:
+            for value in range(1, 2**18, 64): # the array containers grow, with the allocator which allocated them
+                bm.add(value)
+            bm.shrink_to_fit()
+        finally:
+            pyroaring.set_allocator('malloc')
+        self.assertEqual(bm, BitMap(range(0, 2**18, 64)) | BitMap(range(1, 2**18, 64)))
+        del bm
+        self.assertEqual((pyroaring.allocated_bytes(), pyroaring.allocated_blocks()), before)
+
+    def test_pymem(self):
+        try:
+            import tracemalloc
+        except ImportError:
+            self.skipTest('tracemalloc is not available')
+        bm = BitMap(range(0, 2**20, 3))
+        pyroaring.set_allocator('pymem')
+        try:
+            self.assertEqual(pyroaring.get_allocator(), 'pymem')
+            tracemalloc.start()
+            try:
+                other = BitMap(range(0, 2**20, 2))
+                self.assertGreaterEqual(tracemalloc.get_traced_memory()[0], 2**17)
+                other |= bm
+                bm &= other # releases blocks of both allocators
+            finally:
+                tracemalloc.stop()
+        finally:
+            pyroaring.set_allocator('malloc')
+        self.assertEqual(pyroaring.get_allocator(), 'malloc')
+        self.assertEqual(bm, BitMap(range(0, 2**20, 3)))
+        with self.assertRaises(ValueError):
+            pyroaring.set_allocator('foo')
+
+    def test_memory_limit(self):
+        bm1 = BitMap(range(0, 2**20, 2))
+        bm2 = BitMap(range(1, 2**20, 2))
+        self.assertIsNone(pyroaring.get_memory_limit())
+        pyroaring.set_memory_limit(pyroaring.allocated_bytes() + 2**17)
+        try:
+            for operation in [lambda: bm1 | bm2, lambda: bm1 ^ bm2, lambda: BitMap.union(bm1, bm2),
+                              lambda: bm1.__ior__(bm2), lambda: bm1.__ior__(array.array('I', bm2)),
+                              lambda: BitMap.from_array(array.array('I', bm2), workers=2),
+                              lambda: BitMap.intersection(bm1, bm2), lambda: BitMap(bm1)]:
+                with self.assertRaises(MemoryError):
+                    operation()
+            self.assertEqual(bm1, BitMap(range(0, 2**20, 2)))
+            self.assertEqual(len(BitMap([3]) | BitMap([12])), 2)
+        finally:
+            pyroaring.set_memory_limit(None)
+        self.assertEqual(len(bm1 | bm2), 2**20)
+        with self.assertRaises(ValueError):
+            pyroaring.set_memory_limit(0)
+
+    def test_memory_limit_in_memory_size(self):
+        bm = BitMap(range(0, 2**28, 2**16)) # a single value per container: the containers are larger in memory
+        pyroaring.set_memory_limit(pyroaring.allocated_bytes() + len(bm.serialize()))
+        try:
+            for operation in [lambda: BitMap(bm), lambda: bm | bm, lambda: BitMap.union(bm, bm)]:
+                with self.assertRaises(MemoryError):
+                    operation()
+        finally:
+            pyroaring.set_memory_limit(None)
+
+
+class ProfilingTest(Util):
+
+    def setUp(self):
+        pyroaring.profiling.reset()
+        pyroaring.profiling.enable()
+
+    def tearDown(self):
+        pyroaring.profiling.disable()
+        pyroaring.profiling.set_hook(None)
+        pyroaring.profiling.reset()
+
+    @given(bitmap_cls, hyp_collection, hyp_collection)
+    def test_binary_operations(self, cls, values1, values2):
+        pyroaring.profiling.reset()
+        bm1 = cls(values1)
+        bm2 = cls(values2)
+        results = {'or': bm1 | bm2, 'and': bm1 & bm2, 'xor': bm1 ^ bm2, 'andnot': bm1 - bm2}
+        snapshot = pyroaring.profiling.snapshot()
+        self.assertEqual(set(snapshot), set(results))
+        for name, result in results.items():
+            record = snapshot[name]
+            self.assertEqual(record['calls'], 1)
+            self.assertEqual(record['input_cardinality'], len(bm1) + len(bm2))
+            self.assertEqual(record['output_cardinality'], len(result))
+            self.assertGreater(record['bytes'], 0)
+            self.assertGreaterEqual(record['time'], 0)
+
+    @given(hyp_collection, hyp_collection)
+    def test_inplace_operations(self, values1, values2):
+        pyroaring.profiling.reset()
+        bm1 = BitMap(values1)
+        bm2 = BitMap(values2)
+        bm1 |= bm2
+        bm1 -= bm2
+        snapshot = pyroaring.profiling.snapshot()
+        self.assertEqual(snapshot['or_inplace']['output_cardinality'], len(BitMap(values1) | bm2))
+        self.assertEqual(snapshot['andnot_inplace']['output_cardinality'], len(bm1))
+
+    def test_allocated_bytes(self):
+        bm1 = BitMap(range(0, 10**6, 2))
+        bm2 = BitMap(range(1, 10**6, 2))
+        before = pyroaring.allocated_bytes()
+        result = bm1 | bm2
+        kept = pyroaring.allocated_bytes() - before
+        bm1 &= bm2 # the containers of bm1 are replaced
+        snapshot = pyroaring.profiling.snapshot()
+        self.assertGreaterEqual(snapshot['or']['bytes'], kept)
+        self.assertLess(snapshot['or']['bytes'], 2 * kept)
+        self.assertGreater(snapshot['and_inplace']['bytes'], 0)
+
+    def test_inplace_operations_with_values(self):
+        bitmap = BitMap(range(10))
+        bitmap |= [20, 30]
+        bitmap &= range(5, 25)
+        bitmap -= [5]
+        snapshot = pyroaring.profiling.snapshot()
+        self.assertEqual(snapshot['or_inplace']['output_cardinality'], 12)
+        self.assertEqual(snapshot['and_inplace']['output_cardinality'], 6)
+        self.assertEqual(snapshot['andnot_inplace']['output_cardinality'], 5)
+
+    def test_other_operations(self):
+        bitmaps = [BitMap(range(i, 1000, 3)) for i in range(3)]
+        BitMap.union(*bitmaps)
+        BitMap.intersection(*bitmaps)
+        data = bitmaps[0].serialize()
+        BitMap.deserialize(data)
+        bitmaps[0][10:20:3]
+        snapshot = pyroaring.profiling.snapshot()
+        self.assertEqual(snapshot['union']['output_cardinality'], 1000)
+        self.assertEqual(snapshot['union']['input_cardinality'], 1000)
+        self.assertEqual(snapshot['intersection']['output_cardinality'], 0)
+        self.assertEqual(snapshot['serialize']['bytes'], len(data))
+        self.assertEqual(snapshot['deserialize']['output_cardinality'], len(bitmaps[0]))
+        self.assertEqual(snapshot['get_slice']['output_cardinality'], 4)
+        for record in snapshot.values():
+            self.assertGreaterEqual(record['calls'], 1)
+
+    def test_failing_hook(self):
+        def hook(*args):
+            raise KeyError(args[0])
+        bm1, bm2 = BitMap(range(0, 1000, 2)), BitMap(range(1, 1000, 2))
+        pyroaring.profiling.set_hook(hook)
+        allocated = pyroaring.allocated_bytes()
+        for operation in [lambda: bm1 | bm2, lambda: BitMap.union(bm1, bm2), lambda: bm1.serialize()]:
+            with self.assertRaises(KeyError):
+                operation()
+        self.assertEqual(pyroaring.allocated_bytes(), allocated)
+
+    def test_hook_and_disable(self):
+        calls = []
+        pyroaring.profiling.set_hook(lambda *args: calls.append(args))
+        BitMap([1, 2]) & BitMap([2, 3])
+        self.assertEqual(len(calls), 1)
+        name, duration, input_cardinality, output_cardinality, n_bytes = calls[0]
+        self.assertEqual((name, input_cardinality, output_cardinality), ('and', 4, 1))
+        pyroaring.profiling.disable()
+        self.assertFalse(pyroaring.profiling.enabled)
+        BitMap([1, 2]) & BitMap([2, 3])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(pyroaring.profiling.snapshot()['and']['calls'], 1)
+        pyroaring.profiling.reset()
+        self.assertEqual(pyroaring.profiling.snapshot(), {})
+        with self.assertRaises(TypeError):
+            pyroaring.profiling.set_hook(42)
+
+
 class FlipTest(Util):
 
     def check_flip(self, bm_before, bm_after, start, end):
@@ -749,6 +1905,58 @@ class FrozenTest(unittest.TestCase):
         self.assertEqual(hash(bm1), hash(bm2))
 
 
+    def test_hash_collisions(self):
+        bitmaps = [FrozenBitMap(range(i, i+100)) for i in range(1000)]
+        bitmaps += [FrozenBitMap(range(0, 2**20, i)) for i in range(1, 1000)]
+        bitmaps += [FrozenBitMap([i] + list(range(100, 200))) for i in range(100)]
+        bitmaps += [FrozenBitMap([2**16 * i]) for i in range(2**16)]
+        self.assertEqual(len(set(hash(bm) for bm in bitmaps)), len(bitmaps))
+
+    @given(hyp_collection, st.sampled_from([BitMap.run_optimize, BitMap.shrink_to_fit]))
+    def test_hash_container_types(self, values, func):
+        """The hash does not depend on the type of the containers (bitset, array or run)."""
+        bitmap = BitMap(values, optimize=False)
+        other = BitMap(values, optimize=False)
+        func(other)
+        bitmap.flip_inplace(0, 2**20)
+        bitmap.flip_inplace(0, 2**20)
+        self.assertEqual(hash(FrozenBitMap(bitmap, optimize=False)), hash(FrozenBitMap(other, optimize=False)))
+        self.assertEqual(hash(FrozenBitMap(bitmap, optimize=False)), hash(FrozenBitMap(values)))
+
+    @given(hyp_collection, uint32)
+    def test_hash_after_copy(self, values, number):
+        """The cached hash of a frozen bitmap must not survive a modification of a mutable copy."""
+        frozen = FrozenBitMap(values)
+        hash(frozen)
+        bitmap = BitMap(frozen)
+        bitmap ^= BitMap([number])
+        other = FrozenBitMap(bitmap)
+        self.assertNotEqual(frozen, other)
+        self.assertEqual(hash(other), hash(FrozenBitMap(bitmap.to_array())))
+        self.assertEqual(FrozenBitMap(frozen), frozen)
+        self.assertEqual(hash(FrozenBitMap(frozen)), hash(frozen))
+
+    @given(hyp_collection, st.booleans())
+    def test_rank_index(self, values, cow):
+        """The positional accesses of a frozen bitmap use an index of its containers, built on the first access."""
+        bitmap = BitMap(values, copy_on_write=cow)
+        bitmap.update(range(2**17, 2**17 + 5000)) # run container
+        bitmap.update(range(2**18, 2**18 + 20000, 3)) # bitset container
+        frozen = FrozenBitMap(bitmap)
+        expected = list(bitmap)
+        self.assertEqual(len(frozen), len(expected))
+        for i in range(0, len(expected), max(1, len(expected) // 500)):
+            self.assertEqual(frozen[i], expected[i])
+            self.assertEqual(frozen[i - len(expected)], expected[i])
+            self.assertEqual(frozen.rank(expected[i]), i + 1)
+            next_value = min(expected[i] + 1, 2**32 - 1)
+            self.assertEqual(frozen.rank(next_value), bitmap.rank(next_value))
+        for value in [0, 2**16, 2**17 - 1, 2**18 + 20000, 2**32 - 1]:
+            self.assertEqual(frozen.rank(value), bitmap.rank(value))
+        self.assertEqual(list(frozen[10:-10:7]), expected[10:-10:7])
+        with self.assertRaises(IndexError):
+            frozen[len(expected)]
+
 class OptimizationTest(unittest.TestCase):
 
     @given(bitmap_cls)
@@ -782,6 +1990,158 @@ class OptimizationTest(unittest.TestCase):
         self.assertEqual(bm3.shrink_to_fit(), 0)
 
 
+class BuilderTest(Util):
+
+    @given(bitmap_cls, hyp_collection, st.booleans())
+    def test_sorted_values(self, cls, values, cow):
+        builder = BitMapBuilder(copy_on_write=cow)
+        for value in sorted(values):
+            builder.add(value)
+        bitmap = builder.finish(cls)
+        self.assertIsInstance(bitmap, cls)
+        self.compare_with_set(bitmap, set(values))
+        self.assertEqual(bitmap.get_statistics(), cls(values).get_statistics())
+        self.assertEqual(bitmap.shrink_to_fit(), 0)
+
+    @given(hyp_many_collections, st.booleans())
+    def test_unsorted_values(self, all_values, cow):
+        builder = BitMapBuilder(copy_on_write=cow)
+        expected_set = set()
+        for values in all_values:
+            builder.add_many(values)
+            expected_set |= set(values)
+        bitmap = builder.finish()
+        self.compare_with_set(bitmap, expected_set)
+        self.assertEqual(bitmap.get_statistics(), BitMap(expected_set, copy_on_write=cow).get_statistics())
+
+    @given(st.lists(st.tuples(uint32, st.integers(min_value=0, max_value=2**18))), st.booleans())
+    def test_ranges(self, ranges, cow):
+        builder = BitMapBuilder(copy_on_write=cow)
+        expected = BitMap(copy_on_write=cow)
+        for start, size in ranges:
+            stop = min(start + size, 2**32)
+            builder.add_range(start, stop)
+            expected |= BitMap(range(start, stop), copy_on_write=cow)
+        self.assertEqual(builder.finish(), expected)
+
+    @given(hyp_collection, hyp_collection)
+    def test_reuse(self, values1, values2):
+        builder = BitMapBuilder()
+        builder.add_many(values1)
+        self.assertEqual(builder.finish(), BitMap(values1))
+        builder.add_many(values2)
+        self.assertEqual(builder.finish(), BitMap(values2))
+
+    def test_incompatible_bitmap(self):
+        builder = BitMapBuilder(copy_on_write=True)
+        with self.assertRaises(ValueError):
+            builder.add_many(BitMap([1, 2]))
+
+
+class AccumulatorTest(Util):
+
+    @given(hyp_many_collections, st.booleans(), bitmap_cls)
+    def test_union(self, collections, cow, cls):
+        bitmaps = [BitMap(values, copy_on_write=cow) for values in collections]
+        acc = UnionAccumulator(copy_on_write=cow)
+        expected = BitMap(copy_on_write=cow)
+        for bm in bitmaps:
+            acc.add(bm)
+            expected |= bm
+            self.assertEqual(len(acc), len(expected))
+        result = acc.finish(cls)
+        self.assertIsInstance(result, cls)
+        self.assertEqual(result, expected)
+        self.assertEqual(result.copy_on_write, cow)
+        self.assertEqual(len(acc), 0)
+        self.assertEqual(bitmaps, [BitMap(values, copy_on_write=cow) for values in collections])
+
+    @given(hyp_many_collections, st.booleans())
+    def test_symmetric_difference(self, collections, cow):
+        bitmaps = [BitMap(values, copy_on_write=cow) for values in collections]
+        acc = SymmetricDifferenceAccumulator(copy_on_write=cow)
+        acc.update(*bitmaps)
+        expected = BitMap(copy_on_write=cow)
+        for bm in bitmaps:
+            expected ^= bm
+        self.assertEqual(len(acc), len(expected))
+        self.assertEqual(acc.finish(), expected)
+
+    @given(hyp_collection, hyp_many_collections, st.booleans())
+    def test_lazy_update(self, values, collections, cow):
+        bitmap = BitMap(values, copy_on_write=cow)
+        bitmaps = [BitMap(other, copy_on_write=cow) for other in collections]
+        expected = BitMap.union(bitmap, *bitmaps)
+        bitmap.lazy_update(*(bitmaps + [bitmap]))
+        self.assertEqual(bitmap, expected)
+        self.assertEqual(bitmap.get_statistics(), BitMap(bitmap, optimize=False).get_statistics())
+
+    def test_incompatible(self):
+        with self.assertRaises(ValueError):
+            UnionAccumulator().add(BitMap([3], copy_on_write=True))
+        bitmap = BitMap([3])
+        with self.assertRaises(ValueError):
+            bitmap.lazy_update(BitMap([4]), BitMap([5], copy_on_write=True))
+        self.assertEqual(bitmap, BitMap([3]))
+
+
+class CountingTest(Util):
+
+    @given(st.lists(hyp_collection, min_size=1, max_size=10), st.booleans(), bitmap_cls)
+    def test_counts(self, collections, cow, cls):
+        bitmaps = [BitMap(values, copy_on_write=cow) for values in collections]
+        counter = CountingBitMap(bitmaps)
+        self.assertEqual(counter.n_bitmaps, len(bitmaps))
+        counts = {}
+        for bm in bitmaps:
+            for value in bm:
+                counts[value] = counts.get(value, 0) + 1
+        for k in range(1, len(bitmaps) + 2):
+            result = counter.at_least(k, cls)
+            self.assertIsInstance(result, cls)
+            self.compare_with_set(result, {value for value, count in counts.items() if count >= k})
+        self.assertEqual(list(counter.counts()), [counts[value] for value in sorted(counts)])
+        for value in list(counts)[:100]:
+            self.assertEqual(counter.count(value), counts[value])
+
+    def test_many_bitmaps(self):
+        counter = CountingBitMap()
+        for i in range(300):
+            counter.add(BitMap(range(i, 1000)))
+        self.assertEqual(counter.count(5), 6)
+        self.assertEqual(counter.count(999), 300)
+        self.assertEqual(counter.count(1000), 0)
+        self.assertEqual(counter.at_least(300), BitMap(range(299, 1000)))
+        self.assertEqual(counter.at_least(257), BitMap(range(256, 1000)))
+        self.assertEqual(len(counter.at_least(301)), 0)
+
+    def test_wrong_threshold(self):
+        with self.assertRaises(ValueError):
+            CountingBitMap().at_least(0)
+
+
+class AutoOptimizeTest(unittest.TestCase):
+
+    def test_auto_optimize(self):
+        bm = BitMap()
+        self.assertEqual(bm.auto_optimize, 0)
+        bm.auto_optimize = 100
+        for i in range(99):
+            bm.add(i)
+        self.assertEqual(bm.get_statistics()['n_array_containers'], 1)
+        bm.add(99)
+        self.assertEqual(bm.get_statistics()['n_run_containers'], 1)
+        self.assertEqual(bm.shrink_to_fit(), 0)
+        bm |= BitMap(range(100, 200, 2))
+        self.assertEqual(bm, BitMap(list(range(100)) + list(range(100, 200, 2))))
+
+    def test_disabled(self):
+        bm = BitMap()
+        for i in range(1000):
+            bm.add(i)
+        self.assertEqual(bm.get_statistics()['n_run_containers'], 0)
+
+
 class VersionTest(unittest.TestCase):
     def assert_regex(self, pattern, text):
         matches = re.findall(pattern, text)
@@ -796,5 +2156,88 @@ class VersionTest(unittest.TestCase):
                           pyroaring.__croaring_git_version__)
 
 
+class SimdTest(unittest.TestCase):
+
+    def test_simd_level(self):
+        self.assertIn(pyroaring.simd_level(), ('avx2', 'sse4.2', 'scalar'))
+        self.assertIsInstance(pyroaring.simd_level(), str)
+
+
+class CythonApiTest(unittest.TestCase):
+
+    def test_get_include(self):
+        directory = pyroaring.get_include()
+        for filename in ['pyroaring.pxd', 'croaring.pxd', 'roaring.h', 'allocator.h']:
+            self.assertTrue(os.path.isfile(os.path.join(directory, filename)), filename)
+
+    extension_source = '''# distutils: language = c++
+from libc.stdint cimport uint32_t
+cimport croaring
+from pyroaring cimport AbstractBitMap, bitmap_from_ptr, bitmap_create, bitmap_add, bitmap_contains
+import pyroaring
+
+def build(values):
+    cdef croaring.roaring_bitmap_t *ptr = bitmap_create()
+    cdef uint32_t value
+    for value in values:
+        bitmap_add(ptr, value)
+    return bitmap_from_ptr(pyroaring.FrozenBitMap, ptr)
+
+def count_in(AbstractBitMap bitmap, uint32_t n):
+    cdef uint32_t i, count = 0
+    with nogil:
+        for i in range(n):
+            count += bitmap_contains(bitmap._c_bitmap, i)
+    return count
+'''
+
+    extension_setup = '''
+import sys
+from setuptools import setup
+from setuptools.extension import Extension
+from Cython.Build import cythonize
+include = sys.argv.pop()
+extension = Extension('pyroaring_user', ['pyroaring_user.pyx'], include_dirs=[include])
+setup(ext_modules=cythonize(extension, include_path=[include], compiler_directives={'language_level': 2}))
+'''
+
+    def test_extension(self):
+        try:
+            import Cython
+            from distutils import ccompiler, sysconfig, spawn
+        except ImportError:
+            self.skipTest('Cython is not installed')
+        compiler = ccompiler.new_compiler()
+        sysconfig.customize_compiler(compiler)
+        if not hasattr(compiler, 'compiler_so') or spawn.find_executable(compiler.compiler_so[0]) is None:
+            self.skipTest('no C compiler available')
+        import tempfile
+        import shutil
+        import subprocess
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, 'pyroaring_user.pyx'), 'w') as f:
+                f.write(self.extension_source)
+            with open(os.path.join(directory, 'setup.py'), 'w') as f:
+                f.write(self.extension_setup)
+            env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(pyroaring.__file__)))
+            process = subprocess.Popen([sys.executable, 'setup.py', 'build_ext', '--inplace', pyroaring.get_include()],
+                                       cwd=directory, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            output = process.communicate()[0]
+            self.assertEqual(process.returncode, 0, output)
+            sys.path.insert(0, directory)
+            try:
+                import pyroaring_user
+            finally:
+                sys.path.remove(directory)
+            bitmap = pyroaring_user.build([3, 12, 70000])
+            self.assertIsInstance(bitmap, FrozenBitMap)
+            self.assertEqual(bitmap, FrozenBitMap([3, 12, 70000]))
+            self.assertEqual(pyroaring_user.count_in(bitmap, 100), 2)
+            self.assertEqual(pyroaring_user.count_in(BitMap(range(50)), 100), 50)
+        finally:
+            shutil.rmtree(directory)
+
+
 if __name__ == "__main__":
     unittest.main()